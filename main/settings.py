@@ -76,12 +76,75 @@ WSGI_APPLICATION = 'main.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DATABASE_PROFILE picks the database: 'sqlite' (default) or 'postgres'.
+#
+# SQLite runs in WAL mode so readers never block the writer (switched on by
+# a migration, since the mode is kept in the database file), waits up to
+# SQLITE_BUSY_TIMEOUT ms for the write lock instead of failing with
+# "database is locked", and starts write transactions IMMEDIATE so two
+# purchases can't deadlock upgrading their read locks.
+#
+# PostgreSQL is configured from POSTGRES_* variables. POSTGRES_POOL_SIZE
+# turns on psycopg's connection pool; otherwise connections persist for
+# CONN_MAX_AGE seconds. POSTGRES_REPLICA_HOST adds a read replica that the
+# listing views read from (see uapfy.routers).
+
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'sqlite')
+
+if DATABASE_PROFILE == 'postgres':
+    POSTGRES_DATABASE = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('POSTGRES_DB', 'uapfy'),
+        'USER': os.environ.get('POSTGRES_USER', 'uapfy'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    }
+    if os.environ.get('POSTGRES_POOL_SIZE'):
+        # Pooled connections are returned after each request; Django
+        # doesn't allow CONN_MAX_AGE together with a pool.
+        POSTGRES_DATABASE['CONN_MAX_AGE'] = 0
+        POSTGRES_DATABASE['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('POSTGRES_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ['POSTGRES_POOL_SIZE']),
+            'timeout': int(os.environ.get('POSTGRES_POOL_TIMEOUT', 10)),
+        }
+    else:
+        POSTGRES_DATABASE['CONN_MAX_AGE'] = int(os.environ.get('CONN_MAX_AGE', 60))
+
+    DATABASES = {'default': POSTGRES_DATABASE}
+    if os.environ.get('POSTGRES_REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **POSTGRES_DATABASE,
+            'OPTIONS': {**POSTGRES_DATABASE['OPTIONS']},
+            'HOST': os.environ['POSTGRES_REPLICA_HOST'],
+            'PORT': os.environ.get('POSTGRES_REPLICA_PORT', POSTGRES_DATABASE['PORT']),
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': (
+                    f"PRAGMA busy_timeout={int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))};"
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA mmap_size=134217728;'
+                    'PRAGMA cache_size=-20000;'
+                    'PRAGMA temp_store=MEMORY'
+                ),
+            },
+            # A file, not the shared in-memory default, so tests that buy from
+            # several threads get SQLite's real locking (busy_timeout, WAL).
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
     }
-}
+
+DATABASE_ROUTERS = ['uapfy.routers.ReplicaRouter']
 
 
 # Password validation
@@ -131,3 +194,92 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'public/static')
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Email
+# Confirmation emails are sent by the background worker (manage.py run_worker)
+
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'Uapfy <no-reply@uapfy.local>')
+
+
+# Cache
+# Shared by every web and worker process on the host through files in
+# CACHE_DIR by default; set REDIS_URL to share it between hosts. Cached pages
+# are invalidated by bumping versions in this cache (see uapfy.caching), so it
+# must not be per-process: a bump made by the worker has to reach every web
+# process.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIR', BASE_DIR / 'cache'),
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+
+PAGE_CACHE_TIMEOUT = int(os.environ.get('PAGE_CACHE_TIMEOUT', 60 * 10))
+
+
+# Media storage
+# Uploads and QR images are stored by content hash in sharded directories,
+# see uapfy.storage. MEDIA_STORAGE=s3 keeps them in an S3-compatible bucket
+# instead (AWS_S3_ENDPOINT_URL points it at MinIO and the like); that needs
+# django-storages and boto3.
+
+if os.environ.get('MEDIA_STORAGE') == 's3':
+    MEDIA_STORAGE_BACKEND = {
+        'BACKEND': 'uapfy.storage.S3ContentAddressedStorage',
+        'OPTIONS': {
+            'bucket_name': os.environ.get('AWS_STORAGE_BUCKET_NAME'),
+            'endpoint_url': os.environ.get('AWS_S3_ENDPOINT_URL'),
+            'access_key': os.environ.get('AWS_ACCESS_KEY_ID'),
+            'secret_key': os.environ.get('AWS_SECRET_ACCESS_KEY'),
+            'custom_domain': os.environ.get('AWS_S3_CUSTOM_DOMAIN'),
+            'querystring_auth': False,
+            'file_overwrite': True,
+        },
+    }
+else:
+    MEDIA_STORAGE_BACKEND = {
+        'BACKEND': 'uapfy.storage.ContentAddressedStorage',
+    }
+
+# Uploads that must never be served, such as the attendee CSVs queued for bulk
+# ticket issuance, go to the "private" storage: PRIVATE_ROOT outside the
+# static/media tree, or a private prefix of the bucket with MEDIA_STORAGE=s3.
+# The worker reads them from there, so it needs the same location.
+
+if os.environ.get('MEDIA_STORAGE') == 's3':
+    PRIVATE_STORAGE_BACKEND = {
+        'BACKEND': 'storages.backends.s3.S3Storage',
+        'OPTIONS': {
+            **MEDIA_STORAGE_BACKEND['OPTIONS'],
+            'location': 'private',
+            'default_acl': 'private',
+            'custom_domain': None,
+            'querystring_auth': True,
+            'file_overwrite': False,
+        },
+    }
+else:
+    PRIVATE_STORAGE_BACKEND = {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': os.environ.get('PRIVATE_ROOT', BASE_DIR / 'private')},
+    }
+
+STORAGES = {
+    'default': MEDIA_STORAGE_BACKEND,
+    'private': PRIVATE_STORAGE_BACKEND,
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
@@ -31,6 +31,10 @@ urlpatterns = [
     path('event/<int:event_id>/buy/', buy_ticket, name='buy_ticket'),
     path('my-tickets/', my_tickets, name='my_tickets'),
     path('ticket/<int:ticket_id>/', ticket_detail, name='ticket_detail'),
+    path('ticket/<int:ticket_id>/qr.png', ticket_qr, name='ticket_qr'),
+    path('events/<int:event_id>/reviews/', event_reviews, name='event_reviews'),
+    path('events/<int:event_id>/reviews/submit/', submit_review, name='submit_review'),
+    path('events/<int:event_id>/reviews/delete/', delete_review, name='delete_review'),
     path('user_profile/', user_profile, name='user_profile'),
     path('contact/', ContactUs, name='ContactUs'),
 
@@ -44,8 +48,15 @@ urlpatterns = [
     path('events/<int:event_id>/edit/', update_event, name='update_event'),
     path('events/<int:event_id>/delete/', delete_event, name='delete_event'),
     path('organizer/tickets/', organizer_tickets, name='organizer_tickets'),
+    path('organizer/export/<str:kind>/', organizer_export, name='organizer_export'),
     path('organizer/analytics/', organizer_analytics, name='organizer_analytics'),
+    path('organizer/analytics/sales/', organizer_sales_series, name='organizer_sales_series'),
+    path('organizer/events/<int:event_id>/checkin/', checkin_scan, name='checkin_scan'),
+    path('organizer/events/<int:event_id>/checkin/batch/', checkin_batch, name='checkin_batch'),
+    path('organizer/events/<int:event_id>/checkin/bundle/', checkin_bundle, name='checkin_bundle'),
     path('organizer/profile/', organizer_profile, name='organizer_profile'),
+    path('tasks/stats/', task_stats, name='task_stats'),
+    path('cache/stats/', cache_stats, name='cache_stats'),
 
     
     path('admin/', admin.site.urls),
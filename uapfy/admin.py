@@ -1,15 +1,290 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils.functional import cached_property
+
+from .bulk_issuance import AttendeeFileError, read_attendees, store_attendee_file
+from .capacity import has_room
+from .exports import filter_tickets
+from .issuance import cancel_order
 from .models import *
+from .pagination import cached_count
+from .search import search_filter
+from .tasks import enqueue
+
+
+# Admin
+#
+# The order, ticket and review tables grow with every sale, so their
+# changelists are built to cost the same at any size:
+#   - every relation shown (or used by __str__) is prefetched for the page
+#     instead of queried per row. It is not joined with select_related:
+#     SQLite starts a join from the smaller table, so a page of tickets
+#     joined to their events or users reads and sorts every ticket to find
+#     the newest hundred;
+#   - raw_id_fields for users and orders, autocomplete for events, instead
+#     of <select>s listing whole tables;
+#   - searches are exact matches on indexed columns (or the event search
+#     index), because the admin's own icontains/iexact search is a LIKE
+#     that reads every row;
+#   - the page count is cached like the ticket table's (see
+#     uapfy.pagination), and show_full_result_count=False skips the second,
+#     unfiltered COUNT(*);
+#   - dates are filtered with DateFieldListFilter ranges, and other filters
+#     have fixed choices. date_hierarchy and filters on plain columns run
+#     SELECT DISTINCT over the whole table on every page.
+class CachedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        return cached_count(self.object_list)
+
+
+class ModelAdmin(admin.ModelAdmin):
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+    ordering = ('-pk',)
+    list_select_related = ()
+    list_prefetch_related = ()
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(*self.list_prefetch_related)
+
+    def get_search_results(self, request, queryset, search_term):
+        # An admin's search(queryset, term) replaces the LIKE lookups built
+        # from search_fields, which then only turn the search box on.
+        term = search_term.strip()
+        if term and hasattr(self, 'search'):
+            return self.search(queryset, term), False
+        return super().get_search_results(request, queryset, search_term)
+
+
+def matching_event_ids(term):
+    matches = search_filter(term)
+    if matches is None:
+        return Event.objects.filter(title__icontains=term).values('pk')
+    return Event.objects.filter(matches).values('pk')
+
+
+class IssueTicketsForm(forms.Form):
+    attendees = forms.FileField(help_text="CSV with a header row of name, email and/or phone columns; one ticket per row.")
+    unit_price = forms.DecimalField(max_digits=10, decimal_places=2, min_value=0, initial=0)
+    render_qr = forms.BooleanField(required=False, label="Render QR images", help_text="Only needed for printed tickets.")
+
+
+@admin.register(Event)
+class EventAdmin(ModelAdmin):
+    list_display = ('title', 'organizer', 'start_time', 'status', 'is_active', 'featured', 'tickets_sold', 'max_attendees')
+    list_prefetch_related = ('organizer__user',)
+    list_filter = ('status', 'is_active', 'featured', ('start_time', admin.DateFieldListFilter))
+    search_fields = ('title',)
+    search_help_text = "Words from the title, description, location or categories."
+    autocomplete_fields = ('organizer',)
+    filter_horizontal = ('categories',)
+    # Maintained by uapfy.capacity, uapfy.popularity, uapfy.reviews and the process_image task
+    readonly_fields = (
+        'tickets_sold', 'tickets_reserved', 'popularity', 'rating_sum', 'rating_count', 'average_rating',
+        'banner_variants', 'updated_at',
+    )
+    actions = ['issue_tickets_from_csv']
+
+    def search(self, queryset, term):
+        return queryset.filter(pk__in=matching_event_ids(term))
+
+    def get_urls(self):
+        return [
+            path('<int:event_id>/issue-tickets/', self.admin_site.admin_view(self.issue_tickets_view), name='uapfy_event_issue_tickets'),
+        ] + super().get_urls()
+
+    @admin.action(description="Issue tickets from a CSV of attendees", permissions=['change'])
+    def issue_tickets_from_csv(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, "Select exactly one event to issue tickets for.", messages.WARNING)
+            return None
+        return redirect('admin:uapfy_event_issue_tickets', queryset.get().pk)
+
+    def issue_tickets_view(self, request, event_id):
+        event = get_object_or_404(Event, pk=event_id)
+        if not self.has_change_permission(request, event):
+            raise PermissionDenied
+
+        form = IssueTicketsForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['attendees']
+            try:
+                count = len(read_attendees(upload.read()))
+            except AttendeeFileError as e:
+                form.add_error('attendees', str(e))
+            else:
+                if not has_room(event, count):
+                    form.add_error('attendees', f"{event} has no room for {count} more ticket(s).")
+                else:
+                    # Issued by a worker; the same file for the same event is only ever issued once.
+                    upload.seek(0)
+                    enqueue('issue_tickets_from_csv', {
+                        'event_id': event.pk,
+                        'name': store_attendee_file(event, upload),
+                        'unit_price': str(form.cleaned_data['unit_price']),
+                        'render_qr': form.cleaned_data['render_qr'],
+                    })
+                    self.message_user(request, f"Issuing {count} ticket(s) for {event} in the background.", messages.SUCCESS)
+                    return redirect('admin:uapfy_event_changelist')
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': f"Issue tickets for {event}",
+            'event': event,
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/uapfy/event/issue_tickets.html', context)
+
+
+@admin.register(UserProfile)
+class UserProfileAdmin(ModelAdmin):
+    list_display = ('user', 'contact_number')
+    list_prefetch_related = ('user',)
+    raw_id_fields = ('user',)
+    search_fields = ('user__username',)
+    search_help_text = "Exact username."
+
+    def search(self, queryset, term):
+        return queryset.filter(user__username=term)
+
+
+@admin.register(OrganizerProfile)
+class OrganizerProfileAdmin(ModelAdmin):
+    list_display = ('__str__', 'user', 'contact_number')
+    list_prefetch_related = ('user',)
+    raw_id_fields = ('user',)
+    search_fields = ('organization_name', 'user__username')
+    readonly_fields = ('logo_variants',)
+
+
+@admin.register(EventCategory)
+class EventCategoryAdmin(ModelAdmin):
+    list_display = ('name',)
+    search_fields = ('name',)
+
+
+# Seats, popularity and the sales rollups follow an order's status and items
+# (see uapfy.issuance), so neither is edited by hand: orders are cancelled or
+# refunded through cancel_order, and their items are read-only.
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    readonly_fields = ('event', 'quantity', 'unit_price')
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Order)
+class OrderAdmin(ModelAdmin):
+    list_display = ('order_number', 'user', 'status', 'total', 'payment_method', 'created_at')
+    list_prefetch_related = ('user',)
+    list_filter = ('status', 'payment_method', ('created_at', admin.DateFieldListFilter))
+    search_fields = ('order_number',)
+    search_help_text = "Exact order number."
+    raw_id_fields = ('user',)
+    readonly_fields = ('status', 'subtotal', 'total')
+    inlines = [OrderItemInline]
+    actions = ['cancel_orders', 'refund_orders']
+
+    def search(self, queryset, term):
+        return queryset.filter(order_number=term.upper())
+
+    def get_actions(self, request):
+        # Deleting a completed order would keep its seats and sales counted
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def has_delete_permission(self, request, obj=None):
+        if obj is not None and obj.status == 'completed':
+            return False
+        return super().has_delete_permission(request, obj)
+
+    def _cancel(self, request, queryset, status):
+        done = sum(cancel_order(order, status) for order in queryset)
+        skipped = len(queryset) - done
+        self.message_user(request, f"{done} order(s) {status}.", messages.SUCCESS)
+        if skipped:
+            self.message_user(request, f"Skipped {skipped} order(s) that were not completed.", messages.WARNING)
+
+    @admin.action(description="Cancel selected orders, releasing their seats", permissions=['change'])
+    def cancel_orders(self, request, queryset):
+        self._cancel(request, queryset, 'cancelled')
+
+    @admin.action(description="Refund selected orders, releasing their seats", permissions=['change'])
+    def refund_orders(self, request, queryset):
+        self._cancel(request, queryset, 'refunded')
+
+
+@admin.register(OrderItem)
+class OrderItemAdmin(ModelAdmin):
+    list_display = ('order', 'event', 'quantity', 'unit_price')
+    list_prefetch_related = ('order', 'event')
+    search_fields = ('order__order_number',)
+    search_help_text = "Exact order number."
+    # Changed only through the order, see OrderAdmin
+    readonly_fields = ('order', 'event', 'quantity', 'unit_price')
+
+    def search(self, queryset, term):
+        return queryset.filter(order__order_number=term.upper())
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Ticket)
+class TicketAdmin(ModelAdmin):
+    list_display = ('ticket_number', 'event', 'user', 'attendee_name', 'attendee_email', 'purchased_at', 'is_used')
+    list_prefetch_related = ('user', 'event')
+    list_filter = ('is_used', ('purchased_at', admin.DateFieldListFilter))
+    search_fields = ('ticket_number', 'attendee_email')
+    search_help_text = "Exact ticket number or attendee email."
+    raw_id_fields = ('user', 'order')
+    autocomplete_fields = ('event',)
+    readonly_fields = ('qr_data', 'checked_in_at', 'updated_at')
+
+    def search(self, queryset, term):
+        # Same lookups as the organizer ticket table
+        return filter_tickets(queryset, {'q': term})
+
+
+class RatingFilter(admin.SimpleListFilter):
+    title = 'rating'
+    parameter_name = 'rating'
+
+    def lookups(self, request, model_admin):
+        return [(str(stars), f'{stars} star(s)') for stars in range(5, 0, -1)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(rating=self.value())
+        return queryset
+
+
+@admin.register(Review)
+class ReviewAdmin(ModelAdmin):
+    list_display = ('event', 'user', 'rating', 'created_at')
+    list_prefetch_related = ('user', 'event')
+    list_filter = (RatingFilter, ('created_at', admin.DateFieldListFilter))
+    search_fields = ('event__title',)
+    search_help_text = "Words from the event's title, description, location or categories."
+    raw_id_fields = ('user',)
+    autocomplete_fields = ('event',)
 
-# Register your models here.
-admin.site.register(UserProfile)
-admin.site.register(OrganizerProfile)
-admin.site.register(EventCategory)
-admin.site.register(Event)
-admin.site.register(Order)
-admin.site.register(OrderItem)
-admin.site.register(Ticket)
-admin.site.register(Review)
+    def search(self, queryset, term):
+        return queryset.filter(event_id__in=matching_event_ids(term))
 
 
 admin.site.index_title = "Uapfy Admin"
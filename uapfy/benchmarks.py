@@ -0,0 +1,342 @@
+import statistics
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import OperationalError, connection, transaction
+from django.http import QueryDict
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from . import checkin, exports, search
+from .capacity import SoldOutError
+from .issuance import issue_tickets
+from .models import Event, Order, OrderItem, OrganizerProfile, Ticket, generate_ticket_number
+from .qr import render_qr_png
+from .rollups import rebuild_rollups, sales_series
+
+
+_registry = {}
+
+
+# Benchmarks
+#
+# Scenarios for the `benchmark` command. Each one builds its own data in the
+# throwaway database the command creates and returns Timings, so the numbers
+# quoted for a change can be measured again on any machine.
+def benchmark(name):
+    def register(func):
+        _registry[name] = func
+        return func
+    return register
+
+
+def benchmarks():
+    return dict(_registry)
+
+
+class Timings:
+    def __init__(self, label, samples, elapsed):
+        self.label = label
+        self.samples = samples  # seconds per call
+        self.elapsed = elapsed  # wall clock for all of them
+
+    @property
+    def throughput(self):
+        return len(self.samples) / self.elapsed if self.elapsed else 0
+
+    def percentile(self, percent):
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+    def __str__(self):
+        if not self.samples:
+            return f"{self.label}: no calls"
+        return (
+            f"{self.label}: {len(self.samples)} calls in {self.elapsed:.2f}s, {self.throughput:.0f}/s, "
+            f"median {statistics.median(self.samples) * 1000:.1f} ms, "
+            f"p95 {self.percentile(95) * 1000:.1f} ms, max {max(self.samples) * 1000:.1f} ms"
+        )
+
+
+def measure(label, func, calls):
+    """Call `func()` `calls` times in a row."""
+    samples = []
+    started = time.perf_counter()
+    for _ in range(calls):
+        call_started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - call_started)
+    return Timings(label, samples, time.perf_counter() - started)
+
+
+def race_buyers(event, user, buyers, attempts, quantity=1):
+    """`buyers` threads each try to buy `quantity` seats `attempts` times, all at once.
+
+    Returns (Timings, {'sold': n, 'sold_out': n}, errors). Every thread uses
+    its own database connection, as concurrent requests would.
+    """
+    billing = {'billing_name': 'Buyer', 'billing_email': user.email, 'billing_phone': '0', 'billing_address': '-'}
+    outcomes = {'sold': 0, 'sold_out': 0}
+    samples = []
+    errors = []
+    lock = threading.Lock()
+    start = threading.Barrier(buyers + 1)
+
+    def buy():
+        start.wait()
+        try:
+            for _ in range(attempts):
+                call_started = time.perf_counter()
+                try:
+                    issue_tickets(user, event, quantity, billing, {'attendee_name': 'Buyer'})
+                    outcome = 'sold'
+                except SoldOutError:
+                    outcome = 'sold_out'
+                with lock:
+                    samples.append(time.perf_counter() - call_started)
+                    outcomes[outcome] += 1
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=buy) for _ in range(buyers)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    timings = Timings(f"{buyers} buyers x {attempts} purchases", samples, time.perf_counter() - started)
+    return timings, outcomes, errors
+
+
+# Scenarios
+def _organizer():
+    user = User.objects.create_user('benchmark-organizer', 'organizer@example.com', 'x')
+    return OrganizerProfile.objects.create(user=user)
+
+
+def _buyer(name='benchmark-buyer'):
+    return User.objects.create_user(name, f'{name}@example.com', 'x')
+
+
+def _events(organizer, count):
+    start = timezone.now() + timedelta(days=30)
+    return Event.objects.bulk_create([
+        Event(
+            organizer=organizer,
+            title=f'Event {index}',
+            description='A benchmark event',
+            location='Dhaka',
+            start_time=start + timedelta(minutes=index),
+            end_time=start + timedelta(minutes=index, hours=2),
+        )
+        for index in range(count)
+    ], batch_size=1000)
+
+
+def _tickets(user, event, count):
+    order = Order.objects.create(user=user, subtotal=0, total=0, status='completed')
+    return Ticket.objects.bulk_create([
+        Ticket(
+            user=user, event=event, organizer_id=event.organizer_id, order=order,
+            ticket_number=generate_ticket_number(), attendee_name=user.username,
+        )
+        for _ in range(count)
+    ], batch_size=1000)
+
+
+@benchmark('purchase')
+def purchase():
+    """Flash sale: 8 buyers race for 500 seats with 100 purchases each."""
+    event = _events(_organizer(), 1)[0]
+    Event.objects.filter(pk=event.pk).update(max_attendees=500)
+    event.refresh_from_db()
+    timings, outcomes, errors = race_buyers(event, _buyer(), buyers=8, attempts=100)
+    if errors:
+        raise errors[0]
+    event.refresh_from_db()
+    timings.label += f" ({outcomes['sold']} sold, {outcomes['sold_out']} sold out, {event.tickets_sold}/{event.max_attendees} seats)"
+    return [timings]
+
+
+@benchmark('issuance')
+def issuance():
+    """Issuing one order of 1, 10 and 50 tickets: the bulk path against one INSERT and QR render per ticket."""
+    event = _events(_organizer(), 1)[0]
+    user = _buyer()
+    billing = {'billing_name': 'Buyer', 'billing_email': user.email, 'billing_phone': '0', 'billing_address': '-'}
+
+    def one_by_one(quantity):
+        # What buy_ticket did before uapfy.issuance: a save() per ticket, each rendering its QR image
+        with transaction.atomic():
+            order = Order.objects.create(user=user, subtotal=0, total=0, status='completed', **billing)
+            OrderItem.objects.create(order=order, event=event, quantity=quantity, unit_price=0)
+            for _ in range(quantity):
+                ticket = Ticket(user=user, event=event, order=order, attendee_name='Buyer')
+                ticket.save()
+                render_qr_png(ticket.qr_data)
+
+    results = []
+    for quantity in (1, 10, 50):
+        results.append(measure(f"{quantity} tickets, bulk", lambda: issue_tickets(user, event, quantity, billing, {}), 20))
+        results.append(measure(f"{quantity} tickets, one by one", lambda: one_by_one(quantity), 20))
+    return results
+
+
+@benchmark('checkin')
+def checkin_scans():
+    """Gate scans of 5000 tickets, with the ticket index and straight against the database."""
+    event = _events(_organizer(), 1)[0]
+    numbers = [ticket.ticket_number for ticket in _tickets(_buyer(), event, 5000)]
+    results = []
+    for indexed in (True, False):
+        mode = 'index' if indexed else 'database'
+        Ticket.objects.filter(event=event).update(is_used=False, checked_in_at=None)
+        checkin.drop_ticket_index(event.pk)
+        with override_settings(CHECKIN_TICKET_INDEX=indexed):
+            first = iter(numbers)
+            results.append(measure(f"{mode}, first scans", lambda: checkin.scan(next(first), event.pk), len(numbers)))
+            again = iter(numbers)
+            results.append(measure(f"{mode}, repeat scans", lambda: checkin.scan(next(again), event.pk), len(numbers)))
+    return results
+
+
+@benchmark('series')
+def series():
+    """Sales series for 5 events with 100,000 orders over a year, by range size and bucket."""
+    organizer = _organizer()
+    events = _events(organizer, 5)
+    user = _buyer()
+    now = timezone.now()
+    count = 100_000
+    orders = Order.objects.bulk_create([
+        Order(user=user, order_number=f'BENCH-{index}', subtotal=10, total=10, status='completed')
+        for index in range(count)
+    ], batch_size=1000)
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, event=events[index % len(events)], quantity=1, unit_price=10)
+        for index, order in enumerate(orders)
+    ], batch_size=1000)
+    # created_at is auto_now_add; spread the sales evenly over the last year
+    step = timedelta(days=365) / count
+    for first in range(0, count, 1000):
+        batch = orders[first:first + 1000]
+        for offset, order in enumerate(batch, first):
+            order.created_at = now - step * offset
+        Order.objects.bulk_update(batch, ['created_at'])
+    rebuild_rollups()
+
+    events = Event.objects.filter(organizer=organizer)
+    results = []
+    for days, bucket in ((1, 'minute'), (7, 'hour'), (30, 'hour'), (30, 'day'), (365, 'day'), (365, 'week')):
+        start = now - timedelta(days=days)
+        results.append(measure(f"{days} days by {bucket}", lambda: sales_series(events, start, now, bucket), 50))
+    return results
+
+
+@benchmark('export')
+def export_csv():
+    """CSV exports of 100,000 tickets over 10 events, read to the end as the response would be."""
+    organizer = _organizer()
+    user = _buyer()
+    for event in _events(organizer, 10):
+        _tickets(user, event, 10_000)
+
+    def export(kind):
+        headers, rows = exports.export_rows(kind, organizer, QueryDict())
+        for _ in exports.csv_chunks(headers, rows):
+            pass
+
+    return [measure(f"{kind}, 100,000 rows", lambda: export(kind), 5) for kind in ('tickets', 'attendees')]
+
+
+@benchmark('database')
+def database_concurrency():
+    """8 buyers race for 2000 seats while 4 readers list events, per journal mode on SQLite."""
+    organizer = _organizer()
+    _events(organizer, 500)
+    user = _buyer()
+    # WAL last, so the database is left in the mode its migration set
+    modes = ('delete', 'wal') if connection.vendor == 'sqlite' else (connection.vendor,)
+    results = []
+    for mode in modes:
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute(f'PRAGMA journal_mode={mode}')
+        event = _events(organizer, 1)[0]
+        Event.objects.filter(pk=event.pk).update(max_attendees=2000)
+        event.refresh_from_db()
+
+        samples, done, errors = [], threading.Event(), []
+
+        def read():
+            try:
+                while not done.is_set():
+                    call_started = time.perf_counter()
+                    list(Event.objects.filter(is_active=True).order_by('start_time', 'id')[:12])
+                    samples.append(time.perf_counter() - call_started)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        started = time.perf_counter()
+        timings, outcomes, buy_errors = race_buyers(event, user, buyers=8, attempts=50)
+        done.set()
+        for reader in readers:
+            reader.join()
+        # "database is locked" is a result here, not a bug: it's what WAL avoids
+        locked = [e for e in errors + buy_errors if isinstance(e, OperationalError) and 'locked' in str(e)]
+        if len(locked) < len(errors + buy_errors):
+            raise next(e for e in errors + buy_errors if e not in locked)
+        timings.label = f"{mode}, {timings.label} ({outcomes['sold']} sold, {len(locked)} threads stopped by a locked database)"
+        results += [timings, Timings(f"{mode}, 4 readers listing events meanwhile", samples, time.perf_counter() - started)]
+    return results
+
+
+SEARCH_WORDS = ['jazz', 'rock', 'tech', 'food', 'art', 'film', 'startup', 'charity', 'chess', 'poetry']
+
+
+@benchmark('search')
+def search_events():
+    """Event searches through the listing page at 10,000 and 100,000 events, FTS5 against the icontains query."""
+    organizer = _organizer()
+    client = Client()
+    results = []
+    created = 0
+    for size in (10_000, 100_000):
+        start = timezone.now() + timedelta(days=30)
+        Event.objects.bulk_create([
+            Event(
+                organizer=organizer,
+                title=f'{SEARCH_WORDS[index % 10].title()} night {index}',
+                description=f'An evening of {SEARCH_WORDS[index * 7 % 10]} and {SEARCH_WORDS[index * 3 % 10]}.',
+                location=('Dhaka', 'Sylhet', 'Khulna')[index % 3],
+                start_time=start + timedelta(minutes=index),
+                end_time=start + timedelta(minutes=index, hours=2),
+            )
+            for index in range(created, size)
+        ], batch_size=1000)
+        created = size
+        # bulk_create sends no signals
+        search.rebuild_index()
+
+        for query in ('jazz', 'chess sylhet', 'night 4242'):
+            def get():
+                cache.clear()  # every search is a miss in the page and count caches
+                client.get('/allevents/', {'q': query})
+
+            if search.uses_fts():
+                results.append(measure(f"{size} events, q={query!r}, full-text index", get, 20))
+            with mock.patch.object(search, 'uses_fts', return_value=False):
+                results.append(measure(f"{size} events, q={query!r}, icontains", get, 20))
+    return results
@@ -0,0 +1,252 @@
+import csv
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from io import StringIO
+
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import caching
+from .capacity import SoldOutError, has_room, reserve_seats
+from .models import Order, OrderItem, Ticket, generate_ticket_number
+from .popularity import record_ticket_sales
+from .qr import qr_etag, render_qr_png
+from .rollups import record_sale, sale_day
+from .ticket_signing import event_key, sign_ticket
+
+
+BULK_CHUNK_SIZE = 1000  # tickets per order, and per transaction
+IMPORT_FOLDER = 'ticket_imports'  # in the private storage
+COLUMNS = {'name': 'attendee_name', 'email': 'attendee_email', 'phone': 'attendee_phone'}
+
+
+class AttendeeFileError(ValueError):
+    pass
+
+
+# Bulk Ticket Issuance
+#
+# Comp tickets and partner allocations from a CSV of attendees (a header row
+# with name, email and/or phone columns, one ticket per row). The rows are
+# issued in chunks: each chunk is one Order with one OrderItem and a single
+# bulk INSERT of its tickets, in its own transaction, taking its seats through
+# reserve_seats and updating the rollups like any other sale.
+#
+# Order numbers are derived from a digest of the event and the file plus the
+# range of rows the order holds (BULK-<key>-<first row>-<row after last>), so
+# a run that crashed (or a retried task) can be started again with the same
+# file, at any chunk size: rows inside an existing order's range are skipped
+# and only the rest is issued.
+# QR images are normally rendered on demand; with render_qr they are rendered
+# in a process pool and stored, for events that print their tickets.
+def _field(header):
+    name = header.strip().lower().replace(' ', '_')
+    return COLUMNS.get(name.removeprefix('attendee_'))
+
+
+def _clean(attendee, line):
+    if not attendee.get('attendee_name') and not attendee.get('attendee_email'):
+        raise AttendeeFileError(f"Line {line}: a name or an email is required.")
+    if attendee.get('attendee_email'):
+        try:
+            validate_email(attendee['attendee_email'])
+        except ValidationError:
+            raise AttendeeFileError(f"Line {line}: {attendee['attendee_email']!r} is not a valid email.")
+    for field, value in attendee.items():
+        max_length = Ticket._meta.get_field(field).max_length
+        if value and len(value) > max_length:
+            raise AttendeeFileError(f"Line {line}: {field} is longer than {max_length} characters.")
+    return attendee
+
+
+def read_attendees(data):
+    """Parse CSV `data` (bytes) into attendee dicts for Ticket(**attendee).
+
+    Raises AttendeeFileError naming the first bad line, before anything is issued.
+    """
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise AttendeeFileError("The file is not UTF-8 encoded CSV.")
+    reader = csv.reader(StringIO(text))
+    header = next(reader, None)
+    fields = [_field(cell) for cell in header or []]
+    if not any(fields):
+        raise AttendeeFileError("The header row has no name, email or phone column.")
+
+    attendees = []
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        attendee = {field: cell.strip() or None for field, cell in zip(fields, row) if field}
+        attendees.append(_clean(attendee, reader.line_num))
+    return attendees
+
+
+def import_key(event, data):
+    return hashlib.sha256(b'%d:' % event.pk + data).hexdigest()[:12].upper()
+
+
+def store_attendee_file(event, upload):
+    """Keep an uploaded attendee CSV for the worker, outside the served media; returns its name."""
+    return storages['private'].save(f'{IMPORT_FOLDER}/{event.pk}.csv', upload)
+
+
+def _order_number(key, start, end):
+    return f'BULK-{key}-{start:06d}-{end:06d}'
+
+
+def _orders(key):
+    # A range on the unique index rather than LIKE, which SQLite can't seek
+    return Order.objects.filter(order_number__gte=f'BULK-{key}-', order_number__lt=f'BULK-{key}.')
+
+
+def _issued_ranges(key):
+    """(start, end) row ranges of the file already issued, from its order numbers."""
+    ranges = []
+    for number in _orders(key).values_list('order_number', flat=True):
+        start, end = number.removeprefix(f'BULK-{key}-').split('-')
+        ranges.append((int(start), int(end)))
+    return ranges
+
+
+def _chunks(total, issued, chunk_size):
+    """(start, end) row ranges of at most `chunk_size` rows covering every row not yet issued."""
+    issued_rows = set()
+    for start, end in issued:
+        issued_rows.update(range(start, end))
+    start = None
+    for row in range(total + 1):
+        pending = row < total and row not in issued_rows
+        if start is not None and (not pending or row - start == chunk_size):
+            yield start, row
+            start = None
+        if pending and start is None:
+            start = row
+
+
+class _AlreadyIssued(Exception):
+    pass
+
+
+def _billing(event):
+    organizer = event.organizer
+    return {
+        'payment_method': 'other',
+        'billing_name': str(organizer),
+        'billing_email': organizer.user.email,
+        'billing_phone': organizer.contact_number or '',
+        'billing_address': organizer.organization_address or '',
+    }
+
+
+def _issue_chunk(event, user, key, start, end, attendees, unit_price, billing, signing_key):
+    tickets = []
+    for attendee in attendees:
+        ticket_number = generate_ticket_number()
+        tickets.append(Ticket(
+            user=user,
+            event=event,
+            organizer_id=event.organizer_id,
+            ticket_number=ticket_number,
+            qr_data=sign_ticket(event.pk, ticket_number, signing_key),
+            **attendee
+        ))
+
+    quantity = len(tickets)
+    total = unit_price * quantity
+    with transaction.atomic():
+        # A concurrent run of the same file with another chunk size may have
+        # taken some of these rows under a different order number.
+        if any(s < end and start < e for s, e in _issued_ranges(key)):
+            raise _AlreadyIssued
+        reserve_seats(event, quantity)
+        record_ticket_sales(event.pk, quantity)
+        order = Order.objects.create(
+            user=user,
+            order_number=_order_number(key, start, end),
+            subtotal=total,
+            total=total,
+            status='completed',
+            **billing
+        )
+        OrderItem.objects.create(order=order, event=event, quantity=quantity, unit_price=unit_price)
+        for ticket in tickets:
+            ticket.order = order
+        Ticket.objects.bulk_create(tickets)
+        record_sale(event.pk, sale_day(order), quantity, total)
+    return order.pk
+
+
+def _render_qr_codes(order_id, pool):
+    tickets = list(
+        Ticket.objects.filter(Q(qr_code='') | Q(qr_code__isnull=True), order_id=order_id)
+        .only('ticket_number', 'qr_data', 'qr_code', 'qr_code_etag')
+    )
+    now = timezone.now()
+    for ticket, png in zip(tickets, pool.map(render_qr_png, [t.qr_data for t in tickets], chunksize=50)):
+        ticket.qr_code.save(f'{ticket.ticket_number}_qr.png', ContentFile(png), save=False)
+        ticket.qr_code_etag = qr_etag(ticket.qr_data)
+        ticket.updated_at = now
+    Ticket.objects.bulk_update(tickets, ['qr_code', 'qr_code_etag', 'updated_at'], batch_size=500)
+
+
+def issue_from_csv(event, data, user, unit_price=Decimal('0.00'), chunk_size=BULK_CHUNK_SIZE,
+                   render_qr=False, processes=None, progress=None):
+    """Issue a ticket owned by `user` for each attendee in CSV `data`.
+
+    Returns (issued, skipped): skipped tickets were issued by an earlier run
+    with the same file. `progress(done, total)` is called after every chunk.
+    Raises AttendeeFileError for a bad file and SoldOutError when the
+    remaining tickets don't fit in the event; nothing is issued in either case.
+    """
+    attendees = read_attendees(data)
+    key = import_key(event, data)
+    chunks = list(_chunks(len(attendees), _issued_ranges(key), chunk_size))
+
+    remaining = sum(end - start for start, end in chunks)
+    if remaining and not has_room(event, remaining):
+        raise SoldOutError(event.pk)
+
+    billing = _billing(event)
+    signing_key = event_key(event.pk)
+    issued = 0
+    skipped = len(attendees) - remaining
+    pool = ProcessPoolExecutor(processes) if render_qr else None
+    try:
+        if pool is not None and skipped:
+            # Orders from an earlier run whose images weren't rendered yet
+            for order_id in _orders(key).values_list('pk', flat=True):
+                _render_qr_codes(order_id, pool)
+        for start, end in chunks:
+            try:
+                order_id = _issue_chunk(event, user, key, start, end, attendees[start:end], unit_price, billing, signing_key)
+                issued += end - start
+            except _AlreadyIssued:
+                # Rows of it the other run didn't take are issued by the next rerun
+                order_id = None
+                skipped += end - start
+            except IntegrityError:
+                # Issued by a concurrent run of the same file and chunk size;
+                # any other constraint (e.g. a ticket number clash) is an error.
+                if not Order.objects.filter(order_number=_order_number(key, start, end)).exists():
+                    raise
+                order_id = None
+                skipped += end - start
+            if pool is not None and order_id is not None:
+                _render_qr_codes(order_id, pool)
+            if progress:
+                progress(issued + skipped, len(attendees))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        # bulk_create sends no signals; tickets_sold and popularity changed
+        if issued:
+            caching.invalidate_events([event.pk])
+    return issued, skipped
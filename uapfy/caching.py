@@ -0,0 +1,182 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import urlencode
+
+
+PAGE_CACHE_TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 10)
+NAMESPACES = ('listing', 'event', 'card')
+STATS_FLUSH_INTERVAL = 10  # seconds between writes of this process's hit counts
+
+
+# Page Cache
+#
+# Cached listings, events and rendered event cards are keyed on version
+# numbers instead of being deleted one by one. A change to an event bumps its
+# own version, which makes every entry built from the old data unreachable;
+# the backend expires them on its own. The "events" version covers all events
+# at once for bulk UPDATEs that don't say which rows they touched.
+#
+# A listing also remembers the versions of the events on its page and is
+# rebuilt when one of them changed, so a ticket sale only costs the pages
+# that show that event. The "listing" version is bumped when events are
+# added, removed or edited, which can change what every listing contains;
+# orderings by counters (popularity, rating) may lag until the entry
+# expires.
+def _version_key(name):
+    return f'version:{name}'
+
+
+def _versions(names):
+    keys = {_version_key(name): name for name in names}
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    for key in missing:
+        # Start from the clock rather than 0, so entries written under a
+        # version that was evicted can never become reachable again.
+        cache.add(key, time.time_ns(), None)
+    if missing:
+        found.update(cache.get_many(missing))
+    # A backend that stores nothing (DummyCache) leaves every version at 0.
+    return {name: found.get(key, 0) for key, name in keys.items()}
+
+
+def bump(*names):
+    for name in names:
+        try:
+            cache.incr(_version_key(name))
+        except ValueError:
+            cache.add(_version_key(name), time.time_ns(), None)
+
+
+def event_versions(event_ids):
+    """{event_id: version string} for entries derived from those events."""
+    names = ['events'] + [f'event:{event_id}' for event_id in event_ids]
+    versions = _versions(names)
+    return {event_id: f"{versions['events']}.{versions[f'event:{event_id}']}" for event_id in event_ids}
+
+
+def event_version(event_id):
+    return event_versions([event_id])[event_id]
+
+
+def listing_version():
+    return _versions(['events', 'listing'])
+
+
+def invalidate_events(event_ids):
+    """Drop entries showing these events, e.g. after a sale changed their counters."""
+    bump(*(f'event:{event_id}' for event_id in event_ids))
+
+
+def invalidate_listing():
+    """Drop every listing, for changes to which events match or how they sort."""
+    bump('listing')
+
+
+def invalidate_all_events():
+    bump('events', 'listing')
+
+
+def listing_key(params):
+    """Cache key for a listing, independent of the order of the query parameters."""
+    versions = listing_version()
+    query = urlencode(sorted(params.lists()), doseq=True)
+    digest = hashlib.sha1(query.encode()).hexdigest()
+    return f"listing:{versions['events']}.{versions['listing']}:{digest}"
+
+
+def get_listing(params, build, timeout=PAGE_CACHE_TIMEOUT):
+    """(page, total, versions) of a listing, calling `build()` for (page, total) on a miss.
+
+    `versions` are the event_versions() of the events on the page; a cached
+    page is only used while they are all still current.
+    """
+    key = listing_key(params)
+    cached = cache.get(key)
+    if cached is not None:
+        page, total, versions = cached
+        if event_versions([event.id for event in page]) == versions:
+            _count('listing', 'hits')
+            return cached
+    _count('listing', 'misses')
+    page, total = build()
+    versions = event_versions([event.id for event in page])
+    cache.set(key, (page, total, versions), timeout)
+    return page, total, versions
+
+
+# Metrics
+#
+# Hits and misses are counted in the process and added to the shared totals
+# every few seconds, so a cache hit doesn't also cost a cache write.
+_pending = Counter()
+_pending_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+def _count(namespace, outcome, delta=1):
+    global _flushed_at
+    with _pending_lock:
+        _pending[f'stats:{namespace}:{outcome}'] += delta
+        if time.monotonic() - _flushed_at < STATS_FLUSH_INTERVAL:
+            return
+    flush_stats()
+
+
+def flush_stats():
+    global _flushed_at
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _flushed_at = time.monotonic()
+    for key, delta in pending.items():
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            cache.add(key, delta, None)
+
+
+def get_or_set(namespace, key, build, timeout=PAGE_CACHE_TIMEOUT):
+    """Return the cached value for `key`, calling `build()` on a miss."""
+    value = cache.get(key)
+    if value is None:
+        _count(namespace, 'misses')
+        value = build()
+        cache.set(key, value, timeout)
+    else:
+        _count(namespace, 'hits')
+    return value
+
+
+def get_or_set_many(namespace, builds, timeout=PAGE_CACHE_TIMEOUT):
+    """{key: value} for `builds` ({key: build}), in one lookup, building only the misses."""
+    # None is never a hit, as in get_or_set()
+    values = {key: value for key, value in cache.get_many(list(builds)).items() if value is not None}
+    if values:
+        _count(namespace, 'hits', len(values))
+    missing = {key: build() for key, build in builds.items() if key not in values}
+    if missing:
+        cache.set_many(missing, timeout)
+        _count(namespace, 'misses', len(missing))
+    values.update(missing)
+    return values
+
+
+def cache_stats():
+    flush_stats()
+    counts = cache.get_many([f'stats:{namespace}:{outcome}' for namespace in NAMESPACES for outcome in ('hits', 'misses')])
+    stats = {}
+    for namespace in NAMESPACES:
+        hits = counts.get(f'stats:{namespace}:hits', 0)
+        misses = counts.get(f'stats:{namespace}:misses', 0)
+        stats[namespace] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else None,
+        }
+    return stats
@@ -0,0 +1,146 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .models import Event, Ticket, TicketHold
+
+
+HOLD_DURATION = timedelta(minutes=10)
+
+
+class SoldOutError(Exception):
+    pass
+
+
+# Seats are counted on Event.tickets_sold / Event.tickets_reserved and only
+# ever changed by conditional UPDATEs, so two buyers racing for the last
+# seats cannot both succeed and no purchase has to COUNT the ticket table.
+def _has_room(quantity):
+    return Q(max_attendees=0) | Q(max_attendees__gte=F('tickets_sold') + F('tickets_reserved') + quantity)
+
+
+def _claim(event_id, quantity, **changes):
+    changes['updated_at'] = timezone.now()
+    if Event.objects.filter(_has_room(quantity), pk=event_id).update(**changes):
+        return True
+    # Expired holds may still be counted as reserved; free them and retry once.
+    if release_expired_holds(event_id=event_id):
+        return bool(Event.objects.filter(_has_room(quantity), pk=event_id).update(**changes))
+    return False
+
+
+def has_room(event, quantity):
+    """Whether `quantity` more seats fit right now, without taking them."""
+    if Event.objects.filter(_has_room(quantity), pk=event.pk).exists():
+        return True
+    return bool(release_expired_holds(event_id=event.pk)) and Event.objects.filter(_has_room(quantity), pk=event.pk).exists()
+
+
+def reserve_seats(event, quantity):
+    """Count `quantity` seats as sold, raising SoldOutError if they don't fit."""
+    with transaction.atomic():
+        if not _claim(event.pk, quantity, tickets_sold=F('tickets_sold') + quantity):
+            raise SoldOutError(event.pk)
+
+
+def release_seats(event, quantity):
+    Event.objects.filter(pk=event.pk).update(tickets_sold=F('tickets_sold') - quantity, updated_at=timezone.now())
+
+
+def hold_seats(event, user, quantity, duration=HOLD_DURATION):
+    """Set seats aside for a short checkout window."""
+    with transaction.atomic():
+        if not _claim(event.pk, quantity, tickets_reserved=F('tickets_reserved') + quantity):
+            raise SoldOutError(event.pk)
+        return TicketHold.objects.create(
+            event=event,
+            user=user,
+            quantity=quantity,
+            expires_at=timezone.now() + duration,
+        )
+
+
+def checkout_hold(event, user):
+    """The user's unexpired hold on `event`, holding one seat if they have none.
+
+    None when the event is sold out; the purchase then reserves its seats
+    directly and fails with SoldOutError like any other.
+    """
+    hold = TicketHold.objects.filter(event=event, user=user, expires_at__gt=timezone.now()).first()
+    if hold is None:
+        try:
+            hold = hold_seats(event, user, 1)
+        except SoldOutError:
+            return None
+    return hold
+
+
+def purchase_hold(event, user, quantity):
+    """The user's hold to confirm for a purchase of `quantity` seats, if it covers them.
+
+    A hold for a different number of seats is released, so the purchase
+    reserves the full quantity itself.
+    """
+    hold = TicketHold.objects.filter(event=event, user=user, expires_at__gt=timezone.now()).first()
+    if hold is not None and hold.quantity != quantity:
+        release_hold(hold)
+        return None
+    return hold
+
+
+def confirm_hold(hold):
+    """Turn a hold into sold seats. Expired holds fall back to a fresh reservation."""
+    with transaction.atomic():
+        deleted, _ = TicketHold.objects.filter(pk=hold.pk, expires_at__gt=timezone.now()).delete()
+        if deleted:
+            Event.objects.filter(pk=hold.event_id).update(
+                tickets_reserved=F('tickets_reserved') - hold.quantity,
+                tickets_sold=F('tickets_sold') + hold.quantity,
+                updated_at=timezone.now(),
+            )
+            return
+    reserve_seats(hold.event, hold.quantity)
+
+
+def release_hold(hold):
+    with transaction.atomic():
+        deleted, _ = TicketHold.objects.filter(pk=hold.pk).delete()
+        if deleted:
+            Event.objects.filter(pk=hold.event_id).update(tickets_reserved=F('tickets_reserved') - hold.quantity, updated_at=timezone.now())
+
+
+def release_expired_holds(event_id=None):
+    """Return seats of expired holds to their events. Returns the number of seats freed."""
+    holds = TicketHold.objects.filter(expires_at__lte=timezone.now())
+    if event_id is not None:
+        holds = holds.filter(event_id=event_id)
+
+    freed = 0
+    with transaction.atomic():
+        expired = list(holds.select_for_update(skip_locked=True).values_list('pk', 'event_id', 'quantity'))
+        per_event = {}
+        for pk, hold_event_id, quantity in expired:
+            # Only the caller that actually deletes a hold gives its seats back.
+            deleted, _ = TicketHold.objects.filter(pk=pk).delete()
+            if deleted:
+                per_event[hold_event_id] = per_event.get(hold_event_id, 0) + quantity
+        for hold_event_id, quantity in per_event.items():
+            Event.objects.filter(pk=hold_event_id).update(tickets_reserved=F('tickets_reserved') - quantity, updated_at=timezone.now())
+            freed += quantity
+    return freed
+
+
+def recount_seats(event_ids=None):
+    """Rebuild the denormalized counters from the Ticket and TicketHold tables."""
+    events = Event.objects.all()
+    if event_ids is not None:
+        events = events.filter(pk__in=event_ids)
+    for event_id in events.values_list('pk', flat=True).iterator():
+        with transaction.atomic():
+            Event.objects.filter(pk=event_id).update(
+                tickets_sold=Ticket.objects.filter(event_id=event_id, order__status='completed').count(),
+                tickets_reserved=TicketHold.objects.filter(event_id=event_id).aggregate(total=Sum('quantity'))['total'] or 0,
+                updated_at=timezone.now(),
+            )
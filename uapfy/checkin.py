@@ -0,0 +1,227 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import ticket_signing
+from .models import Event, Ticket
+
+
+VALID = 'valid'
+ALREADY_USED = 'already_used'
+WRONG_EVENT = 'wrong_event'
+REVOKED = 'revoked'
+NOT_FOUND = 'not_found'
+INVALID = 'invalid'
+
+
+class CheckInResult:
+    def __init__(self, status, ticket_number, checked_in_at=None, duplicate=False):
+        self.status = status
+        self.ticket_number = ticket_number
+        self.checked_in_at = checked_in_at
+        self.duplicate = duplicate
+
+    @property
+    def admitted(self):
+        return self.status == VALID
+
+    def as_dict(self):
+        return {
+            'status': self.status,
+            'ticket_number': self.ticket_number,
+            'checked_in_at': self.checked_in_at,
+            'duplicate': self.duplicate,
+        }
+
+
+def _admit(ticket_filter, at):
+    # One conditional UPDATE: of two gates scanning the same ticket, only
+    # the first one to write gets a row back.
+    return Ticket.objects.filter(is_used=False, order__status='completed', **ticket_filter).update(
+        is_used=True,
+        checked_in_at=at,
+        updated_at=timezone.now(),
+    )
+
+
+def _classify(ticket_number, event_id, at):
+    ticket = (
+        Ticket.objects.filter(ticket_number=ticket_number)
+        .values('event_id', 'is_used', 'checked_in_at', 'order__status')
+        .first()
+    )
+    if ticket is None:
+        return CheckInResult(NOT_FOUND, ticket_number)
+    if ticket['event_id'] != event_id:
+        return CheckInResult(WRONG_EVENT, ticket_number)
+    if ticket['order__status'] != 'completed':
+        return CheckInResult(REVOKED, ticket_number)
+    if ticket['is_used']:
+        # Re-sending the same offline scan is not a second entry.
+        duplicate = ticket['checked_in_at'] == at
+        return CheckInResult(VALID if duplicate else ALREADY_USED, ticket_number, ticket['checked_in_at'], duplicate)
+    return None
+
+
+def check_in(ticket_number, event_id, at=None):
+    """Admit `ticket_number` at a gate of `event_id`, straight against the database."""
+    at = at or timezone.now()
+    if _admit({'ticket_number': ticket_number, 'event_id': event_id}, at):
+        return CheckInResult(VALID, ticket_number, at)
+    return _classify(ticket_number, event_id, at) or check_in(ticket_number, event_id, at)
+
+
+# Ticket Index
+#
+# An event's tickets preloaded into memory, so "already used" and unknown
+# tickets are answered without a query and admissions are a primary-key
+# UPDATE. Tickets sold after the index was loaded fall back to check_in().
+# Only events that haven't ended are indexed, and only the INDEX_LIMIT most
+# recently scanned ones are kept.
+INDEX_LIMIT = getattr(settings, 'CHECKIN_INDEX_LIMIT', 16)
+
+
+class EventTicketIndex:
+    def __init__(self, event_id, ends_at=None):
+        self.event_id = event_id
+        self.ends_at = ends_at
+        self._lock = threading.Lock()
+        self._tickets = {}
+        self.load()
+
+    def load(self):
+        tickets = {}
+        rows = Ticket.objects.filter(event_id=self.event_id, order__status='completed').values_list(
+            'ticket_number', 'pk', 'checked_in_at',
+        )
+        for ticket_number, pk, checked_in_at in rows.iterator(chunk_size=5000):
+            tickets[ticket_number] = [pk, checked_in_at]
+        with self._lock:
+            self._tickets = tickets
+
+    def __len__(self):
+        return len(self._tickets)
+
+    def scan(self, ticket_number, at=None):
+        at = at or timezone.now()
+        with self._lock:
+            entry = self._tickets.get(ticket_number)
+            if entry is not None:
+                if entry[1] is not None:
+                    duplicate = entry[1] == at
+                    return CheckInResult(VALID if duplicate else ALREADY_USED, ticket_number, entry[1], duplicate)
+                # Claim it in memory first so a second scan here is rejected at once.
+                entry[1] = at
+
+        if entry is None:
+            result = check_in(ticket_number, self.event_id, at)
+        elif _admit({'pk': entry[0]}, at):
+            return CheckInResult(VALID, ticket_number, at)
+        else:
+            # Used at another gate process, or refunded since the index loaded.
+            result = _classify(ticket_number, self.event_id, at) or check_in(ticket_number, self.event_id, at)
+
+        with self._lock:
+            if result.status in (VALID, ALREADY_USED):
+                self._tickets[ticket_number] = [self._tickets.get(ticket_number, [None])[0], result.checked_in_at]
+            elif entry is not None:
+                self._tickets.pop(ticket_number, None)
+        return result
+
+
+_indexes = OrderedDict()  # least recently used first
+_load_locks = {}
+_indexes_lock = threading.Lock()  # guards the two dicts, never held while loading
+
+
+def _cached_index(event_id):
+    with _indexes_lock:
+        index = _indexes.get(event_id)
+        if index is not None:
+            _indexes.move_to_end(event_id)
+        return index
+
+
+def get_ticket_index(event_id):
+    """The event's ticket index, loaded on first use; None once the event has ended."""
+    index = _cached_index(event_id)
+    if index is not None:
+        return index
+    with _indexes_lock:
+        load_lock = _load_locks.setdefault(event_id, threading.Lock())
+    # Scans of other events carry on while this one loads
+    with load_lock:
+        index = _cached_index(event_id)
+        if index is not None:
+            return index
+        now = timezone.now()
+        ends_at = Event.objects.filter(pk=event_id).values_list('end_time', flat=True).first()
+        if ends_at is None or ends_at <= now:
+            return None
+        index = EventTicketIndex(event_id, ends_at)
+        with _indexes_lock:
+            for ended in [pk for pk, cached in _indexes.items() if cached.ends_at <= now]:
+                _drop(ended)
+            _indexes[event_id] = index
+            while len(_indexes) > INDEX_LIMIT:
+                _drop(next(iter(_indexes)))
+        return index
+
+
+def _drop(event_id):
+    _indexes.pop(event_id, None)
+    _load_locks.pop(event_id, None)
+
+
+def drop_ticket_index(event_id):
+    with _indexes_lock:
+        _drop(event_id)
+
+
+def scan(ticket_number, event_id, at=None):
+    if getattr(settings, 'CHECKIN_TICKET_INDEX', True):
+        index = get_ticket_index(event_id)
+        if index is not None:
+            return index.scan(ticket_number, at)
+    return check_in(ticket_number, event_id, at)
+
+
+def scan_payload(payload, event_id, at=None):
+    """Check in a signed QR payload; forged or foreign payloads never reach the database."""
+    verifier = ticket_signing.TicketVerifier(
+        event_id, ticket_signing.event_key(event_id), fallback_keys=ticket_signing.event_fallback_keys(event_id),
+    )
+    status, ticket_number = verifier.verify(payload)
+    if status != ticket_signing.VALID:
+        return CheckInResult(status, ticket_number)
+    return scan(ticket_number, event_id, at)
+
+
+def revoked_ticket_numbers(event_id):
+    """Tickets of cancelled or refunded orders, for offline verifiers."""
+    tickets = Ticket.objects.filter(event_id=event_id).exclude(order__status='completed')
+    return list(tickets.values_list('ticket_number', flat=True))
+
+
+def scan_batch(event_id, scans):
+    """Sync a batch of scans, e.g. from an offline scanner.
+
+    Each scan is a (ticket_number, payload, scanned_at) tuple with either
+    the ticket number or the signed QR payload set.
+
+    Re-sending a batch is safe: scans already recorded with the same time
+    come back as duplicates instead of "already used".
+    """
+    try:
+        with transaction.atomic():
+            return [
+                scan_payload(payload, event_id, scanned_at) if payload else scan(ticket_number, event_id, scanned_at)
+                for ticket_number, payload, scanned_at in scans
+            ]
+    except Exception:
+        # The in-memory index may hold admissions that were rolled back.
+        drop_ticket_index(event_id)
+        raise
@@ -0,0 +1,54 @@
+from django.db.models import Case, Q, Value, When
+from django.utils import timezone
+
+from . import caching
+from .models import Event
+
+
+STATUS_BATCH_SIZE = 500
+
+
+# Event Status Transitions
+#
+# Status follows from the event's dates: upcoming before start_time, ongoing
+# until end_time, completed after. Instead of saving events one by one, each
+# transition is a single UPDATE that only matches rows whose status is wrong.
+# Every filter is a range on one column of the (status, start_time) or
+# (status, end_time) index, so a run over a large table only reads the events
+# that are due; a CASE picks the final status when an event skipped a step.
+# Cancelled events are set by the organizer and never moved.
+def _status_at(now):
+    return Case(
+        When(start_time__gt=now, then=Value('upcoming')),
+        When(end_time__lt=now, then=Value('completed')),
+        default=Value('ongoing'),
+    )
+
+
+def _transitions(now):
+    return [
+        # Started since the last run (and possibly already over)
+        Q(status='upcoming', start_time__lte=now),
+        # Finished since the last run
+        Q(status='ongoing', end_time__lt=now),
+        # Dates moved later by the organizer
+        Q(status='ongoing', start_time__gt=now),
+        Q(status='completed', end_time__gte=now),
+    ]
+
+
+def advance_event_statuses(events=None, now=None):
+    """Move due events to their current status; returns the number of rows changed."""
+    events = Event.objects.all() if events is None else events
+    now = now or timezone.now()
+    status = _status_at(now)
+    changed = 0
+    for condition in _transitions(now):
+        # The due ids are read first so only those events' cached pages are invalidated
+        due = list(events.filter(condition).values_list('pk', flat=True))
+        for start in range(0, len(due), STATUS_BATCH_SIZE):
+            batch = due[start:start + STATUS_BATCH_SIZE]
+            # The condition again, in case another run moved some of them meanwhile
+            changed += events.filter(condition, pk__in=batch).update(status=status, updated_at=now)
+            caching.invalidate_events(batch)
+    return changed
@@ -0,0 +1,216 @@
+import csv
+import datetime
+import tempfile
+from io import StringIO
+
+from asgiref.sync import sync_to_async
+from django.db.models import Value
+from django.db.models.functions import Coalesce, Concat, Lower, NullIf
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Event, OrderItem, Ticket
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # optional: pip install openpyxl
+    Workbook = None
+
+
+EXPORT_CHUNK_SIZE = 2000
+TICKET_STATUSES = ('checked_in', 'not_checked_in')
+
+
+# Sales Exports
+#
+# Tickets, attendees and orders of an organizer's events as CSV (or XLSX
+# when openpyxl is installed). Rows come from values_list() through
+# .iterator(), so the database hands them over in chunks and no model
+# instances are built; the CSV is streamed as it's written and the XLSX is
+# built in a temporary file, so memory stays flat however many rows there are.
+#
+# Rows are read one event at a time, in an order the (event, ...) indexes
+# already have. A single query over all events would have to sort every
+# row first, in the database's memory or temp files.
+def _attendee_name():
+    full_name = Concat('user__first_name', Value(' '), 'user__last_name')
+    return Coalesce(NullIf('attendee_name', Value('')), full_name)
+
+
+def _attendee_email():
+    return Coalesce(NullIf('attendee_email', Value('')), 'user__email')
+
+
+EXPORTS = {
+    'tickets': {
+        'model': Ticket,
+        'date_field': 'purchased_at',
+        'ordering': ('-purchased_at', 'pk'),
+        'columns': [
+            ('Ticket number', 'ticket_number'),
+            ('Event', 'event__title'),
+            ('Purchased at', 'purchased_at'),
+            ('Checked in', 'is_used'),
+            ('Checked in at', 'checked_in_at'),
+            ('Attendee name', _attendee_name),
+            ('Attendee email', _attendee_email),
+            ('Order number', 'order__order_number'),
+            ('Order status', 'order__status'),
+        ],
+    },
+    'attendees': {
+        'model': Ticket,
+        'date_field': 'purchased_at',
+        'ordering': ('-purchased_at', 'pk'),
+        'columns': [
+            ('Name', _attendee_name),
+            ('Email', _attendee_email),
+            ('Phone', 'attendee_phone'),
+            ('Event', 'event__title'),
+            ('Ticket number', 'ticket_number'),
+            ('Checked in', 'is_used'),
+        ],
+    },
+    'orders': {
+        # One row per order item, so an order is listed once per event it covers
+        'model': OrderItem,
+        'date_field': 'order__created_at',
+        'ordering': ('pk',),
+        'columns': [
+            ('Order number', 'order__order_number'),
+            ('Status', 'order__status'),
+            ('Created at', 'order__created_at'),
+            ('Event', 'event__title'),
+            ('Quantity', 'quantity'),
+            ('Unit price', 'unit_price'),
+            ('Payment method', 'order__payment_method'),
+            ('Billing name', 'order__billing_name'),
+            ('Billing email', 'order__billing_email'),
+            ('Billing phone', 'order__billing_phone'),
+        ],
+    },
+}
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def filter_by_date(queryset, field, params):
+    """Apply ?from=YYYY-MM-DD&to=YYYY-MM-DD (inclusive) as a range on `field`.
+
+    A range on the column rather than __date, so an index on it still applies.
+    """
+    start = parse_date(params.get('from') or '')
+    end = parse_date(params.get('to') or '')
+    if start:
+        queryset = queryset.filter(**{f'{field}__gte': _day_start(start)})
+    if end:
+        queryset = queryset.filter(**{f'{field}__lt': _day_start(end + datetime.timedelta(days=1))})
+    return queryset
+
+
+def filter_tickets(queryset, params):
+    """Ticket filters shared by the ticket table and the exports.
+
+    ?q= matches an attendee email or a ticket number exactly (ignoring
+    case), so either lookup is a single index probe.
+    """
+    event = params.get('event')
+    if event and event.isdigit():
+        queryset = queryset.filter(event_id=event)
+    status = params.get('status')
+    if status in TICKET_STATUSES:
+        queryset = queryset.filter(is_used=(status == 'checked_in'))
+    query = (params.get('q') or '').strip()
+    if '@' in query:
+        queryset = queryset.alias(email=Lower('attendee_email')).filter(email=query.lower())
+    elif query:
+        queryset = queryset.filter(ticket_number=query.upper())
+    return filter_by_date(queryset, 'purchased_at', params)
+
+
+def _export_queryset(spec, params):
+    queryset = spec['model'].objects.all()
+    if spec['model'] is Ticket:
+        queryset = filter_tickets(queryset, params)
+    else:
+        event = params.get('event')
+        if event and event.isdigit():
+            queryset = queryset.filter(event_id=event)
+        if params.get('status'):
+            queryset = queryset.filter(order__status=params['status'])
+        queryset = filter_by_date(queryset, spec['date_field'], params)
+
+    expressions = {f'col{i}': column() for i, (_, column) in enumerate(spec['columns']) if callable(column)}
+    fields = [f'col{i}' if callable(column) else column for i, (_, column) in enumerate(spec['columns'])]
+    return queryset.annotate(**expressions).order_by(*spec['ordering']).values_list(*fields)
+
+
+def _rows(queryset, event_ids):
+    for event_id in event_ids:
+        yield from queryset.filter(event_id=event_id).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def export_rows(kind, organizer, params):
+    """(headers, row iterator) for export `kind` of `organizer`'s events."""
+    spec = EXPORTS[kind]
+    event_ids = list(Event.objects.filter(organizer=organizer).order_by('-created_at', 'pk').values_list('id', flat=True))
+    return [header for header, _ in spec['columns']], _rows(_export_queryset(spec, params), event_ids)
+
+
+def _cell(value, tz):
+    if isinstance(value, datetime.datetime):
+        return value.astimezone(tz).strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, bool):
+        return 'yes' if value else 'no'
+    return value
+
+
+def csv_chunks(headers, rows, rows_per_chunk=EXPORT_CHUNK_SIZE):
+    """CSV text in pieces of `rows_per_chunk` rows, for StreamingHttpResponse."""
+    # Looked up once: timezone.localtime() per cell costs more than the CSV
+    tz = timezone.get_current_timezone()
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    count = 0
+    for row in rows:
+        writer.writerow([_cell(value, tz) for value in row])
+        count += 1
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+async def aiterate(chunks):
+    """Feed a sync generator to an ASGI response one chunk at a time.
+
+    Given a sync iterator under ASGI, Django reads it to the end before
+    sending anything. Each chunk is read in the request's own thread, where
+    the database cursor lives.
+    """
+    done = object()
+    while (chunk := await sync_to_async(next)(chunks, done)) is not done:
+        yield chunk
+
+
+def xlsx_available():
+    return Workbook is not None
+
+
+def xlsx_file(headers, rows):
+    """Write the rows to a temporary .xlsx file and return it, rewound."""
+    tz = timezone.get_current_timezone()
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(headers)
+    for row in rows:
+        # Excel has no time zones; write local wall-clock time.
+        sheet.append([value.astimezone(tz).replace(tzinfo=None) if isinstance(value, datetime.datetime) else value for value in row])
+    output = tempfile.TemporaryFile(suffix='.xlsx')
+    workbook.save(output)
+    output.seek(0)
+    return output
@@ -0,0 +1,99 @@
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+
+# Widths rendered for each upload folder; never wider than the original.
+VARIANT_WIDTHS = {
+    'event_banners': (320, 640, 1280, 1920),
+    'organizer_logos': (64, 128, 256),
+}
+VARIANT_FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+
+
+# Uploaded Images
+#
+# Uploads are saved through the content-addressed media storage (see
+# uapfy.storage), so the same banner uploaded twice is one file. Resized
+# WebP and JPEG copies are rendered by the process_image background task
+# into <folder>/variants/ and recorded on the model (Event.banner_variants,
+# OrganizerProfile.logo_variants), which templates turn into srcset
+# attributes. Variants are re-encoded from pixels only, so EXIF (camera,
+# GPS) and other metadata never reach visitors.
+def store_upload(folder, upload):
+    """Save `upload` into `folder` and return the stored name."""
+    return default_storage.save(posixpath.join(folder, posixpath.basename(upload.name)), upload)
+
+
+def _flatten(image):
+    # JPEG has no alpha channel: put transparent logos on white.
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _encode(image, pil_format, options):
+    blob = BytesIO()
+    image.save(blob, pil_format, **options)
+    return blob.getvalue()
+
+
+def build_variants(name):
+    """Render the resized copies of stored image `name`.
+
+    Returns the variants as stored on the model:
+    {'width': w, 'height': h, 'webp': [[width, name], ...], 'jpeg': [...]}
+    """
+    folder = name.split('/', 1)[0]
+    widths = VARIANT_WIDTHS.get(folder, VARIANT_WIDTHS['event_banners'])
+    stem = posixpath.splitext(posixpath.basename(name))[0]
+
+    with default_storage.open(name) as source:
+        image = Image.open(source)
+        image.load()
+    image = _flatten(ImageOps.exif_transpose(image))
+
+    targets = sorted({min(width, image.width) for width in widths})
+    variants = {'width': image.width, 'height': image.height}
+    for extension, _, _ in VARIANT_FORMATS:
+        variants[extension] = []
+    for width in targets:
+        resized = image
+        if width < image.width:
+            resized = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        for extension, pil_format, options in VARIANT_FORMATS:
+            # The storage dedupes, so re-processing an image writes nothing new.
+            variant_name = default_storage.save(
+                f'{folder}/variants/{stem}-{width}.{extension}',
+                ContentFile(_encode(resized, pil_format, options)),
+            )
+            variants[extension].append([width, variant_name])
+    return variants
+
+
+class ResponsiveImage:
+    """srcset strings for a model's recorded variants."""
+
+    def __init__(self, variants):
+        self.width = variants['width']
+        self.height = variants['height']
+        self.webp = self._srcset(variants['webp'])
+        self.jpeg = self._srcset(variants['jpeg'])
+        self.src = default_storage.url(variants['jpeg'][0][1])
+
+    @staticmethod
+    def _srcset(entries):
+        return ', '.join(f'{default_storage.url(name)} {width}w' for width, name in entries)
+
+
+def responsive_image(variants):
+    return ResponsiveImage(variants) if variants else None
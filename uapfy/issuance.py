@@ -0,0 +1,85 @@
+from django.db import transaction
+from django.utils import timezone
+
+from . import caching
+from .capacity import confirm_hold, release_seats, reserve_seats
+from .models import Order, OrderItem, Ticket, generate_ticket_number
+from .popularity import record_ticket_sales
+from .rollups import record_sale, sale_day
+
+
+# Ticket issuance
+#
+# Builds every ticket of an order in memory and writes the Order, OrderItem
+# and Ticket rows in one transaction, with a single bulk INSERT for the
+# tickets instead of one save() per ticket. Only the QR payload is stored;
+# the image is rendered when the ticket is first viewed.
+# Seats are taken from the event's counters in the same transaction (or from
+# `hold` when the buyer held them first), so SoldOutError rolls everything back.
+def issue_tickets(user, event, quantity, billing, attendee, hold=None):
+    tickets = [
+        Ticket(
+            user=user,
+            event=event,
+            organizer_id=event.organizer_id,
+            ticket_number=generate_ticket_number(),
+            attendee_name=attendee.get('attendee_name'),
+            attendee_email=attendee.get('attendee_email'),
+            attendee_phone=attendee.get('attendee_phone'),
+        )
+        for _ in range(quantity)
+    ]
+
+    for ticket in tickets:
+        ticket.qr_data = ticket.build_qr_data()
+
+    total = event.ticket_price * quantity
+    with transaction.atomic():
+        if hold is not None:
+            confirm_hold(hold)
+        else:
+            reserve_seats(event, quantity)
+        record_ticket_sales(event.pk, quantity)
+        order = _create_order(user, event, quantity, total, billing, tickets)
+        record_sale(event.pk, sale_day(order), quantity, total)
+        # bulk_create sends no signals; tickets_sold and popularity changed
+        transaction.on_commit(lambda: caching.invalidate_events([event.pk]))
+    return order
+
+
+def _create_order(user, event, quantity, total, billing, tickets):
+    order = Order.objects.create(
+        user=user,
+        subtotal=total,
+        total=total,
+        status='completed',
+        **billing
+    )
+    OrderItem.objects.create(
+        order=order,
+        event=event,
+        quantity=quantity,
+        unit_price=event.ticket_price
+    )
+    for ticket in tickets:
+        ticket.order = order
+    Ticket.objects.bulk_create(tickets)
+    return order
+
+
+def cancel_order(order, status='cancelled'):
+    """Cancel or refund a completed order, giving its seats back.
+
+    Returns False when the order was not completed (e.g. already cancelled),
+    so a repeated call never releases the same seats twice.
+    """
+    with transaction.atomic():
+        if not Order.objects.filter(pk=order.pk, status='completed').update(status=status, updated_at=timezone.now()):
+            return False
+        for item in order.items.select_related('event'):
+            release_seats(item.event, item.quantity)
+            record_ticket_sales(item.event_id, -item.quantity, order.created_at)
+            record_sale(item.event_id, sale_day(order), -item.quantity, -item.get_total(), orders=-1)
+            transaction.on_commit(lambda event_id=item.event_id: caching.invalidate_events([event_id]))
+    order.status = status
+    return True
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from uapfy.event_status import advance_event_statuses
+
+
+class Command(BaseCommand):
+    help = "Move events to upcoming/ongoing/completed according to their dates."
+
+    def handle(self, *args, **options):
+        changed = advance_event_statuses()
+        self.stdout.write(f"Updated the status of {changed} event(s).")
@@ -0,0 +1,45 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from uapfy.benchmarks import benchmarks
+
+
+BENCHMARK_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class Command(BaseCommand):
+    help = "Run benchmark scenarios against a throwaway copy of the schema and report throughput and latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help="Scenarios to run; defaults to all of them.")
+        parser.add_argument('--list', action='store_true', help="List the scenarios and exit.")
+
+    def handle(self, *args, **options):
+        scenarios = benchmarks()
+        if options['list']:
+            for name, func in sorted(scenarios.items()):
+                self.stdout.write(f"{name}: {func.__doc__}")
+            return
+        names = options['names'] or sorted(scenarios)
+        unknown = [name for name in names if name not in scenarios]
+        if unknown:
+            raise CommandError(f"Unknown benchmark(s): {', '.join(unknown)}. Use --list to see them.")
+
+        # The scenarios fill tables with generated rows; never the real database
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(CACHES=BENCHMARK_CACHES):
+                for name in names:
+                    self.stdout.write(f"{name}: {scenarios[name].__doc__}")
+                    for timings in scenarios[name]():
+                        self.stdout.write(f"  {timings}")
+                    # Every scenario starts from empty tables
+                    call_command('flush', interactive=False, verbosity=0)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
@@ -0,0 +1,54 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+
+from uapfy.query_plans import DEFAULT_ROW_THRESHOLD, find_full_scans
+
+
+DEFAULT_URLS = ['/', '/allevents/', '/allevents/?q=music', '/my-tickets/', '/events/', '/organizer/tickets/', '/organizer/analytics/']
+
+
+class Command(BaseCommand):
+    help = "Request pages against the current database and report queries that scan whole large tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', action='append', dest='urls', help="Page to check (repeatable); defaults to the main pages.")
+        parser.add_argument('--user', help="Username to log in as, for organizer and ticket pages.")
+        parser.add_argument('--threshold', type=int, default=DEFAULT_ROW_THRESHOLD,
+                            help="Only report scans of tables with more rows than this.")
+
+    def handle(self, *args, **options):
+        client = Client()
+        if options['user']:
+            try:
+                client.force_login(User.objects.get(username=options['user']))
+            except User.DoesNotExist:
+                raise CommandError(f"No user named {options['user']!r}.")
+
+        setup_test_environment()
+        try:
+            problems = 0
+            failed = 0
+            for url in options['urls'] or DEFAULT_URLS:
+                # The test client's own host, which setup_test_environment() allows
+                with CaptureQueriesContext(connection) as captured:
+                    response = client.get(url)
+                if response.status_code >= 400:
+                    # An error page runs none of the page's queries, so it proves nothing
+                    self.stderr.write(f"{url}: {response.status_code}, not checked")
+                    failed += 1
+                    continue
+                scans = find_full_scans(captured.captured_queries, threshold=options['threshold'])
+                self.stdout.write(f"{url}: {response.status_code}, {len(captured)} queries, {len(scans)} full scan(s)")
+                for scan in scans:
+                    self.stderr.write(str(scan))
+                problems += len(scans)
+        finally:
+            teardown_test_environment()
+        if failed:
+            raise CommandError(f"{failed} page(s) returned an error; log in with --user for the organizer and ticket pages.")
+        if problems:
+            raise CommandError(f"{problems} full table scan(s) over the threshold.")
+        self.stdout.write("No full scans of large tables.")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from uapfy.rollups import check_rollups
+
+
+class Command(BaseCommand):
+    help = "Compare the sales rollups with the order tables and report any drift."
+
+    def handle(self, *args, **options):
+        problems = check_rollups()
+        for problem in problems:
+            self.stderr.write(problem)
+        if problems:
+            raise CommandError(f"{len(problems)} rollup mismatch(es); run rebuild_rollups to fix them.")
+        self.stdout.write("Sales rollups match the order tables.")
@@ -0,0 +1,75 @@
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from uapfy.bulk_issuance import BULK_CHUNK_SIZE, AttendeeFileError, issue_from_csv
+from uapfy.capacity import SoldOutError
+from uapfy.models import Event
+
+
+class Command(BaseCommand):
+    help = (
+        "Issue one ticket per attendee in a CSV file (name, email, phone columns), "
+        "e.g. comp tickets or partner allocations. Rerun with the same file to resume an interrupted run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('event', type=int, help="Event id.")
+        parser.add_argument('csv_file', help="Path of the attendee CSV.")
+        parser.add_argument('--user', help="Username owning the tickets (default: the event's organizer).")
+        parser.add_argument('--unit-price', default='0.00', help="Price recorded per ticket (default: 0.00).")
+        parser.add_argument('--chunk-size', type=int, default=BULK_CHUNK_SIZE, help="Tickets per order and transaction.")
+        parser.add_argument('--render-qr', action='store_true', help="Also render and store the QR images.")
+        parser.add_argument('--processes', type=int, help="QR rendering processes (default: one per CPU).")
+
+    def handle(self, *args, **options):
+        try:
+            event = Event.objects.select_related('organizer__user').get(pk=options['event'])
+        except Event.DoesNotExist:
+            raise CommandError(f"Event {options['event']} does not exist.")
+        user = event.organizer.user
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} does not exist.")
+        try:
+            unit_price = Decimal(options['unit_price'])
+        except InvalidOperation:
+            raise CommandError(f"Invalid unit price: {options['unit_price']}")
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+
+        try:
+            with open(options['csv_file'], 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            raise CommandError(f"Cannot read {options['csv_file']}: {e}")
+
+        started = time.monotonic()
+
+        def progress(done, total):
+            elapsed = time.monotonic() - started
+            self.stdout.write(f"{done}/{total} ticket(s) ({done / elapsed if elapsed else 0:.0f}/s)")
+
+        try:
+            issued, skipped = issue_from_csv(
+                event, data, user,
+                unit_price=unit_price,
+                chunk_size=options['chunk_size'],
+                render_qr=options['render_qr'],
+                processes=options['processes'],
+                progress=progress if options['verbosity'] > 0 else None,
+            )
+        except AttendeeFileError as e:
+            raise CommandError(str(e))
+        except SoldOutError:
+            raise CommandError(
+                f"Not enough seats left on event {event.pk} for the remaining tickets. "
+                "Raise max_attendees and rerun with the same file to issue the rest."
+            )
+        if skipped:
+            self.stdout.write(f"Skipped {skipped} ticket(s) already issued from this file.")
+        self.stdout.write(f"Issued {issued} ticket(s) in {time.monotonic() - started:.1f}s.")
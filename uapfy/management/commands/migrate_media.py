@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+
+from uapfy.models import Event, OrganizerProfile, Ticket
+from uapfy.storage import is_content_name, move_to_content_name
+from uapfy.tasks import process_image
+
+
+# (model, file field, has resized variants)
+MEDIA_FIELDS = (
+    (Event, 'banner', True),
+    (OrganizerProfile, 'logo', True),
+    (Ticket, 'qr_code', False),
+)
+
+
+class Command(BaseCommand):
+    help = "Move existing banners, logos and QR images into the content-addressed media storage."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source-root', default=settings.MEDIA_ROOT, help="Directory the files are in now (default: MEDIA_ROOT).")
+        parser.add_argument('--delete', action='store_true', help="Delete each source file once it has been moved.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        source = FileSystemStorage(location=options['source_root'])
+        for model, field, has_variants in MEDIA_FIELDS:
+            moved = self.migrate_field(model, field, has_variants, source, options)
+            self.stdout.write(f"{model.__name__}.{field}: moved {moved} file(s).")
+
+    def migrate_field(self, model, field, has_variants, source, options):
+        rows = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).order_by('pk')
+        moved = set()
+        last_pk = 0
+        while True:
+            # Walk by primary key, since rows are rewritten as we go
+            batch = list(rows.filter(pk__gt=last_pk).values_list('pk', field)[:options['batch_size']])
+            if not batch:
+                return len(moved)
+            last_pk = batch[-1][0]
+            for _, old_name in batch:
+                if is_content_name(old_name) or old_name in moved:
+                    continue
+                name = move_to_content_name(model, field, old_name, source, delete=options['delete'])
+                if name is None:
+                    self.stderr.write(f"Missing file: {old_name}")
+                    continue
+                if has_variants:
+                    process_image(name)
+                moved.add(old_name)
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from uapfy.models import Event, OrganizerProfile
+from uapfy.storage import move_to_content_name
+from uapfy.tasks import process_image
+
+
+class Command(BaseCommand):
+    help = "Move existing banners and logos to content-hash names and render their resized variants."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Re-process images that already have variants.")
+        parser.add_argument('--delete-replaced', action='store_true', help="Delete original files once nothing points at them.")
+
+    def handle(self, *args, **options):
+        processed = set()
+        for model, field in ((Event, 'banner'), (OrganizerProfile, 'logo')):
+            rows = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            if not options['force']:
+                rows = rows.filter(**{f'{field}_variants': {}})
+
+            for old_name in sorted(set(rows.values_list(field, flat=True))):
+                name = move_to_content_name(model, field, old_name, delete=options['delete_replaced'])
+                if name is None:
+                    self.stderr.write(f"Missing file: {old_name}")
+                    continue
+                if name != old_name:
+                    self.stdout.write(f"{old_name} -> {name}")
+                if name not in processed:
+                    process_image(name)
+                    processed.add(name)
+        self.stdout.write(f"Processed {len(processed)} image(s).")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from uapfy.popularity import rebuild_popularity
+
+
+class Command(BaseCommand):
+    help = "Recompute every event's popularity score from its tickets."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', type=int, action='append', dest='events', help="Only this event id (repeatable).")
+
+    def handle(self, *args, **options):
+        rebuild_popularity(options['events'])
+        self.stdout.write("Popularity scores rebuilt.")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from uapfy.reviews import recount_ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute every event's rating totals and average from its reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', type=int, action='append', dest='events', help="Only this event id (repeatable).")
+
+    def handle(self, *args, **options):
+        fixed = recount_ratings(options['events'])
+        self.stdout.write(f"Event ratings rebuilt; {fixed} event(s) corrected.")
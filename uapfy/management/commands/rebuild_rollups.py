@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from uapfy.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-event and daily sales rollups from the order tables."
+
+    def handle(self, *args, **options):
+        days = rebuild_rollups()
+        self.stdout.write(f"Rebuilt sales rollups ({days} event-day row(s)).")
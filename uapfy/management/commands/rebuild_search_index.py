@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from uapfy import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text event search index from the Event table."
+
+    def handle(self, *args, **options):
+        if not search.uses_fts():
+            self.stdout.write("This database has no search index to rebuild.")
+            return
+        search.rebuild_index()
+        self.stdout.write("Search index rebuilt.")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from uapfy.capacity import recount_seats, release_expired_holds
+
+
+class Command(BaseCommand):
+    help = "Return seats of expired ticket holds to their events."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recount',
+            action='store_true',
+            help="Also rebuild every event's sold/reserved counters from the ticket and hold tables.",
+        )
+
+    def handle(self, *args, **options):
+        freed = release_expired_holds()
+        self.stdout.write(f"Released {freed} held seat(s).")
+        if options['recount']:
+            recount_seats()
+            self.stdout.write("Recounted seats for all events.")
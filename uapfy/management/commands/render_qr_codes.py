@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from uapfy.models import Ticket
+
+
+class Command(BaseCommand):
+    help = "Render and store QR images ahead of time, e.g. for events printing tickets."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', type=int, action='append', dest='events', help="Only tickets of this event id (repeatable).")
+        parser.add_argument('--force', action='store_true', help="Re-render tickets that already have an image.")
+
+    def handle(self, *args, **options):
+        tickets = Ticket.objects.only('ticket_number', 'qr_data', 'qr_code', 'qr_code_etag')
+        if options['events']:
+            tickets = tickets.filter(event_id__in=options['events'])
+        if not options['force']:
+            # Images stored before qr_code_etag existed are never served, so they count as missing
+            tickets = tickets.filter(Q(qr_code='') | Q(qr_code__isnull=True) | Q(qr_code_etag=''))
+
+        rendered = 0
+        for ticket in tickets.iterator(chunk_size=500):
+            ticket.render_qr_code()
+            Ticket.objects.filter(pk=ticket.pk).update(
+                qr_code=ticket.qr_code.name, qr_code_etag=ticket.qr_code_etag, updated_at=timezone.now(),
+            )
+            rendered += 1
+        self.stdout.write(f"Rendered {rendered} QR code(s).")
@@ -0,0 +1,51 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from uapfy.tasks import HEARTBEAT_INTERVAL, claim_tasks, heartbeat, requeue_stale_tasks, run_task, schedule_periodic_tasks
+
+
+class Command(BaseCommand):
+    help = "Run queued background tasks with a pool of worker threads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help="Number of worker threads.")
+        parser.add_argument('--poll', type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is drained.")
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        running = {}  # future: task
+        last_heartbeat = time.monotonic()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            while True:
+                requeue_stale_tasks()
+                schedule_periodic_tasks()
+                # A thread that frees up gets the next task at once, instead of
+                # waiting for the slowest task of a batch
+                if len(running) < threads:
+                    for task in claim_tasks(threads - len(running)):
+                        running[pool.submit(self.run, task)] = task
+
+                if not running:
+                    if options['once']:
+                        break
+                    close_old_connections()
+                    time.sleep(options['poll'])
+                    continue
+
+                done, _ = wait(running, timeout=options['poll'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    self.stdout.write(f"{task.name} #{task.pk}: {'done' if future.result() else 'failed'}")
+                if time.monotonic() - last_heartbeat >= HEARTBEAT_INTERVAL.total_seconds():
+                    heartbeat([task.pk for task in running.values()])
+                    last_heartbeat = time.monotonic()
+
+    def run(self, task):
+        try:
+            return run_task(task)
+        finally:
+            connection.close()
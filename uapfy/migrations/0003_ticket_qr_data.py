@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:59
+
+from django.db import migrations, models
+
+
+def fill_qr_data(apps, schema_editor):
+    Ticket = apps.get_model('uapfy', 'Ticket')
+    tickets = Ticket.objects.select_related('event', 'user').only('ticket_number', 'event__title', 'user__username')
+    for ticket in tickets.iterator(chunk_size=500):
+        qr_data = f"Ticket ID: {ticket.ticket_number}\nEvent: {ticket.event.title}\n Attendee: {ticket.user.username}"
+        Ticket.objects.filter(pk=ticket.pk).update(qr_data=qr_data)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uapfy', '0002_ticket_capacity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='qr_data',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.RunPython(fill_qr_data, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:03
+
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# The original linear weight, converted to log space by 0020
+def sale_weight(at):
+    epoch = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return 2 ** ((at - epoch) / timedelta(days=getattr(settings, 'POPULARITY_HALF_LIFE_DAYS', 14)))
+
+
+def score_events(apps, schema_editor):
+    Event = apps.get_model('uapfy', 'Event')
+    Ticket = apps.get_model('uapfy', 'Ticket')
+    scores = {}
+    sold = Ticket.objects.filter(order__status='completed').values_list('event_id', 'purchased_at')
+    for event_id, purchased_at in sold.iterator():
+        scores[event_id] = scores.get(event_id, 0) + sale_weight(purchased_at)
+    for event_id, score in scores.items():
+        Event.objects.filter(pk=event_id).update(popularity=score)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uapfy', '0006_event_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='popularity',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['is_active', 'popularity', 'id'], name='event_active_popularity_idx'),
+        ),
+        migrations.RunPython(score_events, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:03
+
+import django.db.models.deletion
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    OrderItem = apps.get_model('uapfy', 'OrderItem')
+    EventSales = apps.get_model('uapfy', 'EventSales')
+    EventSalesDaily = apps.get_model('uapfy', 'EventSalesDaily')
+    rows = (
+        OrderItem.objects.filter(order__status='completed')
+        .annotate(date=TruncDate('order__created_at'))
+        .values('event_id', 'date')
+        .annotate(orders=Count('order', distinct=True), tickets=Sum('quantity'), revenue=Sum(F('quantity') * F('unit_price')))
+        .order_by()
+    )
+    totals = {}
+    for row in rows:
+        revenue = Decimal(str(row['revenue'])).quantize(Decimal('0.01'))
+        EventSalesDaily.objects.create(
+            event_id=row['event_id'], date=row['date'], orders=row['orders'], tickets_sold=row['tickets'], revenue=revenue,
+        )
+        orders, tickets, total = totals.get(row['event_id'], (0, 0, Decimal('0.00')))
+        totals[row['event_id']] = (orders + row['orders'], tickets + row['tickets'], total + revenue)
+    for event_id, (orders, tickets, revenue) in totals.items():
+        EventSales.objects.create(event_id=event_id, orders=orders, tickets_sold=tickets, revenue=revenue)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uapfy', '0007_event_popularity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventSales',
+            fields=[
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sales', serialize=False, to='uapfy.event')),
+                ('orders', models.IntegerField(default=0)),
+                ('tickets_sold', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EventSalesDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('orders', models.IntegerField(default=0)),
+                ('tickets_sold', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='uapfy.event')),
+            ],
+            options={
+                'unique_together': {('event', 'date')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
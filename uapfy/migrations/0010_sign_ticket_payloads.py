@@ -0,0 +1,29 @@
+from django.db import migrations
+
+from uapfy.ticket_signing import sign_ticket
+
+
+def sign_payloads(apps, schema_editor):
+    Ticket = apps.get_model('uapfy', 'Ticket')
+    batch = []
+    for ticket in Ticket.objects.only('event_id', 'ticket_number').iterator(chunk_size=1000):
+        ticket.qr_data = sign_ticket(ticket.event_id, ticket.ticket_number)
+        # The stored image encodes the old, unsigned payload; it is rendered
+        # again on demand from the signed one.
+        ticket.qr_code = None
+        batch.append(ticket)
+        if len(batch) == 1000:
+            Ticket.objects.bulk_update(batch, ['qr_data', 'qr_code'])
+            batch = []
+    Ticket.objects.bulk_update(batch, ['qr_data', 'qr_code'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uapfy', '0009_order_created_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(sign_payloads, migrations.RunPython.noop),
+    ]
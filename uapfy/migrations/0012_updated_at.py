@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:40
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Coalesce, Greatest
+
+
+def fill_updated_at(apps, schema_editor):
+    # Best known time of the last change instead of the migration time, so
+    # Last-Modified stays meaningful for existing rows.
+    Event = apps.get_model('uapfy', 'Event')
+    Ticket = apps.get_model('uapfy', 'Ticket')
+    Event.objects.update(updated_at=F('created_at'))
+    Ticket.objects.update(updated_at=Greatest('purchased_at', Coalesce('checked_in_at', 'purchased_at')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uapfy', '0011_event_status_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:57
+
+import django.db.models.deletion
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_ticket_organizer(apps, schema_editor):
+    Event = apps.get_model('uapfy', 'Event')
+    Ticket = apps.get_model('uapfy', 'Ticket')
+    Ticket.objects.update(organizer_id=Subquery(Event.objects.filter(pk=OuterRef('event_id')).values('organizer_id')[:1]))
+
+
+def analyze(apps, schema_editor):
+    # SQLite only picks the new indexes well with statistics, see
+    # uapfy.query_plans.update_statistics
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('PRAGMA analysis_limit=1000')
+        schema_editor.execute('ANALYZE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uapfy', '0014_lookup_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='organizer',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='uapfy.organizerprofile'),
+        ),
+        migrations.RunPython(fill_ticket_organizer, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['organizer', '-purchased_at'], name='ticket_org_purchased_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['organizer', 'is_used', '-purchased_at'], name='ticket_org_used_purchased_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(django.db.models.functions.text.Lower('attendee_email'), name='ticket_email_lower_idx'),
+        ),
+        migrations.RunPython(analyze, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:16
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_event_ratings(apps, schema_editor):
+    Event = apps.get_model('uapfy', 'Event')
+    Review = apps.get_model('uapfy', 'Review')
+    totals = Review.objects.values('event_id').annotate(total=Sum('rating'), count=Count('pk')).order_by()
+    for row in totals.iterator():
+        Event.objects.filter(pk=row['event_id']).update(
+            rating_sum=row['total'],
+            rating_count=row['count'],
+            average_rating=row['total'] / row['count'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uapfy', '0015_ticket_organizer'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='average_rating',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_event_ratings, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['average_rating', 'id'], name='event_active_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['event', '-created_at'], name='review_event_created_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:32
+
+from django.db import migrations, models
+from django.db.models import Q
+
+from uapfy.qr import qr_etag, render_qr_png
+
+
+def check_stored_qr_codes(apps, schema_editor):
+    # Keep a pre-rendered image only if it still encodes the ticket's payload;
+    # images from before 0010 carry the old unsigned one.
+    Ticket = apps.get_model('uapfy', 'Ticket')
+    tickets = Ticket.objects.exclude(Q(qr_code='') | Q(qr_code__isnull=True)).only('qr_data', 'qr_code')
+    for ticket in tickets.iterator(chunk_size=500):
+        try:
+            with ticket.qr_code.open('rb') as f:
+                current = f.read() == render_qr_png(ticket.qr_data)
+        except OSError:
+            current = False
+        if current:
+            Ticket.objects.filter(pk=ticket.pk).update(qr_code_etag=qr_etag(ticket.qr_data))
+        else:
+            Ticket.objects.filter(pk=ticket.pk).update(qr_code=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uapfy', '0016_event_rating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='qr_code_etag',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.RunPython(check_stored_qr_codes, migrations.RunPython.noop),
+    ]
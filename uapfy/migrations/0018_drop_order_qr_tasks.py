@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def drop_order_qr_tasks(apps, schema_editor):
+    # QR images are rendered on demand again; the task these rows name is gone.
+    Task = apps.get_model('uapfy', 'Task')
+    Task.objects.filter(name='render_order_qr_codes', status__in=['queued', 'running']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uapfy', '0017_ticket_qr_code_etag'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_order_qr_tasks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Log, Power
+
+
+def to_log_scale(apps, schema_editor):
+    # Scores were the plain sum of sale weights; see uapfy.popularity
+    Event = apps.get_model('uapfy', 'Event')
+    Event.objects.update(popularity=Log(2, Greatest(F('popularity'), Value(0.0)) + 1))
+
+
+def to_linear_scale(apps, schema_editor):
+    Event = apps.get_model('uapfy', 'Event')
+    Event.objects.update(popularity=Power(2, F('popularity')) - 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uapfy', '0019_task_status_finished_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(to_log_scale, to_linear_scale),
+    ]
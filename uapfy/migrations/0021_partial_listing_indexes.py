@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uapfy', '0020_popularity_log_scale'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='event',
+            name='event_active_start_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='event',
+            name='event_active_price_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='event',
+            name='event_active_popularity_idx',
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['start_time', 'id'], name='event_active_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['ticket_price', 'id'], name='event_active_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['popularity', 'id'], name='event_active_popularity_idx'),
+        ),
+    ]
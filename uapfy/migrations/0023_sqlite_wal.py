@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+# WAL is stored in the database file, so it is switched on once here rather
+# than by every new connection (which would also rewrite the file's header).
+def use_wal(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('PRAGMA journal_mode=WAL')
+
+
+def use_rollback_journal(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('PRAGMA journal_mode=DELETE')
+
+
+class Migration(migrations.Migration):
+    # SQLite can't change the journal mode inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('uapfy', '0022_task_heartbeat'),
+    ]
+
+    operations = [
+        migrations.RunPython(use_wal, use_rollback_journal),
+    ]
@@ -1,11 +1,13 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User
 from django.utils import timezone
-import qrcode
-from io import BytesIO
-from django.core.files import File
+from django.core.files.base import ContentFile
 import uuid
 from decimal import Decimal
+from .images import responsive_image
+from .qr import qr_etag, render_qr_png
+from .ticket_signing import sign_ticket
 
 
 # User Profile
@@ -25,11 +27,16 @@ class OrganizerProfile(models.Model):
     organization_address = models.TextField(blank=True, null=True)
     contact_number = models.CharField(max_length=15, blank=True, null=True)
     logo = models.ImageField(upload_to='organizer_logos/', blank=True, null=True)
+    logo_variants = models.JSONField(default=dict, blank=True)  # filled by the process_image task
     description = models.TextField(blank=True, null=True)
 
     def __str__(self):
         return self.organization_name or self.user.username
 
+    @property
+    def logo_image(self):
+        return responsive_image(self.logo_variants)
+
 # Event Category
 class EventCategory(models.Model):
     name = models.CharField(max_length=100)
@@ -51,6 +58,7 @@ class Event(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField()
     banner = models.ImageField(upload_to='event_banners/', blank=True, null=True)
+    banner_variants = models.JSONField(default=dict, blank=True)  # filled by the process_image task
     location = models.CharField(max_length=255)
     venue_address = models.TextField(blank=True, null=True)
     start_time = models.DateTimeField()
@@ -61,21 +69,81 @@ class Event(models.Model):
     status = models.CharField(max_length=20, choices=EVENT_STATUS_CHOICES, default='upcoming')
     featured = models.BooleanField(default=False)
     max_attendees = models.PositiveIntegerField(default=0)  # 0 means unlimited
+    tickets_sold = models.PositiveIntegerField(default=0)
+    tickets_reserved = models.PositiveIntegerField(default=0)  # seats held by unexpired TicketHolds
     ticket_price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00) 
+    popularity = models.FloatField(default=0)  # log2 of 1 + decayed ticket sales, see uapfy.popularity
+    rating_sum = models.PositiveIntegerField(default=0)  # kept by uapfy.reviews
+    rating_count = models.PositiveIntegerField(default=0)
+    average_rating = models.FloatField(default=0)  # rating_sum / rating_count, 0 without reviews
+    updated_at = models.DateTimeField(auto_now=True)  # also set by every queryset update()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the public listing, one per sort order.
+            # Partial, because filter(is_active=True) is a bare WHERE is_active on
+            # SQLite, which can't seek a leading is_active column to keep the order
+            models.Index(fields=['start_time', 'id'], condition=models.Q(is_active=True), name='event_active_start_idx'),
+            models.Index(fields=['ticket_price', 'id'], condition=models.Q(is_active=True), name='event_active_price_idx'),
+            models.Index(fields=['popularity', 'id'], condition=models.Q(is_active=True), name='event_active_popularity_idx'),
+            models.Index(fields=['average_rating', 'id'], condition=models.Q(is_active=True), name='event_active_rating_idx'),
+            # Scheduled status transitions, see uapfy.event_status
+            models.Index(fields=['status', 'start_time'], name='event_status_start_idx'),
+            models.Index(fields=['status', 'end_time'], name='event_status_end_idx'),
+            # Organizer's event list, newest first
+            models.Index(fields=['organizer', '-created_at'], name='event_organizer_created_idx'),
+        ]
     
+    # Changed only by conditional UPDATEs (uapfy.capacity, uapfy.popularity,
+    # uapfy.reviews); a save of an instance loaded before a sale would write
+    # the old numbers back and reopen sold seats.
+    COUNTER_FIELDS = ('tickets_sold', 'tickets_reserved', 'popularity', 'rating_sum', 'rating_count', 'average_rating')
+
     def __str__(self):
         return self.title
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        event = super().from_db(db, field_names, values)
+        # The organizer its tickets carry a copy of, so a save that moves the
+        # event can move them too (see uapfy.signals)
+        if 'organizer_id' in field_names:
+            event._saved_organizer_id = event.organizer_id
+        return event
+
+    @property
+    def banner_image(self):
+        return responsive_image(self.banner_variants)
         
     def update_status(self):
-        now = timezone.now()
-        if self.start_time and self.end_time:
-            if now < self.start_time:
-                self.status = 'upcoming'
-            elif self.start_time <= now <= self.end_time:
-                self.status = 'ongoing'
-            elif now > self.end_time:
-                self.status = 'completed'
-            self.save()
+        # Same set-based transition the scheduled job runs for every event
+        from .event_status import advance_event_statuses
+        advance_event_statuses(Event.objects.filter(pk=self.pk))
+        self.refresh_from_db(fields=['status'])
+
+
+# Ticket Hold Model
+class TicketHold(models.Model):
+    event = models.ForeignKey(Event, related_name='holds', on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.quantity} held for {self.event.title}"
+
+    def is_expired(self):
+        return timezone.now() >= self.expires_at
 
 
 # Order Model
@@ -107,6 +175,13 @@ class Order(models.Model):
     billing_email = models.EmailField()
     billing_phone = models.CharField(max_length=20)
     billing_address = models.TextField()
+
+    class Meta:
+        indexes = [
+            # Minute/hour sales series scan completed orders by time
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+            models.Index(fields=['user', 'status'], name='order_user_status_idx'),
+        ]
     
     def __str__(self):
         return self.order_number
@@ -137,44 +212,104 @@ class OrderItem(models.Model):
         return self.quantity * self.unit_price
 
 # Ticket Model
+def generate_ticket_number():
+    return f"TKT-{uuid.uuid4().hex[:12].upper()}"
+
+
 class Ticket(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     event = models.ForeignKey(Event, on_delete=models.CASCADE)
+    # Copy of event.organizer, so an organizer's tickets across all events
+    # can be paged through one index (see organizer_tickets)
+    organizer = models.ForeignKey(OrganizerProfile, null=True, editable=False, db_index=False, on_delete=models.CASCADE, related_name='+')
     order = models.ForeignKey(Order, related_name='tickets', on_delete=models.CASCADE)
     ticket_number = models.CharField(max_length=255, unique=True, editable=False, db_index=True)
     purchased_at = models.DateTimeField(auto_now_add=True)
-    qr_code = models.ImageField(upload_to='qr_codes/', blank=True, null=True)
+    qr_code = models.ImageField(upload_to='qr_codes/', blank=True, null=True)  # only set when pre-rendered
+    # qr_etag of the payload qr_code was rendered from; any other image is ignored
+    qr_code_etag = models.CharField(max_length=64, blank=True, default='', editable=False)
+    qr_data = models.TextField(blank=True, default='')
     is_used = models.BooleanField(default=False)
     checked_in_at = models.DateTimeField(null=True, blank=True)
     attendee_name = models.CharField(max_length=255, blank=True, null=True)
     attendee_email = models.EmailField(blank=True, null=True)
     attendee_phone = models.CharField(max_length=20, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)  # also set by every queryset update()
+
+    class Meta:
+        indexes = [
+            # My Tickets and the organizer ticket lists, newest first
+            models.Index(fields=['user', '-purchased_at'], name='ticket_user_purchased_idx'),
+            models.Index(fields=['event', '-purchased_at'], name='ticket_event_purchased_idx'),
+            # Checked-in / remaining counts per event
+            models.Index(fields=['event', 'is_used'], name='ticket_event_used_idx'),
+            # Organizer ticket table, unfiltered and by check-in state
+            models.Index(fields=['organizer', '-purchased_at'], name='ticket_org_purchased_idx'),
+            models.Index(fields=['organizer', 'is_used', '-purchased_at'], name='ticket_org_used_purchased_idx'),
+            # Attendee search by email, case-insensitive
+            models.Index(Lower('attendee_email'), name='ticket_email_lower_idx'),
+        ]
     
     def __str__(self):
         return f"{self.ticket_number} - {self.event.title}"
     
     def save(self, *args, **kwargs):
         if not self.ticket_number:
-            self.ticket_number = f"TKT-{uuid.uuid4().hex[:12].upper()}"
+            self.ticket_number = generate_ticket_number()
+
+        if self.organizer_id is None:
+            self.organizer_id = self.event.organizer_id
             
-        if not self.qr_code:
-            qr_data = f"Ticket ID: {self.ticket_number}\nEvent: {self.event.title}\n Attendee: {self.user.username}"
-            qr_img = qrcode.make(qr_data)
-            blob = BytesIO()
-            qr_img.save(blob, 'PNG')
-            self.qr_code.save(f'{self.ticket_number}_qr.png', File(blob), save=False)
+        if not self.qr_data:
+            self.qr_data = self.build_qr_data()
             
         super().save(*args, **kwargs)
+
+    def build_qr_data(self):
+        return sign_ticket(self.event_id, self.ticket_number)
+
+    def render_qr_code(self):
+        # QR images are normally rendered on demand by the ticket_qr view;
+        # this stores a file for tickets that need one ahead of time.
+        self.qr_code.save(f'{self.ticket_number}_qr.png', ContentFile(render_qr_png(self.qr_data)), save=False)
+        self.qr_code_etag = qr_etag(self.qr_data)
         
     def check_in(self):
-        if not self.is_used:
+        # Conditional UPDATE, so two scanners can't both admit the same ticket
+        now = timezone.now()
+        if Ticket.objects.filter(pk=self.pk, is_used=False).update(is_used=True, checked_in_at=now, updated_at=now):
             self.is_used = True
-            self.checked_in_at = timezone.now()
-            self.save()
+            self.checked_in_at = now
             return True
         return False
 
 
+# Sales Rollup Models
+# Maintained by uapfy.rollups as orders complete or are cancelled/refunded
+class EventSales(models.Model):
+    event = models.OneToOneField(Event, primary_key=True, related_name='sales', on_delete=models.CASCADE)
+    orders = models.IntegerField(default=0)
+    tickets_sold = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.event.title}: {self.tickets_sold} tickets"
+
+
+class EventSalesDaily(models.Model):
+    event = models.ForeignKey(Event, related_name='daily_sales', on_delete=models.CASCADE)
+    date = models.DateField()
+    orders = models.IntegerField(default=0)
+    tickets_sold = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('event', 'date')
+
+    def __str__(self):
+        return f"{self.event.title} on {self.date}: {self.tickets_sold} tickets"
+
+
 # Reviews Model
 class Review(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -186,6 +321,54 @@ class Review(models.Model):
     
     class Meta:
         unique_together = ('user', 'event')
+        indexes = [
+            # An event's reviews, newest first
+            models.Index(fields=['event', '-created_at'], name='review_event_created_idx'),
+        ]
         
     def __str__(self):
         return f"{self.user.username}'s review for {self.event.title}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        review = super().from_db(db, field_names, values)
+        # What the event's rating totals count for this review, so a save
+        # can apply the difference (see uapfy.reviews)
+        if 'event_id' in field_names and 'rating' in field_names:
+            review._counted = (review.event_id, review.rating)
+        return review
+
+
+# Background Task Model
+class Task(models.Model):
+    TASK_STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    idempotency_key = models.CharField(max_length=255, unique=True, blank=True, null=True)
+    status = models.CharField(max_length=20, choices=TASK_STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # touched by the worker while the task runs
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at']),
+            # Finished tasks pile up; workers only ever look for queued ones
+            models.Index(fields=['run_at'], condition=models.Q(status='queued'), name='task_queued_run_at_idx'),
+            # Latency sample and pruning of finished tasks, see uapfy.tasks
+            models.Index(fields=['status', 'finished_at'], name='task_status_finished_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
@@ -0,0 +1,133 @@
+import base64
+import datetime
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+COUNT_CACHE_TIMEOUT = 60 * 5
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+# Keyset Pagination
+#
+# Pages are addressed by the sort key of the last row shown instead of an
+# OFFSET, so every page is an indexed range scan that costs the same no
+# matter how deep the user scrolls.
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder drops microseconds, which would skip or repeat rows.
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.is_first = cursor is None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _split(ordering):
+    return [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+
+def encode_cursor(obj, ordering):
+    values = [getattr(obj, name) for name, _ in _split(ordering)]
+    raw = json.dumps(values, cls=CursorEncoder).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, model, ordering):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    keys = _split(ordering)
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise InvalidCursor(cursor)
+
+    decoded = []
+    for (name, _), value in zip(keys, values):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Annotations (counts, ranks) are plain JSON numbers.
+            decoded.append(value)
+            continue
+        try:
+            decoded.append(field.to_python(value))
+        except ValidationError:
+            raise InvalidCursor(cursor)
+    return decoded
+
+
+def _after(ordering, values):
+    # (a, b) > (x, y)  ==  a > x OR (a = x AND b > y), per column direction.
+    condition = Q()
+    equal = Q()
+    for (name, descending), value in zip(_split(ordering), values):
+        lookup = 'lt' if descending else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    # Redundant a >= x, so the database can start an index range at the
+    # cursor; an OR alone makes it read every row before it.
+    (name, descending), value = _split(ordering)[0], values[0]
+    if value is None:
+        return condition
+    return Q(**{f"{name}__{'lte' if descending else 'gte'}": value}) & condition
+
+
+def keyset_paginate(queryset, ordering, cursor=None, per_page=12):
+    """Return the page of `queryset` that follows `cursor`.
+
+    `ordering` must end with a unique column (normally the primary key) so
+    that every row has a distinct position. An invalid cursor starts over
+    at the first page.
+    """
+    if cursor:
+        try:
+            queryset = queryset.filter(_after(ordering, decode_cursor(cursor, queryset.model, ordering)))
+        except InvalidCursor:
+            cursor = None
+
+    rows = list(queryset.order_by(*ordering)[:per_page + 1])
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1], ordering)
+    return KeysetPage(rows, next_cursor, cursor)
+
+
+def cached_count(queryset, timeout=COUNT_CACHE_TIMEOUT):
+    """COUNT(*) of `queryset`, cached for a few minutes per distinct query."""
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+    except EmptyResultSet:
+        # e.g. id__in=[] when a search matched nothing
+        return 0
+    key = 'count:' + hashlib.sha1(f'{sql}{params}'.encode()).hexdigest()
+    total = cache.get(key)
+    if total is None:
+        total = queryset.count()
+        cache.set(key, total, timeout)
+    return total
@@ -0,0 +1,67 @@
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest, Log, Power
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
+
+from .models import Event, Ticket
+
+
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+HALF_LIFE = timedelta(days=getattr(settings, 'POPULARITY_HALF_LIFE_DAYS', 14))
+ROUNDING_ERROR = 2.0 ** -40
+
+
+# Event Popularity
+#
+# A forward-decayed ticket count: a ticket sold at time t weighs
+# 2 ** sale_exponent(t), so newer sales weigh more, and since all weights
+# grow at the same rate, ordering by the total always matches ordering by
+# sales decayed to "now" without ever rewriting old rows.
+#
+# The weights double every half-life and would overflow a float within
+# decades, so Event.popularity stores log2(1 + total) instead: it grows by
+# one per half-life and is 0 for an event without sales. Sales are added in
+# log space, scaled by the larger of the two exponents so neither side of
+# the sum overflows.
+def sale_exponent(at):
+    return (at - EPOCH) / HALF_LIFE
+
+
+def record_ticket_sales(event_id, quantity, at=None):
+    """Add `quantity` tickets sold at `at` (negative to cancel them)."""
+    now = timezone.now()
+    exponent = Value(sale_exponent(at or now))
+    top = Greatest(F('popularity'), exponent)
+    total = Power(2, F('popularity') - top) + quantity * Power(2, exponent - top)
+    # What cancelled sales leave behind below ROUNDING_ERROR (of the largest
+    # weight) is rounding error, possibly zero or less, where there is no
+    # logarithm; that is a score of 0. Any drift goes with rebuild_popularity.
+    score = Case(
+        When(GreaterThan(total, ROUNDING_ERROR), then=Greatest(top + Log(2, total), Value(0.0))),
+        default=Value(0.0),
+    )
+    Event.objects.filter(pk=event_id).update(popularity=score, updated_at=now)
+
+
+def popularity_score(sold_at):
+    """The stored score of tickets sold at the times in `sold_at`."""
+    exponents = [sale_exponent(at) for at in sold_at]
+    top = max([0, *exponents])
+    return top + math.log2(2 ** -top + sum(2 ** (exponent - top) for exponent in exponents))
+
+
+def rebuild_popularity(event_ids=None):
+    """Recompute the scores from the Ticket table to correct any drift."""
+    events = Event.objects.all()
+    if event_ids is not None:
+        events = events.filter(pk__in=event_ids)
+    for event_id in events.values_list('pk', flat=True).iterator():
+        sold_at = Ticket.objects.filter(event_id=event_id, order__status='completed').values_list('purchased_at', flat=True)
+        score = popularity_score(sold_at.iterator())
+        with transaction.atomic():
+            Event.objects.filter(pk=event_id).update(popularity=score, updated_at=timezone.now())
@@ -0,0 +1,78 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import qrcode
+from django.conf import settings
+
+
+def qr_etag(payload):
+    # Rendering is deterministic, so the payload digest identifies the image.
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def render_qr_png(payload):
+    blob = BytesIO()
+    qrcode.make(payload).save(blob, 'PNG')
+    return blob.getvalue()
+
+
+# QR Image Cache
+#
+# Rendered PNGs keyed by payload digest, evicted least recently used first
+# once the total size passes `max_bytes`.
+class QRCodeCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def set(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._items[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def __len__(self):
+        return len(self._items)
+
+
+qr_cache = QRCodeCache(getattr(settings, 'QR_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+
+
+def get_qr_png(payload, stored_file=None, stored_etag=''):
+    """Return the PNG for `payload`, rendering it only on a cache miss.
+
+    `stored_file` is a pre-rendered image (see the render_qr_codes command)
+    that is read instead of rendering when it was rendered from `payload`,
+    i.e. `stored_etag` is the payload's qr_etag.
+    """
+    key = qr_etag(payload)
+    data = qr_cache.get(key)
+    if data is None:
+        if stored_file and stored_etag == key:
+            try:
+                with stored_file.open('rb') as f:
+                    data = f.read()
+            except OSError:
+                data = None
+        if data is None:
+            data = render_qr_png(payload)
+        qr_cache.set(key, data)
+    return key, data
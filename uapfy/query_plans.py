@@ -0,0 +1,170 @@
+import json
+import re
+from contextlib import contextmanager
+
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.test.utils import CaptureQueriesContext
+
+
+DEFAULT_ROW_THRESHOLD = 1000
+
+# Django aliases tables in joins and subqueries: "uapfy_event" U0, "uapfy_event" T3
+_ALIAS_RE = re.compile(r'"(\w+)" (?:AS )?"?([A-Z]\d+)"?')
+# "SCAN t", "SCAN t USING INDEX i", "SCAN t USING COVERING INDEX i": no
+# constraint, so every row (or index entry) is read. SEARCH lines seek.
+_SQLITE_SCAN_RE = re.compile(r'^SCAN (\w+)(?: USING (?:COVERING )?INDEX \w+)?$')
+_SQLITE_INDEX_WALK_RE = re.compile(r'^SCAN \w+ USING (?:COVERING )?INDEX ')
+_SQLITE_TABLE_RE = re.compile(r'^(?:SCAN|SEARCH) (\w+)(?! VIRTUAL TABLE)\b')
+_SQLITE_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+_LIMIT_RE = re.compile(r'\bLIMIT \d+', re.IGNORECASE)
+_TRAILING_LIMIT_RE = re.compile(r'\s+LIMIT \d+(?:\s+OFFSET \d+)?\s*$', re.IGNORECASE)
+
+
+class FullScanError(AssertionError):
+    pass
+
+
+# Query Plan Checks
+#
+# For tests: run EXPLAIN on every SELECT a block of code issues and fail
+# when one of them reads a whole table that has more than `threshold` rows,
+# or sorts more than `threshold` rows instead of reading them in index
+# order. Small tables (categories, a test fixture's handful of events) are
+# fine to scan, so the threshold keeps the check about the tables that
+# grow. COUNT(*) queries read every matching row by nature; their results
+# are cached instead (see uapfy.pagination).
+#
+#     with assert_indexed(threshold=500):
+#         client.get(reverse('event_view'))
+def explain(connection, sql, params):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            return cursor.fetchone()[0]
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def _postgres_seq_scans(node):
+    if node.get('Node Type') == 'Seq Scan':
+        yield node['Relation Name']
+    for child in node.get('Plans', []):
+        yield from _postgres_seq_scans(child)
+
+
+def scanned_tables(connection, sql, plan):
+    """Names of the tables `plan` reads in full, without an index."""
+    if connection.vendor == 'postgresql':
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return sorted(set(_postgres_seq_scans(plan[0]['Plan'])))
+
+    aliases = {alias: table for table, alias in _ALIAS_RE.findall(sql)}
+    lines = [line.strip() for line in plan]
+    sorted_rows = _SQLITE_SORT in lines
+    tables = set()
+    for line in lines:
+        match = _SQLITE_SCAN_RE.match(line)
+        # An index walked in ORDER BY order under a LIMIT stops after the
+        # page's rows; any other scan reads them all.
+        if match and not (_SQLITE_INDEX_WALK_RE.match(line) and not sorted_rows and _LIMIT_RE.search(sql)):
+            tables.add(aliases.get(match.group(1), match.group(1)))
+    return sorted(tables)
+
+
+def sorted_table(connection, sql, plan):
+    """The table whose rows `plan` sorts in a temporary B-tree, or None."""
+    if connection.vendor != 'sqlite':
+        return None
+    lines = [line.strip() for line in plan]
+    if _SQLITE_SORT not in lines:
+        return None
+    aliases = {alias: table for table, alias in _ALIAS_RE.findall(sql)}
+    for line in lines:
+        match = _SQLITE_TABLE_RE.match(line)
+        if match:
+            return aliases.get(match.group(1), match.group(1))
+    return None
+
+
+def _matching_rows(connection, sql):
+    """How many rows `sql` finds before its LIMIT, i.e. how many it sorts."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) FROM ({_TRAILING_LIMIT_RE.sub("", sql)})')
+        return cursor.fetchone()[0]
+
+
+class FullScan:
+    def __init__(self, table, rows, sql, plan, sort=False):
+        self.table = table
+        self.rows = rows
+        self.sql = sql
+        self.plan = plan
+        self.sort = sort
+
+    def __str__(self):
+        action = 'Sort of' if self.sort else 'Full scan of'
+        return f"{action} {self.table} ({self.rows} rows):\n  {self.sql}\n  plan: {self.plan}"
+
+
+def _is_count(sql):
+    return sql.lstrip().upper().startswith('SELECT COUNT(*)')
+
+
+def find_full_scans(queries, using=DEFAULT_DB_ALIAS, threshold=DEFAULT_ROW_THRESHOLD):
+    """Full table scans and sorts over more than `threshold` rows in captured `queries`."""
+    connection = connections[using]
+    table_names = set(connection.introspection.table_names())
+    row_counts = {}
+    found = []
+    for query in queries:
+        sql = query['sql']
+        if not sql.lstrip().upper().startswith('SELECT') or _is_count(sql):
+            continue
+        # Captured SQL has its parameters inlined already
+        plan = explain(connection, sql, None)
+        for table in scanned_tables(connection, sql, plan):
+            if table not in table_names:
+                continue  # subquery results, CTEs, FTS virtual tables
+            if table not in row_counts:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+                    row_counts[table] = cursor.fetchone()[0]
+            if row_counts[table] > threshold:
+                found.append(FullScan(table, row_counts[table], sql, plan))
+        # Sorting a handful of search matches is fine; sorting the table isn't
+        table = sorted_table(connection, sql, plan)
+        if table in table_names:
+            rows = _matching_rows(connection, sql)
+            if rows > threshold:
+                found.append(FullScan(table, rows, sql, plan, sort=True))
+    return found
+
+
+@contextmanager
+def assert_indexed(using=DEFAULT_DB_ALIAS, threshold=DEFAULT_ROW_THRESHOLD):
+    with CaptureQueriesContext(connections[using]) as captured:
+        yield captured
+    scans = find_full_scans(captured.captured_queries, using, threshold)
+    if scans:
+        raise FullScanError('\n\n'.join(str(scan) for scan in scans))
+
+
+# Planner Statistics
+#
+# SQLite keeps no statistics unless ANALYZE runs. Without them, given
+# ORDER BY ... LIMIT it prefers whichever index avoids the sort, even when
+# another index would find the one matching row directly (the organizer
+# ticket table searched by email walked every ticket). PostgreSQL's
+# autovacuum keeps its own statistics, so this only runs on SQLite.
+ANALYSIS_LIMIT = 1000  # rows sampled per index: milliseconds for any table size
+
+
+def update_statistics(using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(f'PRAGMA analysis_limit={ANALYSIS_LIMIT}')
+        cursor.execute('ANALYZE')
+    return True
@@ -0,0 +1,117 @@
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import Event, Review, Ticket
+
+
+RATINGS = range(1, 6)
+
+
+class ReviewNotAllowed(Exception):
+    pass
+
+
+# Event Ratings
+#
+# Event.rating_sum and Event.rating_count are only ever changed by relative
+# UPDATEs, issued by the Review signal handlers in the same transaction as
+# the review itself, and average_rating is recomputed in the same statement.
+# Listings sort and filter on the stored average through an index, and no
+# page has to run Avg() over an event's reviews.
+def record_rating(event_id, rating, count):
+    """Add `rating` stars over `count` reviews (negative to take them back out)."""
+    Event.objects.filter(pk=event_id).update(
+        rating_sum=F('rating_sum') + rating,
+        rating_count=F('rating_count') + count,
+        # Every expression sees the row as it was before this UPDATE
+        average_rating=Case(
+            When(rating_count=-count, then=Value(0.0)),
+            default=Cast(F('rating_sum') + rating, FloatField()) / (F('rating_count') + count),
+        ),
+        updated_at=timezone.now(),
+    )
+
+
+def review_saved(review, created):
+    counted = getattr(review, '_counted', None)
+    if created:
+        record_rating(review.event_id, review.rating, 1)
+    elif counted is None:
+        # Saved over a row this instance never loaded; the old rating is unknown.
+        recount_ratings([review.event_id])
+    elif counted[0] != review.event_id:
+        record_rating(counted[0], -counted[1], -1)
+        record_rating(review.event_id, review.rating, 1)
+    elif counted[1] != review.rating:
+        record_rating(review.event_id, review.rating - counted[1], 0)
+    review._counted = (review.event_id, review.rating)
+
+
+def review_deleted(review):
+    event_id, rating = getattr(review, '_counted', (review.event_id, review.rating))
+    record_rating(event_id, -rating, -1)
+
+
+def can_review(user, event):
+    """Attendees holding a ticket may review an event; its organizer may not."""
+    if user.pk == event.organizer.user_id:
+        return False
+    return Ticket.objects.filter(user=user, event=event).exists()
+
+
+def save_review(user, event, rating, comment):
+    """Create or update `user`'s review of `event`. Returns (review, created)."""
+    if rating not in RATINGS:
+        raise ValueError(f"Rating must be between {RATINGS[0]} and {RATINGS[-1]}.")
+    if not can_review(user, event):
+        raise ReviewNotAllowed(event.pk)
+    with transaction.atomic():
+        # Locked, so two submissions can't both apply the difference to the same old rating
+        review = Review.objects.select_for_update().filter(user=user, event=event).first()
+        created = review is None
+        if created:
+            review = Review(user=user, event=event)
+        review.rating = rating
+        review.comment = comment
+        review.save()
+    return review, created
+
+
+def delete_review(user, event):
+    with transaction.atomic():
+        review = Review.objects.select_for_update().filter(user=user, event=event).first()
+        if review is None:
+            return False
+        review.delete()
+    return True
+
+
+def recount_ratings(event_ids=None):
+    """Correct any drift in the rating totals from the Review table. Returns the number of events fixed."""
+    events = Event.objects.all()
+    reviews = Review.objects.all()
+    if event_ids is not None:
+        events = events.filter(pk__in=event_ids)
+        reviews = reviews.filter(event_id__in=event_ids)
+    # One grouped pass to find the events that drifted; only those are rewritten (and their pages invalidated)
+    counted = {
+        row['event']: (row['total'], row['count'])
+        for row in reviews.values('event').annotate(total=Sum('rating'), count=Count('pk')).order_by()
+    }
+    fixed = 0
+    for event_id, rating_sum, rating_count in events.values_list('pk', 'rating_sum', 'rating_count').iterator():
+        if counted.get(event_id, (0, 0)) == (rating_sum, rating_count):
+            continue
+        with transaction.atomic():
+            totals = Review.objects.filter(event_id=event_id).aggregate(total=Sum('rating'), count=Count('pk'))
+            total, count = totals['total'] or 0, totals['count']
+            Event.objects.filter(pk=event_id).update(
+                rating_sum=total,
+                rating_count=count,
+                average_rating=total / count if count else 0,
+                updated_at=timezone.now(),
+            )
+        fixed += 1
+    return fixed
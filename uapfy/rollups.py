@@ -0,0 +1,156 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import Trunc, TruncDate
+from django.utils import timezone
+
+from .models import EventSales, EventSalesDaily, OrderItem
+
+
+# Sales Rollups
+#
+# Per-event and per-event-per-day totals of completed orders, updated in the
+# same transaction as the order itself so analytics read a handful of rows
+# instead of aggregating every ticket. Revenue is counted per order item,
+# never per ticket, so multi-ticket orders are not counted several times.
+def record_sale(event_id, day, tickets, revenue, orders=1):
+    """Add a sale to the rollups; negative values take a cancelled one back out."""
+    changes = {
+        'orders': F('orders') + orders,
+        'tickets_sold': F('tickets_sold') + tickets,
+        'revenue': F('revenue') + revenue,
+    }
+    for model, key in ((EventSales, {'event_id': event_id}), (EventSalesDaily, {'event_id': event_id, 'date': day})):
+        if model.objects.filter(**key).update(**changes):
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.create(orders=orders, tickets_sold=tickets, revenue=revenue, **key)
+        except IntegrityError:
+            # Created by a concurrent sale in the meantime.
+            model.objects.filter(**key).update(**changes)
+
+
+def sale_day(order):
+    return timezone.localdate(order.created_at)
+
+
+def compute_daily_sales():
+    """Aggregate the raw order tables into {(event_id, date): (orders, tickets, revenue)}."""
+    rows = (
+        OrderItem.objects.filter(order__status='completed')
+        .annotate(date=TruncDate('order__created_at'))
+        .values('event_id', 'date')
+        .annotate(
+            orders=Count('order', distinct=True),
+            tickets=Sum('quantity'),
+            revenue=Sum(F('quantity') * F('unit_price')),
+        )
+        .order_by()
+    )
+    return {
+        (row['event_id'], row['date']): (row['orders'], row['tickets'], Decimal(str(row['revenue'])).quantize(Decimal('0.01')))
+        for row in rows
+    }
+
+
+def _event_totals(daily):
+    totals = {}
+    for (event_id, _), (orders, tickets, revenue) in daily.items():
+        o, t, r = totals.get(event_id, (0, 0, Decimal('0.00')))
+        totals[event_id] = (o + orders, t + tickets, r + revenue)
+    return totals
+
+
+def rebuild_rollups():
+    daily = compute_daily_sales()
+    with transaction.atomic():
+        EventSalesDaily.objects.all().delete()
+        EventSales.objects.all().delete()
+        EventSalesDaily.objects.bulk_create(
+            EventSalesDaily(event_id=event_id, date=day, orders=orders, tickets_sold=tickets, revenue=revenue)
+            for (event_id, day), (orders, tickets, revenue) in daily.items()
+        )
+        EventSales.objects.bulk_create(
+            EventSales(event_id=event_id, orders=orders, tickets_sold=tickets, revenue=revenue)
+            for event_id, (orders, tickets, revenue) in _event_totals(daily).items()
+        )
+    return len(daily)
+
+
+def check_rollups():
+    """Compare the rollups with the raw tables. Returns a list of mismatch descriptions."""
+    expected_daily = compute_daily_sales()
+    expected_totals = _event_totals(expected_daily)
+    zero = (0, 0, Decimal('0.00'))
+    problems = []
+
+    stored_daily = {
+        (row.event_id, row.date): (row.orders, row.tickets_sold, row.revenue)
+        for row in EventSalesDaily.objects.all()
+    }
+    for key in sorted(set(expected_daily) | set(stored_daily)):
+        expected, stored = expected_daily.get(key, zero), stored_daily.get(key, zero)
+        if expected != stored:
+            problems.append(f"event {key[0]} on {key[1]}: expected {expected}, stored {stored}")
+
+    stored_totals = {
+        row.event_id: (row.orders, row.tickets_sold, row.revenue)
+        for row in EventSales.objects.all()
+    }
+    for event_id in sorted(set(expected_totals) | set(stored_totals)):
+        expected, stored = expected_totals.get(event_id, zero), stored_totals.get(event_id, zero)
+        if expected != stored:
+            problems.append(f"event {event_id} total: expected {expected}, stored {stored}")
+    return problems
+
+
+# Sales Time Series
+SERIES_BUCKETS = {
+    'minute': timedelta(minutes=1),
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+}
+MAX_SERIES_POINTS = 5000
+
+
+def sales_series(events, start, end, bucket):
+    """Tickets and revenue per event and `bucket` for sales in [start, end).
+
+    Day and week buckets are summed from the daily rollups, so partial days
+    at either end count whole; minute and hour buckets are grouped in the
+    database from the completed order items.
+    Returns {event_id: [(bucket_start, tickets, revenue), ...]}.
+    """
+    if bucket in ('day', 'week'):
+        rows = (
+            EventSalesDaily.objects.filter(
+                event__in=events,
+                date__gte=timezone.localdate(start),
+                date__lt=timezone.localdate(end - timedelta(microseconds=1)) + timedelta(days=1),
+            )
+            .annotate(bucket=Trunc('date', bucket, output_field=DateField()))
+            .values('event_id', 'bucket')
+            .annotate(tickets=Sum('tickets_sold'), revenue=Sum('revenue'))
+        )
+    else:
+        rows = (
+            OrderItem.objects.filter(
+                event__in=events,
+                order__status='completed',
+                order__created_at__gte=start,
+                order__created_at__lt=end,
+            )
+            .annotate(bucket=Trunc('order__created_at', bucket))
+            .values('event_id', 'bucket')
+            .annotate(tickets=Sum('quantity'), revenue=Sum(F('quantity') * F('unit_price')))
+        )
+
+    series = {}
+    for row in rows.order_by('event_id', 'bucket'):
+        revenue = Decimal(str(row['revenue'] or 0)).quantize(Decimal('0.01'))
+        series.setdefault(row['event_id'], []).append((row['bucket'], row['tickets'] or 0, revenue))
+    return series
@@ -0,0 +1,203 @@
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .pagination import KeysetPage
+
+
+FTS_TABLE = 'uapfy_event_fts'
+RANK_BATCH_SIZE = 200
+MAX_RANK_BATCH_SIZE = 5000  # ids per IN (...), well under SQLite's variable limit
+
+# Placeholders for the highlight markers, swapped for <mark> after escaping
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+
+# Each row of uapfy_event_fts mirrors one Event (rowid = event id) with its
+# category names flattened into a single column.
+_INDEX_SQL = f"""
+    INSERT INTO {FTS_TABLE} (rowid, title, description, location, categories)
+    SELECT e.id, e.title, e.description, e.location,
+           COALESCE((SELECT group_concat(c.name, ' ')
+                     FROM uapfy_event_categories ec
+                     JOIN uapfy_eventcategory c ON c.id = ec.eventcategory_id
+                     WHERE ec.event_id = e.id), '')
+    FROM uapfy_event e
+"""
+
+
+# Event Search
+#
+# SQLite uses an FTS5 table kept in sync by the signal handlers in
+# uapfy.signals; PostgreSQL ranks with tsvector/tsquery. Other databases
+# return None so the caller can fall back to a plain icontains filter.
+def uses_fts(using=DEFAULT_DB_ALIAS):
+    return connections[using].vendor == 'sqlite'
+
+
+def create_index(cursor):
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+        f"USING fts5(title, description, location, categories, tokenize='unicode61 remove_diacritics 2')"
+    )
+
+
+def rebuild_index(using=DEFAULT_DB_ALIAS):
+    if not uses_fts(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(_INDEX_SQL)
+
+
+def index_events(event_ids):
+    if not uses_fts() or not event_ids:
+        return
+    event_ids = list(event_ids)
+    placeholders = ', '.join(['%s'] * len(event_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", event_ids)
+        cursor.execute(f"{_INDEX_SQL} WHERE e.id IN ({placeholders})", event_ids)
+
+
+def remove_events(event_ids):
+    if not uses_fts() or not event_ids:
+        return
+    event_ids = list(event_ids)
+    placeholders = ', '.join(['%s'] * len(event_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", event_ids)
+
+
+def _terms(query):
+    return re.findall(r'\w+', query)
+
+
+def _highlight(snippet):
+    html = escape(snippet).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+    return mark_safe(html)
+
+
+# Matches are filtered and counted in SQL together with the listing's other
+# filters; only the order of best match first needs the ranking, which is
+# read in batches (see ranked_page) rather than as one list of every match.
+def search_filter(query):
+    """A Q for events matching every word of `query`, each as a prefix.
+
+    None when the database has no full-text backend.
+    """
+    terms = _terms(query)
+    if not terms:
+        return Q(pk__in=[])
+    if uses_fts():
+        return Q(pk__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [_match(terms)]))
+    if connection.vendor == 'postgresql':
+        return Q(pk__in=_postgres_matches(terms).values('pk'))
+    return None
+
+
+def ranked_ids(query, offset, limit):
+    """Ids of the events matching `query`, best match first, from `offset`."""
+    terms = _terms(query)
+    if not terms:
+        return []
+    if uses_fts():
+        with connection.cursor() as cursor:
+            # Title matches weigh most, then location and categories.
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY bm25({FTS_TABLE}, 10.0, 1.0, 5.0, 5.0), rowid LIMIT %s OFFSET %s",
+                [_match(terms), limit, offset],
+            )
+            return [event_id for event_id, in cursor.fetchall()]
+    from django.contrib.postgres.search import SearchRank
+
+    rows = _postgres_matches(terms).annotate(rank=SearchRank(_postgres_vector(), _postgres_query(terms)))
+    return list(rows.order_by('-rank', 'pk').values_list('pk', flat=True)[offset:offset + limit])
+
+
+def ranked_page(queryset, query, cursor=None, per_page=12):
+    """The page of `queryset` (already filtered by search_filter) in rank order.
+
+    The cursor is the number of ranked matches before the page. Ranked ids
+    are read in growing batches and checked against `queryset` until the
+    page is full, so other filters don't cut the results short.
+    """
+    offset = int(cursor) if cursor and cursor.isdigit() else 0
+    cursor = cursor if offset else None
+    page_ids = []
+    next_cursor = None
+    batch_size = RANK_BATCH_SIZE
+    while True:
+        ids = ranked_ids(query, offset, batch_size)
+        kept = set(queryset.filter(pk__in=ids).values_list('pk', flat=True))
+        for position, event_id in enumerate(ids, offset):
+            if event_id not in kept:
+                continue
+            if len(page_ids) == per_page:
+                next_cursor = str(position)
+                break
+            page_ids.append(event_id)
+        offset += len(ids)
+        if next_cursor is not None or len(ids) < batch_size:
+            break
+        batch_size = min(batch_size * 2, MAX_RANK_BATCH_SIZE)
+    events = queryset.in_bulk(page_ids)
+    return KeysetPage([events[event_id] for event_id in page_ids if event_id in events], next_cursor, cursor)
+
+
+def snippets(query, event_ids):
+    """Highlighted text around the matches of `query`, per event id."""
+    terms = _terms(query)
+    event_ids = list(event_ids)
+    if not terms or not event_ids:
+        return {}
+    if uses_fts():
+        placeholders = ', '.join(['%s'] * len(event_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, snippet({FTS_TABLE}, -1, %s, %s, '…', 16) FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s AND rowid IN ({placeholders})",
+                [_MARK_START, _MARK_END, _match(terms), *event_ids],
+            )
+            return {event_id: _highlight(snippet) for event_id, snippet in cursor.fetchall()}
+    from django.contrib.postgres.search import SearchHeadline
+
+    from .models import Event
+
+    rows = Event.objects.filter(pk__in=event_ids).annotate(
+        headline=SearchHeadline('description', _postgres_query(terms), start_sel=_MARK_START, stop_sel=_MARK_END),
+    )
+    return {event_id: _highlight(headline) for event_id, headline in rows.values_list('pk', 'headline')}
+
+
+def _match(terms):
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _postgres_query(terms):
+    from django.contrib.postgres.search import SearchQuery
+
+    return SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw')
+
+
+def _postgres_vector():
+    from django.contrib.postgres.aggregates import StringAgg
+    from django.contrib.postgres.search import SearchVector
+
+    return (
+        SearchVector('title', weight='A')
+        + SearchVector('location', weight='B')
+        + SearchVector(StringAgg('categories__name', ' ', default=''), weight='B')
+        + SearchVector('description', weight='C')
+    )
+
+
+def _postgres_matches(terms):
+    from .models import Event
+
+    return Event.objects.annotate(document=_postgres_vector()).filter(document=_postgres_query(terms))
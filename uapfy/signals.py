@@ -0,0 +1,86 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import caching, reviews, search
+from .models import Event, EventCategory, Review, Ticket
+
+
+# Search index and page cache
+def _events_changed(event_ids):
+    event_ids = list(event_ids)
+    search.index_events(event_ids)
+    caching.invalidate_events(event_ids)
+    caching.invalidate_listing()
+
+
+@receiver(post_save, sender=Event)
+def index_saved_event(sender, instance, **kwargs):
+    _events_changed([instance.pk])
+
+
+# Ticket.organizer is a copy of the event's organizer
+@receiver(post_save, sender=Event)
+def move_event_tickets(sender, instance, created, **kwargs):
+    saved = getattr(instance, '_saved_organizer_id', None)
+    if not created and saved is not None and saved != instance.organizer_id:
+        Ticket.objects.filter(event_id=instance.pk).update(organizer_id=instance.organizer_id)
+    instance._saved_organizer_id = instance.organizer_id
+
+
+@receiver(post_delete, sender=Event)
+def unindex_deleted_event(sender, instance, **kwargs):
+    search.remove_events([instance.pk])
+    caching.invalidate_events([instance.pk])
+    caching.invalidate_listing()
+
+
+@receiver(m2m_changed, sender=Event.categories.through)
+def index_event_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            _events_changed([instance.pk])
+    elif action == 'pre_clear':
+        # The cleared events are unknown after the fact; remember them now.
+        instance._cleared_event_ids = list(instance.events.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        _events_changed(getattr(instance, '_cleared_event_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        _events_changed(pk_set)
+
+
+@receiver(post_save, sender=EventCategory)
+def index_category_events(sender, instance, created, **kwargs):
+    if not created:
+        _events_changed(instance.events.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=EventCategory)
+def remember_category_events(sender, instance, **kwargs):
+    instance._search_event_ids = list(instance.events.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=EventCategory)
+def index_uncategorized_events(sender, instance, **kwargs):
+    _events_changed(getattr(instance, '_search_event_ids', []))
+
+
+# Event rating totals, see uapfy.reviews
+@receiver(post_save, sender=Review)
+def count_saved_review(sender, instance, created, raw, **kwargs):
+    # Fixtures (loaddata) carry the event's totals already
+    if not raw:
+        reviews.review_saved(instance, created)
+
+
+@receiver(post_delete, sender=Review)
+def count_deleted_review(sender, instance, **kwargs):
+    reviews.review_deleted(instance)
+
+
+# Page cache only: tickets and reviews don't affect the search index
+@receiver(post_save, sender=Ticket)
+@receiver(post_delete, sender=Ticket)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_event_pages(sender, instance, **kwargs):
+    caching.invalidate_events([instance.event_id])
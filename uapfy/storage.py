@@ -0,0 +1,101 @@
+import hashlib
+import posixpath
+import re
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.utils import timezone
+
+try:
+    from storages.backends.s3 import S3Storage
+except ImportError:  # optional: pip install django-storages boto3
+    S3Storage = None
+
+
+# Content-Addressed Storage
+#
+# Files are stored as <folder>/<aa>/<bb>/<sha256>.<ext>, where <folder> is
+# the upload_to directory and aa/bb are the first bytes of the digest. Two
+# levels of 256 directories keep every directory small even with millions
+# of QR images, and identical content always maps to the same name, so a
+# second copy is never written.
+CONTENT_NAME_RE = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+def is_content_name(name):
+    return bool(CONTENT_NAME_RE.search(name))
+
+
+def content_digest(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def content_name(name, digest):
+    folder = posixpath.dirname(name)
+    extension = posixpath.splitext(name)[1].lower()
+    return posixpath.join(folder, digest[:2], digest[2:4], digest + extension)
+
+
+class ContentAddressedMixin:
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = content_name(name, content_digest(content))
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # Same name means same content, so a concurrent writer can't clobber anything.
+        return name
+
+
+class ContentAddressedStorage(ContentAddressedMixin, FileSystemStorage):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(*args, **kwargs)
+
+
+if S3Storage is not None:
+    class S3ContentAddressedStorage(ContentAddressedMixin, S3Storage):
+        """The same layout in an S3-compatible bucket (AWS, MinIO, ...)."""
+else:
+    class S3ContentAddressedStorage:
+        def __init__(self, *args, **kwargs):
+            raise ImproperlyConfigured("The S3 media storage needs django-storages and boto3 installed.")
+
+
+# Moving existing files
+#
+# Shared by the migrate_media and process_images commands for files stored
+# before content addressing (or on another volume).
+def move_to_content_name(model, field, old_name, source=None, delete=False):
+    """Store file `old_name` of `source` (default: the media storage) under its content name.
+
+    Every `model` row whose `field` is `old_name` is pointed at the stored
+    copy, so duplicates of the same file all move to the one copy. With
+    `delete` the old file is removed afterwards. Returns the new name (the
+    same one for a file already in place), or None when the file is missing.
+    """
+    source = source or default_storage
+    if not source.exists(old_name):
+        return None
+    if source is default_storage and is_content_name(old_name):
+        return old_name
+    with source.open(old_name) as content:
+        name = default_storage.save(old_name, File(content, name=old_name))
+
+    changes = {field: name}
+    if any(f.name == 'updated_at' for f in model._meta.concrete_fields):
+        changes['updated_at'] = timezone.now()
+    model.objects.filter(**{field: old_name}).update(**changes)
+    if delete:
+        source.delete(old_name)
+    return name
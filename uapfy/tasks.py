@@ -0,0 +1,234 @@
+import logging
+import traceback
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.files.storage import storages
+from django.core.mail import send_mail
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from . import caching
+from .bulk_issuance import issue_from_csv
+from .event_status import advance_event_statuses
+from .images import build_variants
+from .models import Event, Order, OrganizerProfile, Task
+from .query_plans import update_statistics
+
+
+logger = logging.getLogger(__name__)
+
+RETRY_BASE_DELAY = 5  # seconds, doubled after every failed attempt
+RETRY_MAX_DELAY = 60 * 60
+HEARTBEAT_INTERVAL = timedelta(seconds=30)
+STALE_AFTER = timedelta(minutes=2)  # running tasks without a heartbeat for this long are requeued
+EVENT_STATUS_INTERVAL = timedelta(seconds=getattr(settings, 'EVENT_STATUS_INTERVAL', 60))
+STATISTICS_INTERVAL = timedelta(seconds=getattr(settings, 'STATISTICS_INTERVAL', 60 * 60))
+TASK_RETENTION = timedelta(seconds=getattr(settings, 'TASK_RETENTION', 7 * 24 * 60 * 60))  # done and failed rows
+PRUNE_INTERVAL = timedelta(hours=1)
+PRUNE_BATCH_SIZE = 1000
+
+PENDING_STATUSES = ('queued', 'running')
+FINISHED_STATUSES = ('done', 'failed')
+
+_registry = {}
+_periodic = {}
+
+
+# Background tasks
+#
+# Tasks are rows in the Task table, claimed by the run_worker command with a
+# conditional UPDATE, so any number of workers can share the queue on SQLite
+# without an outside broker.
+def task(name):
+    def register(func):
+        _registry[name] = func
+        return func
+    return register
+
+
+def periodic(name, every):
+    """Have workers queue task `name` (no arguments) once every `every`."""
+    def register(func):
+        _periodic[name] = every
+        return task(name)(func)
+    return register
+
+
+def enqueue(name, payload=None, key=None, delay=None, max_attempts=5):
+    """Queue `name` to run with `payload` as keyword arguments.
+
+    Tasks with the same idempotency `key` are only queued once; the existing
+    task is returned instead.
+    """
+    if name not in _registry:
+        raise KeyError(f"Unknown task: {name}")
+    fields = {
+        'name': name,
+        'payload': payload or {},
+        'max_attempts': max_attempts,
+        'run_at': timezone.now() + (delay or timedelta()),
+    }
+    if key is None:
+        return Task.objects.create(**fields)
+    try:
+        with transaction.atomic():
+            return Task.objects.create(idempotency_key=key, **fields)
+    except IntegrityError:
+        return Task.objects.get(idempotency_key=key)
+
+
+def claim_tasks(limit):
+    now = timezone.now()
+    candidates = Task.objects.filter(status='queued', run_at__lte=now).order_by('run_at')
+    claimed = []
+    for pk in candidates.values_list('pk', flat=True)[:limit]:
+        # Another worker may have claimed the task since it was listed.
+        if Task.objects.filter(pk=pk, status='queued').update(status='running', started_at=now, heartbeat_at=now, attempts=F('attempts') + 1):
+            claimed.append(pk)
+    return list(Task.objects.filter(pk__in=claimed))
+
+
+def schedule_periodic_tasks():
+    # The idempotency key names the time slot, so however many workers call
+    # this, each periodic task is queued once per interval.
+    now = timezone.now()
+    for name, every in _periodic.items():
+        slot = int(now.timestamp() // every.total_seconds())
+        enqueue(name, key=f'periodic:{name}:{slot}', max_attempts=1)
+
+
+def heartbeat(task_ids):
+    """Mark running tasks as alive, however long they take."""
+    if task_ids:
+        Task.objects.filter(pk__in=task_ids, status='running').update(heartbeat_at=timezone.now())
+
+
+def requeue_stale_tasks():
+    # Only tasks whose worker stopped sending heartbeats (it crashed or was
+    # killed); a long import that is still running keeps its claim.
+    return Task.objects.filter(status='running', heartbeat_at__lt=timezone.now() - STALE_AFTER).update(status='queued')
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY))
+
+
+def _claimed(task):
+    # A task requeued as stale and claimed again belongs to the newer attempt
+    return Task.objects.filter(pk=task.pk, status='running', attempts=task.attempts)
+
+
+def run_task(task):
+    try:
+        _registry[task.name](**task.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Task %s #%s failed (attempt %s)", task.name, task.pk, task.attempts)
+        if task.attempts >= task.max_attempts:
+            _claimed(task).update(status='failed', finished_at=timezone.now(), last_error=error)
+        else:
+            _claimed(task).update(status='queued', run_at=timezone.now() + retry_delay(task.attempts), last_error=error)
+        return False
+    _claimed(task).update(status='done', finished_at=timezone.now())
+    return True
+
+
+def prune_tasks(older_than=TASK_RETENTION):
+    """Delete done and failed tasks that finished more than `older_than` ago."""
+    finished = Task.objects.filter(status__in=FINISHED_STATUSES, finished_at__lt=timezone.now() - older_than)
+    pruned = 0
+    while True:
+        # Short batches, so workers claiming tasks never wait on one long delete
+        pks = list(finished.values_list('pk', flat=True)[:PRUNE_BATCH_SIZE])
+        if not pks:
+            return pruned
+        pruned += Task.objects.filter(pk__in=pks).delete()[0]
+
+
+def queue_stats(sample=100):
+    """Queue depth of pending and running tasks plus latency of the most recently finished ones."""
+    # Finished tasks are left out; counting them would read the whole table
+    depth = dict(Task.objects.filter(status__in=PENDING_STATUSES).values_list('status').annotate(total=Count('pk')))
+    oldest = Task.objects.filter(status='queued').order_by('created_at').values_list('created_at', flat=True).first()
+    finished = Task.objects.filter(status='done').order_by('-finished_at')[:sample]
+    latencies = sorted((t.finished_at - t.created_at).total_seconds() for t in finished.only('created_at', 'finished_at'))
+
+    stats = {
+        'depth': {status: depth.get(status, 0) for status in PENDING_STATUSES},
+        'oldest_queued_seconds': (timezone.now() - oldest).total_seconds() if oldest else 0,
+        'latency_seconds': None,
+    }
+    if latencies:
+        stats['latency_seconds'] = {
+            'avg': sum(latencies) / len(latencies),
+            'p50': latencies[len(latencies) // 2],
+            'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            'max': latencies[-1],
+        }
+    return stats
+
+
+# Task definitions
+@task('issue_tickets_from_csv')
+def issue_tickets_from_csv(event_id, name, unit_price='0.00', render_qr=False):
+    # A retried attempt resumes where the failed one stopped, see uapfy.bulk_issuance
+    event = Event.objects.select_related('organizer__user').get(pk=event_id)
+    storage = storages['private']
+    with storage.open(name) as f:
+        data = f.read()
+    issue_from_csv(event, data, event.organizer.user, unit_price=Decimal(unit_price), render_qr=render_qr)
+    # The attendee details go once every ticket is issued; a failed attempt keeps them for the retry
+    storage.delete(name)
+
+
+@task('send_order_confirmation')
+def send_order_confirmation(order_id):
+    order = Order.objects.get(pk=order_id)
+    item = order.items.select_related('event').first()
+    event_title = item.event.title if item else ''
+    send_mail(
+        f"Your tickets for {event_title}",
+        f"Hi {order.billing_name},\n\n"
+        f"Your order {order.order_number} is confirmed ({item.quantity if item else 0} ticket(s), total {order.total}).\n"
+        f"You can find your tickets under My Tickets.",
+        settings.DEFAULT_FROM_EMAIL,
+        [order.billing_email],
+    )
+
+
+@task('process_image')
+def process_image(name):
+    variants = build_variants(name)
+    # Every row pointing at the same content shares the variants.
+    events = Event.objects.filter(banner=name)
+    event_ids = list(events.values_list('pk', flat=True))
+    events.update(banner_variants=variants, updated_at=timezone.now())
+    OrganizerProfile.objects.filter(logo=name).update(logo_variants=variants)
+    caching.invalidate_events(event_ids)
+
+
+@task('update_event_status')
+def update_event_status(event_id):
+    advance_event_statuses(Event.objects.filter(pk=event_id))
+
+
+@periodic('advance_event_statuses', EVENT_STATUS_INTERVAL)
+def advance_all_event_statuses():
+    changed = advance_event_statuses()
+    if changed:
+        logger.info("Advanced the status of %s event(s)", changed)
+
+
+@periodic('update_statistics', STATISTICS_INTERVAL)
+def update_planner_statistics():
+    update_statistics()
+
+
+@periodic('prune_tasks', PRUNE_INTERVAL)
+def prune_finished_tasks():
+    pruned = prune_tasks()
+    if pruned:
+        logger.info("Pruned %s finished task(s)", pruned)
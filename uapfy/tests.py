@@ -1,3 +1,1425 @@
-from django.test import TestCase
+import base64
+import csv
+import hashlib
+import os
+import json
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import F
+from django.http import QueryDict
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from . import caching, checkin, exports, qr, reviews, search, tasks, ticket_signing
+from .benchmarks import race_buyers
+from .bulk_issuance import AttendeeFileError, issue_from_csv
+from .capacity import SoldOutError
+from .event_status import advance_event_statuses
+from .issuance import cancel_order, issue_tickets
+from .pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_paginate
+from .popularity import popularity_score, record_ticket_sales
+from .query_plans import FullScanError, assert_indexed, scanned_tables, sorted_table, update_statistics
+from .rollups import check_rollups, compute_daily_sales, rebuild_rollups, record_sale
+from .storage import S3ContentAddressedStorage, S3Storage, content_name, is_content_name
+from .tasks import (
+    RETRY_BASE_DELAY, RETRY_MAX_DELAY, STALE_AFTER, claim_tasks, enqueue, heartbeat, requeue_stale_tasks, retry_delay,
+    run_task, task,
+)
+from .views import EVENT_SORT_ORDERINGS
+from .models import Event, EventCategory, EventSales, EventSalesDaily, Order, OrderItem, OrganizerProfile, Review, Task, Ticket, TicketHold, UserProfile, generate_ticket_number
+
+
+# Pages are measured cold: the page cache is emptied before every request.
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+ROW_COUNTS = (1, 100, 10_000)
+ADMIN_ROW_COUNTS = (100, 10_000)
+
+
+def make_user(username, **kwargs):
+    return User.objects.create_user(username, f'{username}@example.com', 'password', **kwargs)
+
+
+def add_users(count, prefix='user'):
+    first = User.objects.count()
+    return User.objects.bulk_create([
+        User(username=f'{prefix}{first + index}', email=f'{prefix}{first + index}@example.com')
+        for index in range(count)
+    ], batch_size=1000)
+
+
+def make_organizer(username='organizer'):
+    return OrganizerProfile.objects.create(user=make_user(username), organization_name=username.title())
+
+
+def add_events(organizer, count, category=None):
+    """Bulk-create `count` active events, each in `category` when given."""
+    start = timezone.now() + timedelta(days=30)
+    events = Event.objects.bulk_create([
+        Event(
+            organizer=organizer,
+            title=f'Event {index}',
+            description='A test event',
+            location='Dhaka',
+            start_time=start + timedelta(minutes=index),
+            end_time=start + timedelta(minutes=index, hours=2),
+        )
+        for index in range(count)
+    ], batch_size=1000)
+    if category is not None:
+        Event.categories.through.objects.bulk_create([
+            Event.categories.through(event_id=event.pk, eventcategory_id=category.pk) for event in events
+        ], batch_size=1000)
+    return events
+
+
+def add_tickets(user, event, count):
+    """Bulk-create one completed order of `count` tickets for `event`."""
+    total = event.ticket_price * count
+    order = Order.objects.create(
+        user=user, subtotal=total, total=total, status='completed',
+        billing_name=user.username, billing_email=user.email, billing_phone='0', billing_address='-',
+    )
+    OrderItem.objects.create(order=order, event=event, quantity=count, unit_price=event.ticket_price)
+    Ticket.objects.bulk_create([
+        Ticket(
+            user=user, event=event, organizer_id=event.organizer_id, order=order,
+            ticket_number=generate_ticket_number(), attendee_name=user.username,
+        )
+        for _ in range(count)
+    ], batch_size=1000)
+    Event.objects.filter(pk=event.pk).update(tickets_sold=event.tickets_sold + count)
+    event.refresh_from_db()
+    return order
+
+
+def add_orders(user, count):
+    """Bulk-create `count` completed orders, each with one item."""
+    first = Order.objects.count()
+    orders = Order.objects.bulk_create([
+        Order(
+            user=user, order_number=f'TEST-{first + index}', subtotal=0, total=0, status='completed',
+            billing_name=user.username, billing_email=user.email, billing_phone='0', billing_address='-',
+        )
+        for index in range(count)
+    ], batch_size=1000)
+    event = Event.objects.first()
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, event=event, quantity=1, unit_price=0) for order in orders
+    ], batch_size=1000)
+    return orders
+
+
+# Query counts
+#
+# Every page fetches its related rows with a fixed number of queries, so the
+# count is pinned and checked at 1, 100 and 10,000 rows: an N+1 (or a query
+# that grows with the table, like a per-page COUNT) fails the build.
+@override_settings(CACHES=TEST_CACHES)
+class QueryCountTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.organizer = make_organizer()
+        cls.attendee = make_user('attendee')
+        cls.category = EventCategory.objects.create(name='Music')
+        cls.event = add_events(cls.organizer, 1, cls.category)[0]
+
+    def assertFlat(self, url, queries, grow, row_counts=ROW_COUNTS):
+        """Request `url` at each of `row_counts` rows (`grow(n)` adds n) and expect `queries` every time."""
+        rows = 0
+        for target in row_counts:
+            grow(target - rows)
+            rows = target
+            cache.clear()
+            with self.subTest(rows=rows), self.assertNumQueries(queries):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def grow_events(self, count):
+        add_events(self.organizer, count, self.category)
+
+    def grow_indexed_events(self, count):
+        # bulk_create skips the signals that keep the search index current
+        self.grow_events(count)
+        search.rebuild_index()
+
+    def grow_tickets(self, count):
+        add_tickets(self.attendee, self.event, count)
+
+
+
+class ViewQueryCountTests(QueryCountTestCase):
+    def test_event_listing(self):
+        self.assertFlat('/allevents/', 3, lambda count: self.grow_events(count - 1 if count else 0))
+
+    def test_event_listing_search(self):
+        self.assertFlat('/allevents/?q=event&sort=date_asc', 4, lambda count: self.grow_indexed_events(count - 1 if count else 0))
+
+    def test_event_listing_ranked_search(self):
+        self.assertFlat('/allevents/?q=event', 6, lambda count: self.grow_indexed_events(count - 1 if count else 0))
+
+    def test_event_detail(self):
+        self.client.force_login(self.attendee)
+        self.assertFlat(f'/events/{self.event.pk}/', 4, self.grow_tickets)
+
+    def test_my_tickets(self):
+        self.client.force_login(self.attendee)
+        self.assertFlat('/my-tickets/', 3, self.grow_tickets)
+
+    def test_organizer_tickets(self):
+        self.client.force_login(self.organizer.user)
+        self.assertFlat('/organizer/tickets/', 6, self.grow_tickets)
+
+    def test_organizer_events(self):
+        self.client.force_login(self.organizer.user)
+        self.assertFlat('/events/', 5, lambda count: self.grow_events(count - 1 if count else 0))
+
+    def test_organizer_dashboard(self):
+        self.client.force_login(self.organizer.user)
+        self.assertFlat('/organizer_dashboard/', 3, self.grow_events)
+
+    def test_organizer_analytics(self):
+        self.client.force_login(self.organizer.user)
+        self.assertFlat('/organizer/analytics/', 6, self.grow_tickets)
+
+
+class AdminQueryCountTests(QueryCountTestCase):
+    def setUp(self):
+        self.client.force_login(make_user('admin', is_staff=True, is_superuser=True))
+
+    def assertFlatChangelist(self, model, queries, grow):
+        self.assertFlat(f'/admin/uapfy/{model._meta.model_name}/', queries, grow, ADMIN_ROW_COUNTS)
+
+    def test_event_changelist(self):
+        self.assertFlatChangelist(Event, 6, self.grow_events)
+
+    def test_category_changelist(self):
+        self.assertFlatChangelist(EventCategory, 4, lambda count: EventCategory.objects.bulk_create(
+            [EventCategory(name=f'Category {index}') for index in range(count)], batch_size=1000,
+        ))
+
+    def test_user_profile_changelist(self):
+        self.assertFlatChangelist(UserProfile, 5, lambda count: UserProfile.objects.bulk_create(
+            [UserProfile(user=user) for user in add_users(count)], batch_size=1000,
+        ))
+
+    def test_organizer_profile_changelist(self):
+        self.assertFlatChangelist(OrganizerProfile, 5, lambda count: OrganizerProfile.objects.bulk_create(
+            [OrganizerProfile(user=user) for user in add_users(count)], batch_size=1000,
+        ))
+
+    def test_order_changelist(self):
+        self.assertFlatChangelist(Order, 5, lambda count: add_orders(self.attendee, count))
+
+    def test_order_item_changelist(self):
+        self.assertFlatChangelist(OrderItem, 6, lambda count: add_orders(self.attendee, count))
+
+    def test_ticket_changelist(self):
+        self.assertFlatChangelist(Ticket, 6, self.grow_tickets)
+
+    def test_review_changelist(self):
+        self.assertFlatChangelist(Review, 6, lambda count: Review.objects.bulk_create([
+            Review(user=self.attendee, event=event, rating=index % 5 + 1)
+            for index, event in enumerate(add_events(self.organizer, count))
+        ], batch_size=1000))
+
+
+# Query plans
+#
+# The tables are filled past assert_indexed's threshold, so a page that
+# reads or sorts a whole table fails here instead of in production.
+@override_settings(CACHES=TEST_CACHES)
+class QueryPlanTests(TestCase):
+    ROWS = 2000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organizer = make_organizer()
+        cls.attendee = make_user('attendee')
+        events = add_events(cls.organizer, cls.ROWS)
+        add_tickets(cls.attendee, events[0], cls.ROWS)
+        add_tickets(make_user('other'), events[1], cls.ROWS)
+        search.rebuild_index()
+        update_statistics()
+
+    def assertIndexed(self, url):
+        cache.clear()
+        with assert_indexed():
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_event_listing(self):
+        self.assertIndexed('/allevents/')
+
+    def test_event_listing_sorts(self):
+        for sort in EVENT_SORT_ORDERINGS:
+            with self.subTest(sort=sort):
+                first = self.assertIndexed(f'/allevents/?sort={sort}')
+                self.assertIndexed(f"/allevents/?{first.context['next_page_query']}")
+
+    def test_event_listing_search(self):
+        self.assertIndexed('/allevents/?q=event')
+        # A sorted search orders its matches ("Event 7", "Event 70".. here),
+        # never the whole table
+        self.assertIndexed('/allevents/?q=event+7&sort=date_asc')
+        with self.assertRaises(FullScanError):
+            self.assertIndexed('/allevents/?q=event&sort=date_asc')
+
+    def test_my_tickets(self):
+        self.client.force_login(self.attendee)
+        self.assertIndexed('/my-tickets/')
+
+    def test_sqlite_plans(self):
+        sql = 'SELECT * FROM "uapfy_event" ORDER BY "start_time" LIMIT 13'
+        cases = [
+            (['SCAN uapfy_event'], []),
+            (['SCAN uapfy_event USING INDEX event_start_idx'], []),
+            (['SCAN uapfy_event USING INDEX event_start_idx', 'USE TEMP B-TREE FOR ORDER BY'], ['uapfy_event']),
+            (['SEARCH uapfy_event USING INDEX event_start_idx (start_time>?)'], []),
+            (['SEARCH uapfy_event USING INDEX event_organizer_idx (organizer_id=?)', 'USE TEMP B-TREE FOR ORDER BY'], []),
+            (['SCAN uapfy_event_fts VIRTUAL TABLE INDEX 0:M5', 'USE TEMP B-TREE FOR ORDER BY'], []),
+        ]
+        for plan, scanned in cases:
+            with self.subTest(plan=plan):
+                self.assertEqual(scanned_tables(connection, sql, plan), scanned or (['uapfy_event'] if plan[0] == 'SCAN uapfy_event' else []))
+        self.assertEqual(scanned_tables(connection, sql.replace(' LIMIT 13', ''), ['SCAN uapfy_event USING INDEX event_start_idx']), ['uapfy_event'])
+        self.assertEqual(sorted_table(connection, sql, cases[4][0]), 'uapfy_event')
+        self.assertIsNone(sorted_table(connection, sql, cases[1][0]))
+
+    def test_full_scans_fail(self):
+        with self.assertRaises(FullScanError):
+            with assert_indexed():
+                list(Ticket.objects.filter(attendee_name__contains='x'))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SearchTests(TestCase):
+    def test_filters_apply_to_every_match(self):
+        organizer = make_organizer()
+        music = EventCategory.objects.create(name='Music')
+        add_events(organizer, 1000)
+        add_events(organizer, 3, music)
+        search.rebuild_index()
+
+        for sort in ('', 'date_asc'):
+            with self.subTest(sort=sort):
+                response = self.client.get('/allevents/', {'q': 'event', 'category': 'music', 'sort': sort})
+                self.assertEqual(response.context['total_count'], 3)
+                self.assertEqual(len(response.context['events']), 3)
+
+    def test_ranked_pages_cover_every_match_once(self):
+        add_events(make_organizer(), 30)
+        search.rebuild_index()
+        seen = []
+        params = {'q': 'event'}
+        while True:
+            response = self.client.get('/allevents/', params)
+            seen += [event.pk for event in response.context['events']]
+            if not response.context['next_page_query']:
+                break
+            params = response.context['next_page_query']
+            params = dict(pair.split('=') for pair in params.split('&'))
+        self.assertEqual(sorted(seen), sorted(Event.objects.values_list('pk', flat=True)))
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        # Ties on every sort key but the id: same start time, three prices
+        self.events = add_events(make_organizer(), 30)
+        Event.objects.update(start_time=self.events[0].start_time)
+        for event in self.events:
+            Event.objects.filter(pk=event.pk).update(ticket_price=event.pk % 3)
+
+    def walk(self, ordering, per_page=7):
+        seen, cursor = [], None
+        while True:
+            page = keyset_paginate(Event.objects.all(), ordering, cursor, per_page)
+            seen += [event.pk for event in page]
+            if not page.has_next:
+                return seen
+            cursor = page.next_cursor
+
+    def test_pages_cover_ties_once_in_order(self):
+        for sort, ordering in EVENT_SORT_ORDERINGS.items():
+            with self.subTest(sort=sort):
+                expected = list(Event.objects.order_by(*ordering).values_list('pk', flat=True))
+                self.assertEqual(self.walk(ordering), expected)
+
+    def test_listing_pages_cover_ties_once(self):
+        seen = []
+        params = {'sort': 'date_asc'}
+        while True:
+            response = self.client.get('/allevents/', params)
+            seen += [event.pk for event in response.context['events']]
+            if not response.context['next_page_query']:
+                break
+            params = QueryDict(response.context['next_page_query'])
+        self.assertEqual(seen, sorted(event.pk for event in self.events))
+
+    def test_invalid_cursors_start_over(self):
+        ordering = EVENT_SORT_ORDERINGS['date_asc']
+
+        def encoded(values):
+            return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+        for cursor in ['!!!', 'bm90IGpzb24', encoded({'start_time': 1}), encoded(['2030-01-01T00:00:00']),
+                       encoded(['not a date', 1]), encoded(['2030-01-01T00:00:00', 'x'])]:
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(InvalidCursor):
+                    decode_cursor(cursor, Event, ordering)
+                page = keyset_paginate(Event.objects.all(), ordering, cursor)
+                self.assertTrue(page.is_first)
+                self.assertEqual(page.object_list, keyset_paginate(Event.objects.all(), ordering).object_list)
+                self.assertEqual(self.client.get('/allevents/', {'sort': 'date_asc', 'cursor': cursor}).status_code, 200)
+
+    def test_edited_cursor_pages_from_its_values(self):
+        # A hand-edited cursor is just another position in the ordering
+        ordering = EVENT_SORT_ORDERINGS['date_desc']
+        ordered = list(Event.objects.order_by(*ordering))
+        page = keyset_paginate(Event.objects.all(), ordering, encode_cursor(ordered[9], ordering), per_page=5)
+        self.assertFalse(page.is_first)
+        self.assertEqual(page.object_list, ordered[10:15])
+        page = keyset_paginate(Event.objects.all(), ordering, encode_cursor(ordered[-1], ordering))
+        self.assertEqual(len(page), 0)
+        self.assertFalse(page.has_next)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.organizer = make_organizer()
+        # Two pages by date: events[0:12] and events[12:15]
+        self.events = add_events(self.organizer, 15)
+        self.buyer = make_user('buyer')
+
+    def sell(self, event):
+        with self.captureOnCommitCallbacks(execute=True):
+            issue_tickets(self.buyer, event, 1, {}, {})
+
+    def listing(self, **params):
+        return self.client.get('/allevents/', {'sort': 'date_asc', **params})
+
+    def test_a_sale_rebuilds_only_the_pages_showing_the_event(self):
+        self.listing()
+        listing_version = caching.listing_version()
+        with self.assertNumQueries(0):
+            self.listing()
+
+        self.sell(self.events[13])
+        with self.assertNumQueries(0):
+            self.listing()
+        self.sell(self.events[0])
+        # The page and its categories; the total comes from the count cache
+        with self.assertNumQueries(2):
+            self.listing()
+        with self.assertNumQueries(0):
+            self.listing()
+        self.assertEqual(caching.listing_version(), listing_version)
+
+    def test_rebuilt_pages_show_the_new_counters(self):
+        self.listing()
+        Review.objects.create(user=self.buyer, event=self.events[0], rating=4)
+        card = self.listing().context['events'].object_list[0].card_html
+        self.assertIn('4.0', card)
+
+    def test_new_and_edited_events_reach_every_listing(self):
+        self.listing()
+        self.listing(sort='date_desc')
+        event = Event.objects.create(
+            organizer=self.organizer, title='Late addition', description='-', location='Dhaka',
+            start_time=timezone.now() + timedelta(days=365), end_time=timezone.now() + timedelta(days=366),
+        )
+        self.assertEqual(self.listing(sort='date_desc').context['events'].object_list[0], event)
+
+        event.title = 'Renamed'
+        event.save()
+        self.assertIn('Renamed', self.listing(sort='date_desc').context['events'].object_list[0].card_html)
+
+    def test_hit_counts_are_written_in_batches(self):
+        caching.flush_stats()
+        cache.clear()
+        with patch.object(caching, 'STATS_FLUSH_INTERVAL', 3600):
+            for _ in range(3):
+                self.listing()
+            self.assertIsNone(cache.get('stats:listing:hits'))
+            stats = caching.cache_stats()
+        self.assertEqual((stats['listing']['hits'], stats['listing']['misses']), (2, 1))
+
+
+class QRCodeTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.enterContext(patch.object(qr, 'qr_cache', qr.QRCodeCache(1024 * 1024)))
+        self.render = self.enterContext(patch.object(qr, 'render_qr_png', wraps=qr.render_qr_png))
+        self.attendee = make_user('attendee')
+        self.client.force_login(self.attendee)
+        event = add_events(make_organizer(), 1)[0]
+        self.ticket = issue_tickets(self.attendee, event, 1, {}, {}).tickets.get()
+        self.url = f'/ticket/{self.ticket.pk}/qr.png'
+
+    def test_images_are_rendered_once_per_payload(self):
+        first = self.client.get(self.url)
+        second = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first.content.startswith(b'\x89PNG'))
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(self.render.call_count, 1)
+
+    def test_current_etag_gets_not_modified_without_rendering(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(etag, f'"{qr.qr_etag(self.ticket.qr_data)}"')
+        qr.qr_cache._items.clear()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.render.call_count, 1)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_cache_evicts_the_least_recently_used_image(self):
+        cache = qr.QRCodeCache(max_bytes=8)
+        cache.set('a', b'aaaa')
+        cache.set('b', b'bbbb')
+        cache.get('a')
+        cache.set('c', b'cccc')
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (b'aaaa', None, b'cccc'))
+        cache.set('huge', b'x' * 9)
+        self.assertIsNone(cache.get('huge'))
+        self.assertEqual(cache.size, 8)
+
+    def test_backfill_stores_images_that_are_served_without_rendering(self):
+        out = StringIO()
+        call_command('render_qr_codes', stdout=out)
+        self.assertIn('Rendered 1 QR code(s).', out.getvalue())
+        self.ticket.refresh_from_db()
+        self.assertTrue(self.ticket.qr_code.name)
+        self.assertEqual(self.ticket.qr_code_etag, qr.qr_etag(self.ticket.qr_data))
+
+        out = StringIO()
+        call_command('render_qr_codes', stdout=out)
+        self.assertIn('Rendered 0 QR code(s).', out.getvalue())
+
+        self.render.reset_mock()
+        response = self.client.get(self.url)
+        self.assertEqual(self.render.call_count, 0)
+        with self.ticket.qr_code.open('rb') as f:
+            self.assertEqual(response.content, f.read())
+
+    def test_images_of_an_old_payload_are_not_served(self):
+        call_command('render_qr_codes', stdout=StringIO())
+        Ticket.objects.filter(pk=self.ticket.pk).update(qr_data='new payload')
+        self.render.reset_mock()
+        response = self.client.get(self.url)
+        self.assertEqual(self.render.call_count, 1)
+        self.assertEqual(response.content, qr.render_qr_png('new payload'))
+
+
+class MediaStorageTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.old = tempfile.TemporaryDirectory()
+        self.addCleanup(self.old.cleanup)
+        self.events = add_events(make_organizer(), 2)
+
+    def image(self, color):
+        blob = BytesIO()
+        Image.new('RGB', (40, 30), color).save(blob, 'JPEG')
+        return blob.getvalue()
+
+    def write(self, root, name, data):
+        path = Path(root) / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+    def banners(self):
+        return list(Event.objects.order_by('pk').values_list('banner', flat=True))
+
+    def test_process_images_moves_banners_to_content_names(self):
+        self.write(settings.MEDIA_ROOT, 'event_banners/old.jpg', self.image('red'))
+        Event.objects.update(banner='event_banners/old.jpg')
+        call_command('process_images', '--delete-replaced', stdout=StringIO())
+
+        name = self.banners()[0]
+        self.assertEqual(self.banners(), [name, name])
+        self.assertTrue(name.startswith('event_banners/') and is_content_name(name))
+        self.assertTrue(default_storage.exists(name))
+        self.assertFalse(default_storage.exists('event_banners/old.jpg'))
+        self.assertTrue(Event.objects.get(pk=self.events[0].pk).banner_variants['webp'])
+
+        # Already in place: processed again, but not moved
+        call_command('process_images', '--force', stdout=StringIO())
+        self.assertEqual(self.banners(), [name, name])
+
+    def test_migrate_media_copies_from_the_old_root_once(self):
+        data = self.image('blue')
+        for index, event in enumerate(self.events):
+            self.write(self.old.name, f'event_banners/{index}.jpg', data)
+            Event.objects.filter(pk=event.pk).update(banner=f'event_banners/{index}.jpg')
+        ticket = add_tickets(make_user('attendee'), self.events[0], 1).tickets.get()
+        Ticket.objects.filter(pk=ticket.pk).update(qr_code='qr_codes/gone.png')
+
+        errors = StringIO()
+        call_command('migrate_media', '--delete', source_root=self.old.name, stdout=StringIO(), stderr=errors)
+
+        # Identical files end up as one stored copy
+        name = self.banners()[0]
+        self.assertEqual(self.banners(), [name, name])
+        with default_storage.open(name) as stored:
+            self.assertEqual(stored.read(), data)
+        self.assertFalse(any(Path(self.old.name).rglob('*.jpg')))
+        self.assertIn('Missing file: qr_codes/gone.png', errors.getvalue())
+        self.assertEqual(Ticket.objects.get(pk=ticket.pk).qr_code, 'qr_codes/gone.png')
+
+    # Runs only against a real bucket, e.g. a local MinIO with MEDIA_STORAGE's AWS_* variables set
+    @skipUnless(S3Storage is not None and os.environ.get('AWS_S3_ENDPOINT_URL'), "needs django-storages and an S3 endpoint")
+    def test_s3_storage_uses_content_names(self):
+        storage = S3ContentAddressedStorage(
+            bucket_name=os.environ.get('AWS_STORAGE_BUCKET_NAME'),
+            endpoint_url=os.environ['AWS_S3_ENDPOINT_URL'],
+            access_key=os.environ.get('AWS_ACCESS_KEY_ID'),
+            secret_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
+            file_overwrite=True,
+        )
+        data = self.image('green')
+        name = storage.save('event_banners/a.jpg', ContentFile(data))
+        self.addCleanup(storage.delete, name)
+        self.assertEqual(name, content_name('event_banners/a.jpg', hashlib.sha256(data).hexdigest()))
+        self.assertEqual(storage.save('event_banners/b.JPG', ContentFile(data)), name)
+        with storage.open(name) as stored:
+            self.assertEqual(stored.read(), data)
+
+@override_settings(CACHES=TEST_CACHES)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.organizer = make_organizer()
+        self.event = add_events(self.organizer, 1)[0]
+        self.attendee = make_user('attendee')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ticket = issue_tickets(self.attendee, self.event, 1, {}, {}).tickets.get()
+        self.client.force_login(self.attendee)
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        return response['ETag']
+
+    def assertChanges(self, url, change):
+        old = self.etag(url)
+        change()
+        # The client's copy is stale: the full page, under a new ETag
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=old)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], old)
+        return response
+
+    def purchase(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            issue_tickets(make_user('buyer'), self.event, 1, {}, {})
+
+    def review(self):
+        self.client.post(f'/events/{self.event.pk}/reviews/submit/', {'rating': 5, 'comment': 'Great'})
+        self.assertTrue(Review.objects.filter(event=self.event, user=self.attendee).exists())
+
+    def edit(self):
+        self.client.force_login(self.organizer.user)
+        self.client.post(f'/events/{self.event.pk}/edit/', {
+            'title': 'Renamed', 'description': self.event.description, 'location': self.event.location,
+            'start_time': self.event.start_time.isoformat(), 'end_time': self.event.end_time.isoformat(),
+        })
+        self.client.force_login(self.attendee)
+
+    def test_event_detail_changes_with_the_event(self):
+        url = f'/events/{self.event.pk}/'
+        for change in (self.purchase, self.review, self.edit):
+            with self.subTest(change=change.__name__):
+                response = self.assertChanges(url, change)
+        self.assertContains(response, 'Renamed')
+
+    def test_ticket_detail_changes_with_the_ticket_and_its_event(self):
+        url = f'/ticket/{self.ticket.pk}/'
+        self.assertChanges(url, self.edit)
+        self.assertChanges(url, lambda: self.ticket.check_in())
+
+    def test_etags_differ_per_user(self):
+        url = f'/events/{self.event.pk}/'
+        attendee_etag = self.etag(url)
+        self.client.force_login(make_user('other'))
+        self.assertNotEqual(self.etag(url), attendee_etag)
+
+
+class TicketIndexTests(TestCase):
+    def setUp(self):
+        self.addCleanup(checkin._indexes.clear)
+        self.organizer = make_organizer()
+
+    def test_only_recently_scanned_events_are_kept(self):
+        events = add_events(self.organizer, checkin.INDEX_LIMIT + 2)
+        for event in events:
+            checkin.get_ticket_index(event.pk)
+        self.assertEqual(list(checkin._indexes), [event.pk for event in events[2:]])
+
+    def test_ended_events_are_scanned_without_an_index(self):
+        event = add_events(self.organizer, 1)[0]
+        ticket = add_tickets(make_user('attendee'), event, 1).tickets.get()
+        Event.objects.filter(pk=event.pk).update(end_time=timezone.now() - timedelta(hours=1))
+
+        self.assertIsNone(checkin.get_ticket_index(event.pk))
+        self.assertEqual(checkin.scan(ticket.ticket_number, event.pk).status, checkin.VALID)
+
+    def test_ended_events_are_dropped(self):
+        ended, upcoming = add_events(self.organizer, 2)
+        checkin.get_ticket_index(ended.pk).ends_at = timezone.now()
+        checkin.get_ticket_index(upcoming.pk)
+        self.assertEqual(list(checkin._indexes), [upcoming.pk])
+
+
+class TicketSigningTests(TestCase):
+    def verifier(self, event_id=7, **kwargs):
+        return ticket_signing.TicketVerifier(event_id, ticket_signing.event_key(event_id), **kwargs)
+
+    def test_signed_payloads_verify(self):
+        payload = ticket_signing.sign_ticket(7, 'TKT-1')
+        self.assertEqual(self.verifier().verify(payload), (ticket_signing.VALID, 'TKT-1'))
+        self.assertEqual(ticket_signing.parse_payload(payload)[:2], (7, 'TKT-1'))
+        self.assertEqual(ticket_signing.sign_ticket(7, 'TKT-1', key='other'), ticket_signing.sign_ticket(7, 'TKT-1', key='other'))
+        self.assertNotEqual(ticket_signing.sign_ticket(7, 'TKT-1', key='other'), payload)
+
+    def test_tampered_payloads_are_refused(self):
+        prefix, event_id, number, signature = ticket_signing.sign_ticket(7, 'TKT-1').split('.')
+        flipped = signature[:-1] + ('B' if signature.endswith('A') else 'A')
+        cases = {
+            f'{prefix}.{event_id}.TKT-2.{signature}': (ticket_signing.INVALID, 'TKT-2'),
+            f'{prefix}.8.{number}.{signature}': (ticket_signing.WRONG_EVENT, number),
+            f'{prefix}.{event_id}.{number}.{flipped}': (ticket_signing.INVALID, number),
+            f'{prefix}.{event_id}.{number}.': (ticket_signing.INVALID, number),
+            f'UT0.{event_id}.{number}.{signature}': (ticket_signing.INVALID, None),
+            f'{prefix}.{event_id}.{number}.{signature}.x': (ticket_signing.INVALID, None),
+            f'{prefix}.x.{number}.{signature}': (ticket_signing.INVALID, None),
+            '': (ticket_signing.INVALID, None),
+        }
+        for payload, expected in cases.items():
+            with self.subTest(payload=payload):
+                self.assertEqual(self.verifier().verify(payload), expected)
+        # A signature under another event's key is no good either
+        forged = ticket_signing.sign_ticket(7, 'TKT-1', key=ticket_signing.event_key(8))
+        self.assertEqual(self.verifier().verify(forged), (ticket_signing.INVALID, 'TKT-1'))
+
+    def test_revoked_tickets_are_refused(self):
+        payload = ticket_signing.sign_ticket(7, 'TKT-1')
+        self.assertEqual(self.verifier(revoked=['TKT-1']).verify(payload), (ticket_signing.REVOKED, 'TKT-1'))
+
+    def test_tickets_signed_before_a_key_rotation_still_scan(self):
+        event = add_events(make_organizer(), 1)[0]
+        ticket = issue_tickets(make_user('attendee'), event, 1, {}, {}).tickets.get()
+        old_secret = settings.SECRET_KEY
+        with override_settings(SECRET_KEY='rotated-' + old_secret, SECRET_KEY_FALLBACKS=[old_secret]):
+            # New payloads use the new key; the old ones verify under the fallback
+            self.assertNotEqual(ticket.build_qr_data(), ticket.qr_data)
+            self.assertEqual(checkin.scan_payload(ticket.qr_data, event.pk).status, checkin.VALID)
+        Ticket.objects.update(is_used=False)
+        checkin._indexes.clear()
+        with override_settings(SECRET_KEY='rotated-' + old_secret, SECRET_KEY_FALLBACKS=[]):
+            self.assertEqual(checkin.scan_payload(ticket.qr_data, event.pk).status, ticket_signing.INVALID)
+
+
+class CheckInEndpointTests(TestCase):
+    def setUp(self):
+        self.addCleanup(checkin._indexes.clear)
+        self.organizer = make_organizer()
+        self.event, self.other_event = add_events(self.organizer, 2)
+        attendee = make_user('attendee')
+        # One order each, so refunding one revokes only its ticket
+        self.tickets = [issue_tickets(attendee, self.event, 1, {}, {}).tickets.get() for _ in range(3)]
+        self.client.force_login(self.organizer.user)
+
+    def post(self, path, data):
+        response = self.client.post(f'/organizer/events/{self.event.pk}/checkin/{path}', data, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def scan(self, **data):
+        return self.post('', data)
+
+    def each_mode(self):
+        # With the in-memory ticket index and straight against the database
+        for indexed in (True, False):
+            with self.subTest(indexed=indexed), override_settings(CHECKIN_TICKET_INDEX=indexed):
+                checkin._indexes.clear()
+                Ticket.objects.update(is_used=False, checked_in_at=None)
+                yield
+
+    def test_a_ticket_is_admitted_once(self):
+        for _ in self.each_mode():
+            ticket = self.tickets[0]
+            first = self.scan(ticket_number=ticket.ticket_number)
+            second = self.scan(payload=ticket.qr_data)
+            self.assertEqual((first['status'], second['status']), (checkin.VALID, checkin.ALREADY_USED))
+            self.assertFalse(second['duplicate'])
+            self.assertEqual(second['checked_in_at'], first['checked_in_at'])
+
+    def test_replayed_batches_admit_nobody_twice(self):
+        scanned_at = '2030-01-01T18:00:00+00:00'
+        scans = [{'payload': ticket.qr_data, 'scanned_at': scanned_at} for ticket in self.tickets[:2]]
+        for _ in self.each_mode():
+            first = self.post('batch/', {'scans': scans})['results']
+            replay = self.post('batch/', {'scans': scans})['results']
+            self.assertEqual([result['status'] for result in first], [checkin.VALID] * 2)
+            self.assertEqual([(result['status'], result['duplicate']) for result in replay], [(checkin.VALID, True)] * 2)
+            self.assertEqual(Ticket.objects.filter(is_used=True).count(), 2)
+            # A later scan of the same ticket is a second entry
+            later = self.post('batch/', {'scans': [{'ticket_number': self.tickets[0].ticket_number}]})['results']
+            self.assertEqual(later[0]['status'], checkin.ALREADY_USED)
+
+    def test_unknown_foreign_and_revoked_tickets_are_refused(self):
+        foreign = issue_tickets(make_user('other'), self.other_event, 1, {}, {}).tickets.get()
+        Order.objects.filter(pk=self.tickets[1].order_id).update(status='refunded')
+        for _ in self.each_mode():
+            self.assertEqual(self.scan(ticket_number='TKT-NOPE')['status'], checkin.NOT_FOUND)
+            self.assertEqual(self.scan(ticket_number=foreign.ticket_number)['status'], checkin.WRONG_EVENT)
+            self.assertEqual(self.scan(ticket_number=self.tickets[1].ticket_number)['status'], checkin.REVOKED)
+            self.assertEqual(self.scan(payload=foreign.qr_data)['status'], ticket_signing.WRONG_EVENT)
+            self.assertEqual(self.scan(payload=self.tickets[0].qr_data + 'x')['status'], ticket_signing.INVALID)
+            self.assertFalse(Ticket.objects.filter(is_used=True).exists())
+        self.assertEqual(self.client.get(f'/organizer/events/{self.event.pk}/checkin/bundle/').json()['revoked'], [self.tickets[1].ticket_number])
+
+    def test_other_organizers_cannot_scan(self):
+        self.client.force_login(make_organizer('rival').user)
+        response = self.client.post(
+            f'/organizer/events/{self.event.pk}/checkin/', {'ticket_number': self.tickets[0].ticket_number},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Ticket.objects.filter(is_used=True).exists())
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.organizer = make_organizer()
+        self.first, self.second = add_events(self.organizer, 2)
+        Event.objects.filter(pk=self.second.pk).update(title='Second')
+        self.buyer = make_user('buyer', first_name='Rahim', last_name='Uddin')
+        self.orders = [add_tickets(self.buyer, self.first, 2), add_tickets(self.buyer, self.second, 1)]
+        self.tickets = list(Ticket.objects.order_by('pk'))
+        # The first ticket falls back to the buyer's name and email
+        Ticket.objects.filter(pk=self.tickets[0].pk).update(attendee_name='', attendee_email=None)
+        Ticket.objects.filter(pk=self.tickets[1].pk).update(attendee_email='Guest@Example.com', is_used=True, checked_in_at=timezone.now())
+        # Someone else's event never shows up
+        add_tickets(self.buyer, add_events(make_organizer('other'), 1)[0], 3)
+        self.client.force_login(self.organizer.user)
+
+    def export(self, kind, **params):
+        response = self.client.get(f'/organizer/export/{kind}/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="{kind}-{timezone.localdate():%Y%m%d}.csv"')
+        return list(csv.reader(StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_tickets(self):
+        header, *rows = self.export('tickets')
+        self.assertEqual(header, [name for name, _ in exports.EXPORTS['tickets']['columns']])
+        by_number = {row[0]: row for row in rows}
+        self.assertEqual(set(by_number), {ticket.ticket_number for ticket in self.tickets[:3]})
+        fallback, checked_in = by_number[self.tickets[0].ticket_number], by_number[self.tickets[1].ticket_number]
+        self.assertEqual(fallback[3:7], ['no', '', 'Rahim Uddin', 'buyer@example.com'])
+        self.assertEqual(checked_in[3], 'yes')
+        self.assertEqual(checked_in[6], 'Guest@Example.com')
+        self.assertEqual(checked_in[7:], [self.orders[0].order_number, 'completed'])
+
+    def test_filters(self):
+        def numbers(**params):
+            return {row[4] for row in self.export('attendees', **params)[1:]}
+
+        first, second, third = (ticket.ticket_number for ticket in self.tickets[:3])
+        self.assertEqual(numbers(event=self.second.pk), {third})
+        self.assertEqual(numbers(status='checked_in'), {second})
+        self.assertEqual(numbers(status='not_checked_in'), {first, third})
+        self.assertEqual(numbers(q='guest@example.com'), {second})
+        self.assertEqual(numbers(q=first.lower()), {first})
+        today = timezone.localdate()
+        self.assertEqual(numbers(**{'from': str(today), 'to': str(today)}), {first, second, third})
+        self.assertEqual(numbers(**{'to': str(today - timedelta(days=1))}), set())
+
+    def test_orders(self):
+        header, *rows = self.export('orders')
+        self.assertEqual(header[:5], ['Order number', 'Status', 'Created at', 'Event', 'Quantity'])
+        self.assertEqual(sorted((row[0], row[3], row[4]) for row in rows), sorted([
+            (self.orders[0].order_number, 'Event 0', '2'),
+            (self.orders[1].order_number, 'Second', '1'),
+        ]))
+
+    def test_csv_is_written_in_chunks(self):
+        headers, rows = exports.export_rows('tickets', self.organizer, QueryDict())
+        chunks = list(exports.csv_chunks(headers, rows, rows_per_chunk=2))
+        self.assertEqual([chunk.count('\r\n') for chunk in chunks], [3, 1])
+
+    def test_unknown_export(self):
+        self.assertEqual(self.client.get('/organizer/export/payments/').status_code, 404)
+
+
+class PopularityTests(TestCase):
+    def score(self, event):
+        event.refresh_from_db(fields=['popularity'])
+        return event.popularity
+
+    def test_scores_stay_finite_and_ordered_far_ahead(self):
+        quiet, busy = add_events(make_organizer(), 2)
+        at = timezone.now() + timedelta(days=365 * 100)
+        record_ticket_sales(quiet.pk, 1, at)
+        record_ticket_sales(busy.pk, 1, at - timedelta(days=1))
+        record_ticket_sales(busy.pk, 2, at)
+
+        self.assertAlmostEqual(self.score(quiet), popularity_score([at]))
+        self.assertAlmostEqual(self.score(busy), popularity_score([at - timedelta(days=1), at, at]))
+        self.assertLess(self.score(quiet), self.score(busy))
+
+    def test_cancelling_every_sale_scores_zero(self):
+        event = add_events(make_organizer(), 1)[0]
+        at = timezone.now() + timedelta(days=365 * 100)
+        record_ticket_sales(event.pk, 3, at)
+        record_ticket_sales(event.pk, -3, at)
+        self.assertEqual(self.score(event), 0)
+
+
+class ReviewTests(TestCase):
+    def setUp(self):
+        self.organizer = make_organizer()
+        self.event, self.other = add_events(self.organizer, 2)
+        self.attendees = [make_user(f'attendee{index}') for index in range(2)]
+        for attendee in self.attendees:
+            add_tickets(attendee, self.event, 1)
+            add_tickets(attendee, self.other, 1)
+
+    def submit(self, user, rating, event=None):
+        self.client.force_login(user)
+        event = event or self.event
+        self.client.post(f'/events/{event.pk}/reviews/submit/', {'rating': rating, 'comment': 'Fine'})
+
+    def delete(self, user):
+        self.client.force_login(user)
+        self.client.post(f'/events/{self.event.pk}/reviews/delete/')
+
+    def assertRatings(self, event, rating_sum, rating_count, average):
+        event = Event.objects.get(pk=event.pk)
+        self.assertEqual((event.rating_sum, event.rating_count), (rating_sum, rating_count))
+        self.assertAlmostEqual(event.average_rating, average)
+        self.assertEqual(reviews.recount_ratings([event.pk]), 0)
+
+    def test_counters_follow_create_edit_and_delete(self):
+        first, second = self.attendees
+        self.submit(first, 5)
+        self.submit(second, 3)
+        self.assertRatings(self.event, 8, 2, 4.0)
+        self.submit(second, 1)
+        self.assertRatings(self.event, 6, 2, 3.0)
+        self.submit(second, 1)
+        self.assertRatings(self.event, 6, 2, 3.0)
+        self.delete(first)
+        self.assertRatings(self.event, 1, 1, 1.0)
+        self.delete(first)
+        self.assertRatings(self.event, 1, 1, 1.0)
+        self.delete(second)
+        self.assertRatings(self.event, 0, 0, 0.0)
+
+    def test_counters_follow_admin_edits(self):
+        first, second = self.attendees
+        self.submit(first, 4)
+        self.submit(second, 2)
+        # Moved to the other event, as in the admin
+        review = Review.objects.get(user=first, event=self.event)
+        review.event = self.other
+        review.save()
+        self.assertRatings(self.event, 2, 1, 2.0)
+        self.assertRatings(self.other, 4, 1, 4.0)
+        # Saved over the row without loading it first; recounted
+        Review(pk=review.pk, user=first, event=self.other, rating=1, created_at=review.created_at).save()
+        self.assertRatings(self.other, 1, 1, 1.0)
+        Review.objects.get(pk=review.pk).delete()
+        self.assertRatings(self.other, 0, 0, 0.0)
+
+    def test_refused_reviews_change_nothing(self):
+        self.submit(make_user('stranger'), 5)
+        self.submit(self.organizer.user, 5)
+        self.submit(self.attendees[0], 6)
+        self.assertFalse(Review.objects.exists())
+        self.assertRatings(self.event, 0, 0, 0.0)
+
+    def test_listing_pages_newest_first(self):
+        users = add_users(23)
+        Review.objects.bulk_create(Review(user=user, event=self.event, rating=3) for user in users)
+        Review.objects.create(user=self.attendees[0], event=self.other, rating=5)
+        now = timezone.now()
+        for index, review in enumerate(Review.objects.filter(event=self.event).order_by('pk')):
+            # Every second one shares a time with its neighbour, so the id breaks the tie
+            Review.objects.filter(pk=review.pk).update(created_at=now - timedelta(minutes=index // 2))
+        expected = list(Review.objects.filter(event=self.event).order_by('-created_at', 'pk').values_list('pk', flat=True))
+
+        seen, sizes, params = [], [], {}
+        while True:
+            response = self.client.get(f'/events/{self.event.pk}/reviews/', params)
+            self.assertEqual(response.status_code, 200)
+            page = [review.pk for review in response.context['reviews']]
+            seen += page
+            sizes.append(len(page))
+            if not response.context['next_page_query']:
+                break
+            params = {'cursor': response.context['next_page_query'].removeprefix('cursor=')}
+        self.assertEqual(seen, expected)
+        self.assertEqual(sizes, [10, 10, 3])
+
+
+class EventStatusTests(TestCase):
+    HOUR = timedelta(hours=1)
+    # (stored status, start, end in hours from now): status after a run
+    CASES = {
+        ('upcoming', 1, 3): 'upcoming',
+        ('upcoming', -1, 1): 'ongoing',
+        ('upcoming', -3, -1): 'completed',
+        ('ongoing', -1, 1): 'ongoing',
+        ('ongoing', -3, -1): 'completed',
+        ('ongoing', 1, 3): 'upcoming',
+        ('completed', -3, -1): 'completed',
+        ('completed', -1, 1): 'ongoing',
+        ('completed', 1, 3): 'upcoming',
+        ('cancelled', 1, 3): 'cancelled',
+        ('cancelled', -1, 1): 'cancelled',
+        ('cancelled', -3, -1): 'cancelled',
+    }
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.cases = dict(zip(add_events(make_organizer(), len(self.CASES)), self.CASES.items()))
+        for event, ((status, start, end), _) in self.cases.items():
+            Event.objects.filter(pk=event.pk).update(
+                status=status, start_time=self.now + start * self.HOUR, end_time=self.now + end * self.HOUR,
+                updated_at=self.now - self.HOUR,
+            )
+
+    def test_moves_only_events_whose_status_is_due(self):
+        moved = {event.pk for event, ((status, _, _), expected) in self.cases.items() if status != expected}
+        invalidated = []
+        with patch.object(caching, 'invalidate_events', side_effect=invalidated.extend):
+            self.assertEqual(advance_event_statuses(now=self.now), len(moved))
+        self.assertEqual(set(invalidated), moved)
+
+        stored = {event.pk: event for event in Event.objects.all()}
+        for event, (case, expected) in self.cases.items():
+            with self.subTest(case=case):
+                self.assertEqual(stored[event.pk].status, expected)
+                self.assertEqual(stored[event.pk].updated_at == self.now, event.pk in moved)
+        self.assertEqual(advance_event_statuses(now=self.now), 0)
+
+    def test_update_status_moves_only_that_event(self):
+        started = next(event for event, (case, _) in self.cases.items() if case == ('upcoming', -1, 1))
+        started.update_status()
+        self.assertEqual(started.status, 'ongoing')
+        self.assertEqual(Event.objects.exclude(pk=started.pk).filter(updated_at__gt=self.now - self.HOUR).count(), 0)
+
+
+class TicketOrganizerTests(TestCase):
+    def test_tickets_follow_their_event_to_a_new_organizer(self):
+        event = add_events(make_organizer(), 1)[0]
+        add_tickets(make_user('attendee'), event, 3)
+        other = make_organizer('other')
+
+        event = Event.objects.get(pk=event.pk)
+        event.organizer = other
+        event.save()
+
+        self.assertEqual(set(Ticket.objects.filter(event=event).values_list('organizer_id', flat=True)), {other.pk})
+
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        organizer = make_organizer()
+        self.events = add_events(organizer, 2)
+        Event.objects.filter(pk=self.events[0].pk).update(ticket_price='12.50')
+        Event.objects.filter(pk=self.events[1].pk).update(ticket_price='40.00')
+        for event in self.events:
+            event.refresh_from_db()
+        self.buyer = make_user('buyer')
+
+    def buy(self, event, quantity):
+        billing = {'billing_name': 'Buyer', 'billing_email': self.buyer.email, 'billing_phone': '0', 'billing_address': '-'}
+        return issue_tickets(self.buyer, event, quantity, billing, {'attendee_name': 'Buyer'})
+
+    def stored(self):
+        totals = {row.event_id: (row.orders, row.tickets_sold, row.revenue) for row in EventSales.objects.all()}
+        daily = {(row.event_id, row.date): (row.orders, row.tickets_sold, row.revenue) for row in EventSalesDaily.objects.all()}
+        return totals, daily
+
+    def assertMatchesRecount(self):
+        self.assertEqual(check_rollups(), [])
+        # Refunding every sale of a day leaves a row of zeros behind
+        daily = {key: value for key, value in self.stored()[1].items() if value[0]}
+        self.assertEqual(daily, compute_daily_sales())
+
+    def test_sales_and_refunds_match_a_recount(self):
+        first, second = self.events
+        orders = [self.buy(first, 3), self.buy(first, 1), self.buy(second, 2)]
+        self.assertMatchesRecount()
+        today = timezone.localdate()
+        self.assertEqual(self.stored()[1][first.pk, today], (2, 4, Decimal('50.00')))
+
+        self.assertTrue(cancel_order(orders[0], 'refunded'))
+        self.assertFalse(cancel_order(orders[0], 'refunded'))
+        self.assertTrue(cancel_order(orders[2]))
+        self.assertMatchesRecount()
+        self.assertEqual(self.stored()[0][first.pk], (1, 1, Decimal('12.50')))
+        self.assertEqual(self.stored()[0][second.pk], (0, 0, Decimal('0.00')))
+
+    def test_check_rollups_reports_drift(self):
+        first, second = self.events
+        self.buy(first, 2)
+        self.buy(second, 1)
+        call_command('check_rollups', stdout=StringIO())
+
+        EventSales.objects.filter(event=first).update(revenue=F('revenue') + 1)
+        EventSalesDaily.objects.filter(event=second).delete()
+        problems = check_rollups()
+        self.assertEqual(len(problems), 2)
+        self.assertIn(f'event {first.pk} total', problems[0] + problems[1])
+        self.assertIn(f'event {second.pk} on {timezone.localdate()}', problems[0] + problems[1])
+        with self.assertRaises(CommandError):
+            call_command('check_rollups', stdout=StringIO(), stderr=StringIO())
+
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(check_rollups(), [])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SalesSeriesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.organizer = make_organizer()
+        self.event = add_events(self.organizer, 1)[0]
+        Event.objects.filter(pk=self.event.pk).update(ticket_price='10.00')
+        self.event.refresh_from_db()
+        buyer = make_user('buyer')
+        self.day = timezone.localdate() - timedelta(days=10)
+        at = timezone.make_aware(datetime.combine(self.day, datetime.min.time()))
+        # Both ends of one hour, the start of the next, then nothing for a day
+        for moment, quantity in (
+            (at + timedelta(hours=10), 1),
+            (at + timedelta(hours=10, minutes=59, seconds=59), 2),
+            (at + timedelta(hours=11), 4),
+            (at + timedelta(days=2, hours=9), 8),
+        ):
+            order = add_tickets(buyer, self.event, quantity)
+            Order.objects.filter(pk=order.pk).update(created_at=moment)
+        rebuild_rollups()
+        self.client.force_login(self.organizer.user)
+
+    def series(self, **params):
+        response = self.client.get('/organizer/analytics/sales/', params)
+        self.assertEqual(response.status_code, 200)
+        (event,) = response.json()['events']
+        self.assertEqual(event['id'], self.event.pk)
+        return [(point['t'], point['tickets'], point['revenue']) for point in event['points']]
+
+    def test_hour_buckets_include_the_start_and_exclude_the_end(self):
+        start = f'{self.day}T10:00:00+00:00'
+        self.assertEqual(self.series(bucket='hour', start=start, end=f'{self.day}T11:00:00+00:00'), [
+            (f'{self.day}T10:00:00Z', 3, '30.00'),
+        ])
+        self.assertEqual(self.series(bucket='minute', start=start, end=f'{self.day}T11:00:01+00:00'), [
+            (f'{self.day}T10:00:00Z', 1, '10.00'),
+            (f'{self.day}T10:59:00Z', 2, '20.00'),
+            (f'{self.day}T11:00:00Z', 4, '40.00'),
+        ])
+
+    def test_day_buckets_leave_out_days_without_sales(self):
+        end = self.day + timedelta(days=3)
+        self.assertEqual(self.series(bucket='day', start=str(self.day), end=str(end)), [
+            (str(self.day), 7, '70.00'),
+            (str(self.day + timedelta(days=2)), 8, '80.00'),
+        ])
+        # A range starting mid-day still counts that whole day from the rollups
+        self.assertEqual(self.series(bucket='day', start=f'{self.day}T12:00:00+00:00', end=str(end))[0], (str(self.day), 7, '70.00'))
+        # Week buckets start on the Monday
+        monday = self.day - timedelta(days=self.day.weekday())
+        weeks = self.series(bucket='week', start=str(monday), end=str(monday + timedelta(weeks=2)))
+        self.assertEqual(weeks[0][0], str(monday))
+        self.assertEqual(sum(tickets for _, tickets, _ in weeks), 15)
+
+    def test_rejects_bad_ranges(self):
+        for params in (
+            {'bucket': 'year'},
+            {'start': 'yesterday'},
+            {'start': str(self.day), 'end': str(self.day)},
+            {'bucket': 'minute', 'start': str(self.day - timedelta(days=30)), 'end': str(self.day)},
+            {'event': 'x'},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/organizer/analytics/sales/', params).status_code, 400)
+
+
+class BulkIssuanceTests(TestCase):
+    def setUp(self):
+        self.event = add_events(make_organizer(), 1)[0]
+        Event.objects.filter(pk=self.event.pk).update(max_attendees=30)
+        self.event.refresh_from_db()
+        self.owner = make_user('partner')
+        rows = ''.join(f'Guest {index},guest{index}@example.com\n' for index in range(25))
+        self.data = f'Name,Email\n{rows}'.encode()
+
+    def issue(self, chunk_size):
+        return issue_from_csv(self.event, self.data, self.owner, unit_price=Decimal('5.00'), chunk_size=chunk_size)
+
+    def test_resuming_an_interrupted_run_issues_no_duplicates(self):
+        sales = []
+
+        def crash_on_second_chunk(*args):
+            sales.append(args)
+            if len(sales) == 2:
+                raise RuntimeError("worker killed")
+            record_sale(*args)
+
+        with patch('uapfy.bulk_issuance.record_sale', crash_on_second_chunk), self.assertRaises(RuntimeError):
+            self.issue(chunk_size=10)
+        # The second chunk's order, tickets and seats were rolled back with it
+        self.assertEqual(Ticket.objects.filter(event=self.event).count(), 10)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.tickets_sold, 10)
+
+        # Resumed with another chunk size, as a retried task might
+        self.assertEqual(self.issue(chunk_size=7), (15, 10))
+        self.assertEqual(self.issue(chunk_size=10), (0, 25))
+
+        emails = list(Ticket.objects.filter(event=self.event).values_list('attendee_email', flat=True))
+        self.assertEqual(sorted(emails), sorted(f'guest{index}@example.com' for index in range(25)))
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.tickets_sold, 25)
+        self.assertEqual(Order.objects.filter(order_number__startswith='BULK-').count(), 4)
+        self.assertEqual(check_rollups(), [])
+
+    def test_sold_out_issues_nothing(self):
+        Event.objects.filter(pk=self.event.pk).update(max_attendees=20)
+        self.event.refresh_from_db()
+        with self.assertRaises(SoldOutError):
+            self.issue(chunk_size=10)
+        self.assertFalse(Ticket.objects.filter(event=self.event).exists())
+
+    def test_bad_rows_are_reported_before_issuing(self):
+        self.data += b'Nobody,not-an-email\n'
+        with self.assertRaisesMessage(AttendeeFileError, "Line 27"):
+            self.issue(chunk_size=10)
+        self.assertFalse(Ticket.objects.filter(event=self.event).exists())
+
+# Capacity
+#
+# Buyers on separate connections race for the last seats; the conditional
+# UPDATE in uapfy.capacity must let exactly max_attendees of them through.
+class OversellTests(TransactionTestCase):
+    BUYERS = 8
+    ATTEMPTS = 10
+
+    def setUp(self):
+        self.event = add_events(make_organizer(), 1)[0]
+        self.buyer = make_user('buyer')
+
+    def race(self):
+        return race_buyers(self.event, self.buyer, self.BUYERS, self.ATTEMPTS)
+
+    def assertRace(self, result, seats):
+        timings, outcomes, errors = result
+        sys.stderr.write(f"\n{self.id()}: {timings}\n")
+        self.assertEqual(errors, [])
+        self.assertEqual(outcomes, {'sold': seats, 'sold_out': self.BUYERS * self.ATTEMPTS - seats})
+
+    def assertSoldOut(self, seats):
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.tickets_sold, self.event.max_attendees)
+        self.assertEqual(Ticket.objects.filter(event=self.event).count(), seats)
+
+    def test_concurrent_buyers_cannot_oversell(self):
+        Event.objects.filter(pk=self.event.pk).update(max_attendees=20, tickets_sold=5)
+        self.assertRace(self.race(), 15)
+        self.assertSoldOut(15)
+
+    def test_editing_the_event_mid_sale_keeps_the_counters(self):
+        Event.objects.filter(pk=self.event.pk).update(max_attendees=20)
+        # Loaded before the sale, like the organizer's edit form
+        stale = Event.objects.get(pk=self.event.pk)
+        results = []
+        sale = threading.Thread(target=lambda: results.append(self.race()))
+        sale.start()
+        while sale.is_alive():
+            stale.title = 'Renamed'
+            stale.save()
+        sale.join()
+
+        self.assertRace(results[0], 20)
+        self.assertSoldOut(20)
+        self.assertEqual(Event.objects.get(pk=self.event.pk).title, 'Renamed')
+
+
+class HoldTests(TestCase):
+    def setUp(self):
+        self.event = add_events(make_organizer(), 1)[0]
+        Event.objects.filter(pk=self.event.pk).update(max_attendees=2)
+        self.buyer = make_user('buyer')
+        self.client.force_login(self.buyer)
+
+    def buy(self, quantity):
+        return self.client.post(f'/event/{self.event.pk}/buy/', {
+            'quantity': quantity, 'billing_name': 'Buyer', 'billing_email': self.buyer.email,
+            'billing_phone': '0', 'billing_address': '-', 'attendee_name': 'Buyer',
+        })
+
+    def assertSeats(self, sold, reserved):
+        self.event.refresh_from_db()
+        self.assertEqual((self.event.tickets_sold, self.event.tickets_reserved), (sold, reserved))
+
+    def test_checkout_holds_one_seat_once(self):
+        for _ in range(2):
+            response = self.client.get(f'/event/{self.event.pk}/buy/')
+            self.assertEqual(response.context['hold'].quantity, 1)
+        self.assertEqual(TicketHold.objects.count(), 1)
+        self.assertSeats(0, 1)
+
+    def test_purchase_confirms_the_hold(self):
+        self.client.get(f'/event/{self.event.pk}/buy/')
+        self.buy(1)
+        self.assertSeats(1, 0)
+        self.assertFalse(TicketHold.objects.exists())
+
+    def test_purchase_of_more_seats_releases_the_hold(self):
+        self.client.get(f'/event/{self.event.pk}/buy/')
+        self.buy(2)
+        self.assertSeats(2, 0)
+        self.assertFalse(TicketHold.objects.exists())
+
+    def test_held_seats_are_not_sold_to_others(self):
+        for name in ('buyer', 'other'):
+            self.client.force_login(User.objects.get_or_create(username=name)[0])
+            self.assertIsNotNone(self.client.get(f'/event/{self.event.pk}/buy/').context['hold'])
+        latecomer = make_user('latecomer')
+        self.client.force_login(latecomer)
+        self.assertIsNone(self.client.get(f'/event/{self.event.pk}/buy/').context['hold'])
+        self.assertSeats(0, 2)
+        with self.assertRaises(SoldOutError):
+            issue_tickets(latecomer, self.event, 1, {}, {})
+
+    def test_expired_holds_give_their_seats_back(self):
+        Event.objects.filter(pk=self.event.pk).update(max_attendees=1)
+        self.client.get(f'/event/{self.event.pk}/buy/')
+        TicketHold.objects.update(expires_at=timezone.now())
+        self.client.force_login(make_user('other'))
+        self.assertEqual(self.client.get(f'/event/{self.event.pk}/buy/').context['hold'].quantity, 1)
+        self.assertSeats(0, 1)
+
+
+# Background tasks
+@task('tests.fail')
+def failing_task():
+    raise RuntimeError("boom")
+
+
+_released = threading.Event()
+
+
+@task('tests.wait')
+def waiting_task():
+    # Finishes once the last quick task has run
+    if not _released.wait(timeout=10):
+        raise RuntimeError("the worker never ran the quick tasks")
+
+
+@task('tests.quick')
+def quick_task(last=False):
+    if last:
+        _released.set()
+
+
+class TaskQueueTests(TestCase):
+    def run_next(self):
+        task, = claim_tasks(1)
+        with self.assertLogs('uapfy.tasks', 'WARNING'):
+            return run_task(task)
+
+    def test_failures_retry_with_backoff_then_fail(self):
+        enqueue('tests.fail', max_attempts=3)
+        for attempt, delay in ((1, RETRY_BASE_DELAY), (2, RETRY_BASE_DELAY * 2)):
+            before = timezone.now()
+            self.assertFalse(self.run_next())
+            task = Task.objects.get()
+            self.assertEqual((task.status, task.attempts), ('queued', attempt))
+            self.assertIn('boom', task.last_error)
+            self.assertGreaterEqual(task.run_at, before + timedelta(seconds=delay))
+            self.assertEqual(claim_tasks(1), [])  # not before its delay
+            Task.objects.update(run_at=timezone.now())
+        self.assertFalse(self.run_next())
+        self.assertEqual(Task.objects.get().status, 'failed')
+        self.assertEqual(retry_delay(20), timedelta(seconds=RETRY_MAX_DELAY))
+
+    def test_only_tasks_without_a_heartbeat_are_requeued(self):
+        long_ago = timezone.now() - STALE_AFTER * 10
+        alive = enqueue('tests.quick')
+        dead = enqueue('tests.quick')
+        claim_tasks(2)
+        # Both started long ago; only one worker is still beating
+        Task.objects.update(started_at=long_ago, heartbeat_at=long_ago)
+        heartbeat([alive.pk])
+
+        self.assertEqual(requeue_stale_tasks(), 1)
+        self.assertEqual(Task.objects.get(pk=alive.pk).status, 'running')
+        self.assertEqual(Task.objects.get(pk=dead.pk).status, 'queued')
+
+    def test_a_requeued_task_belongs_to_its_new_attempt(self):
+        enqueue('tests.quick')
+        first, = claim_tasks(1)
+        Task.objects.update(heartbeat_at=timezone.now() - STALE_AFTER * 2)
+        requeue_stale_tasks()
+        second, = claim_tasks(1)
+        # The first worker finishing late doesn't close the second attempt
+        run_task(first)
+        self.assertEqual(Task.objects.get().status, 'running')
+        run_task(second)
+        self.assertEqual(Task.objects.get().status, 'done')
+
+    def test_idempotency_keys_queue_once(self):
+        first = enqueue('tests.quick', key='quick:1')
+        self.assertEqual(enqueue('tests.quick', key='quick:1').pk, first.pk)
+        enqueue('tests.quick', key='quick:2')
+        self.assertEqual(Task.objects.count(), 2)
+
+
+class WorkerTests(TransactionTestCase):
+    def setUp(self):
+        _released.clear()
+
+    def test_free_threads_take_new_tasks_while_one_runs_long(self):
+        waiting = enqueue('tests.wait')
+        # More quick tasks than a batch of claims, the last one releasing the long task
+        for index in range(6):
+            enqueue('tests.quick', {'last': index == 5})
+        call_command('run_worker', threads=2, poll=0.05, once=True, stdout=StringIO())
+
+        self.assertEqual(Task.objects.get(pk=waiting.pk).status, 'done')
+        self.assertFalse(Task.objects.exclude(status='done').exclude(name__in=tasks._periodic).exists())
@@ -0,0 +1,93 @@
+import base64
+import hashlib
+import hmac
+
+
+# Signed Ticket Payloads
+#
+# A payload looks like UT1.<event id>.<ticket number>.<signature>, where the
+# signature is a truncated HMAC-SHA256 of "<event id>.<ticket number>" under
+# the event's own key. A scanner only needs that key and the revocation list
+# of refunded tickets to validate tickets without reaching the database.
+# Only the standard library is used outside event_key() and
+# event_fallback_keys(), so this module can be copied to a scanner as-is.
+#
+# Keys are derived from SECRET_KEY. When it is rotated, the old value goes
+# in SECRET_KEY_FALLBACKS, and tickets signed under it still verify until
+# it is removed.
+
+PREFIX = 'UT1'
+SIGNATURE_BYTES = 16
+
+VALID = 'valid'
+INVALID = 'invalid'
+WRONG_EVENT = 'wrong_event'
+REVOKED = 'revoked'
+
+
+class InvalidPayload(ValueError):
+    pass
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def _derive_key(secret, event_id):
+    digest = hmac.new(secret.encode(), f'uapfy-event-key:{event_id}'.encode(), hashlib.sha256)
+    return _b64(digest.digest())
+
+
+def event_key(event_id):
+    """The event's signing key, derived from SECRET_KEY so nothing extra is stored."""
+    from django.conf import settings
+
+    return _derive_key(settings.SECRET_KEY, event_id)
+
+
+def event_fallback_keys(event_id):
+    """The event's keys under SECRET_KEY_FALLBACKS, accepted but never signed with."""
+    from django.conf import settings
+
+    return [_derive_key(secret, event_id) for secret in settings.SECRET_KEY_FALLBACKS]
+
+
+def _signature(key, event_id, ticket_number):
+    message = f'{event_id}.{ticket_number}'.encode()
+    return _b64(hmac.new(key.encode(), message, hashlib.sha256).digest()[:SIGNATURE_BYTES])
+
+
+def sign_ticket(event_id, ticket_number, key=None):
+    key = key or event_key(event_id)
+    return f'{PREFIX}.{event_id}.{ticket_number}.{_signature(key, event_id, ticket_number)}'
+
+
+def parse_payload(payload):
+    """Split a payload into (event_id, ticket_number, signature) without verifying it."""
+    parts = payload.strip().split('.')
+    if len(parts) != 4 or parts[0] != PREFIX or not parts[1].isdigit() or not parts[2]:
+        raise InvalidPayload(payload)
+    return int(parts[1]), parts[2], parts[3]
+
+
+class TicketVerifier:
+    """Check payloads for one event using only its key and revocation list."""
+
+    def __init__(self, event_id, key, revoked=(), fallback_keys=()):
+        self.event_id = int(event_id)
+        self.keys = [key, *fallback_keys]
+        self.revoked = frozenset(revoked)
+
+    def verify(self, payload):
+        """Return (status, ticket_number); ticket_number is None for unreadable payloads."""
+        try:
+            event_id, ticket_number, signature = parse_payload(payload)
+        except InvalidPayload:
+            return INVALID, None
+        if event_id != self.event_id:
+            return WRONG_EVENT, ticket_number
+        if not any(hmac.compare_digest(signature, _signature(key, event_id, ticket_number)) for key in self.keys):
+            return INVALID, ticket_number
+        if ticket_number in self.revoked:
+            return REVOKED, ticket_number
+        return VALID, ticket_number
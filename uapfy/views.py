@@ -5,7 +5,35 @@ from django.contrib import messages
 from .models import *
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
-from django.db.models import Q 
+from django.db.models import Q
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.http import require_POST
+from datetime import datetime, timedelta
+from functools import partial
+import hashlib
+import json
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from . import caching, checkin, exports, reviews, search
+from .capacity import SoldOutError, checkout_hold, purchase_hold
+from .images import store_upload
+from .issuance import issue_tickets
+from .pagination import cached_count, keyset_paginate
+from .qr import get_qr_png, qr_etag
+from .rollups import MAX_SERIES_POINTS, SERIES_BUCKETS, sales_series
+from .routers import reads_from_replica
+from .tasks import enqueue, queue_stats
+from .ticket_signing import event_fallback_keys, event_key
+
+
+QR_MAX_AGE = 60 * 60 * 24
+SALES_SERIES_MAX_AGE = 60
+CHECKIN_BATCH_LIMIT = 1000
 
 
 # Create your views here.
@@ -109,9 +137,13 @@ def dashboard(request):
 @login_required(login_url='login_organizer')
 def event_list(request):
     organizer = get_object_or_404(OrganizerProfile, user=request.user)
-    events = Event.objects.filter(organizer=organizer).order_by('-created_at')
+    events = Event.objects.filter(organizer=organizer).prefetch_related('categories').order_by('-created_at')
     return render(request, 'events/event_list.html', {'events': events})
 
+# Uploads are stored by content hash; resized variants follow in the background
+def _store_image(folder, upload):
+    return store_upload(folder, upload) if upload else None
+
 @login_required(login_url='login_organizer')
 def create_event(request):
     if request.method == 'POST':
@@ -125,7 +157,7 @@ def create_event(request):
         max_attendees = request.POST.get('max_attendees', 0)
         ticket_price = request.POST.get('ticket_price', 0.00)
         category_ids = request.POST.getlist('categories')
-        banner = request.FILES.get('banner')
+        banner = _store_image('event_banners', request.FILES.get('banner'))
 
         event = Event.objects.create(
             organizer=organizer,
@@ -141,6 +173,9 @@ def create_event(request):
         )
 
         event.categories.set(category_ids)
+        enqueue('update_event_status', {'event_id': event.id})
+        if banner:
+            enqueue('process_image', {'name': banner})
         messages.success(request, 'Event created successfully')
         return redirect('event_list')
 
@@ -162,13 +197,18 @@ def update_event(request, event_id):
         event.ticket_price = request.POST.get('ticket_price', event.ticket_price)
         event.status = request.POST.get('status', event.status)
 
-        if 'banner' in request.FILES:
-            event.banner = request.FILES['banner']
+        banner = _store_image('event_banners', request.FILES.get('banner'))
+        if banner:
+            event.banner = banner
+            event.banner_variants = {}
 
         category_ids = request.POST.getlist('categories')
         event.categories.set(category_ids)
 
         event.save()
+        enqueue('update_event_status', {'event_id': event.id})
+        if banner:
+            enqueue('process_image', {'name': banner})
         messages.success(request, 'Event updated successfully')
         return redirect('event_list')
 
@@ -184,52 +224,140 @@ def delete_event(request, event_id):
 
 
 # Event View  
-def event_view(request):
-    events = Event.objects.filter(is_active=True).order_by('-start_time')
+EVENTS_PER_PAGE = 12
+
+# Every ordering ends with the id so keyset pages have a stable position
+EVENT_SORT_ORDERINGS = {
+    'date_asc': ['start_time', 'id'],
+    'date_desc': ['-start_time', '-id'],
+    'price_low': ['ticket_price', 'id'],
+    'price_high': ['-ticket_price', '-id'],
+    'popular': ['-popularity', '-id'],
+    'rating': ['-average_rating', '-id'],
+}
+
+# Conditional GET
+#
+# Detail pages carry the user's navigation from base.html, so the ETag
+# covers the user as well as the content. Browsers must revalidate
+# (no-cache), which costs a 304 instead of a full page when nothing changed.
+def _page_etag(request, *parts):
+    raw = ':'.join(str(part) for part in (request.user.pk, *parts))
+    return quote_etag(hashlib.sha1(raw.encode()).hexdigest())
+
+def _set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+def _event_listing(params):
+    events = Event.objects.filter(is_active=True).prefetch_related('categories')
     
     # Search functionality - NEW
-    query = request.GET.get('q')
+    query = params.get('q')
+    ranked = False
     if query:
-        events = events.filter(
-            Q(title__icontains=query) |
-            Q(description__icontains=query) |
-            Q(location__icontains=query) |
-            Q(categories__name__icontains=query)
-        ).distinct()
+        matches = search.search_filter(query)
+        if matches is None:
+            events = events.filter(
+                Q(title__icontains=query) |
+                Q(description__icontains=query) |
+                Q(location__icontains=query) |
+                Q(categories__name__icontains=query)
+            ).distinct()
+        else:
+            # Filtered and counted in SQL with everything below
+            events = events.filter(matches)
+            ranked = True
     
     # Category filter - NEW
-    category = request.GET.get('category')
+    category = params.get('category')
     if category:
         events = events.filter(categories__name__icontains=category)
     
     # Date filter - NEW
-    date = request.GET.get('date')
+    date = params.get('date')
     if date:
         events = events.filter(start_time__date=date)
+
+    # Minimum average rating, on the stored average (see uapfy.reviews)
+    min_rating = params.get('min_rating')
+    if min_rating and min_rating.isdigit():
+        events = events.filter(average_rating__gte=int(min_rating))
     
     # Sort functionality - NEW
-    sort = request.GET.get('sort')
-    if sort == 'date_asc':
-        events = events.order_by('start_time')
-    elif sort == 'date_desc':
-        events = events.order_by('-start_time')
-    elif sort == 'price_low':
-        events = events.order_by('ticket_price')
-    elif sort == 'price_high':
-        events = events.order_by('-ticket_price')
-    elif sort == 'popular':
-        # You might want to implement popularity based on ticket sales
-        events = events.annotate(ticket_count=models.Count('ticket')).order_by('-ticket_count')
+    sort = params.get('sort')
+    if sort not in EVENT_SORT_ORDERINGS and ranked:
+        # Best match first
+        page = search.ranked_page(events, query, params.get('cursor'), EVENTS_PER_PAGE)
+    else:
+        # Keyset pagination, so deep pages cost the same as the first one
+        ordering = EVENT_SORT_ORDERINGS.get(sort, EVENT_SORT_ORDERINGS['date_desc'])
+        page = keyset_paginate(events, ordering, params.get('cursor'), EVENTS_PER_PAGE)
+    snippets = search.snippets(query, [event.id for event in page]) if ranked else {}
+    for event in page:
+        event.search_snippet = snippets.get(event.id)
+    return page, cached_count(events)
+
+def _render_card(event):
+    return render_to_string('events/_event_card.html', {'event': event})
+
+def _render_cards(events, versions):
+    keys = {}
+    for event in events:
+        key = f'card:{versions[event.id]}:{event.id}'
+        if event.search_snippet:
+            key += ':' + hashlib.sha1(event.search_snippet.encode()).hexdigest()
+        keys[event] = key
+    # One cache round trip for the whole page
+    cards = caching.get_or_set_many('card', {key: partial(_render_card, event) for event, key in keys.items()})
+    for event, key in keys.items():
+        event.card_html = cards[key]
+
+@reads_from_replica
+def event_view(request):
+    # Listing results are cached per set of query parameters and dropped
+    # when an event on the page changes, see uapfy.caching
+    page, total_count, versions = caching.get_listing(request.GET, lambda: _event_listing(request.GET))
+    _render_cards(page, versions)
+    next_page_query = None
+    if page.has_next:
+        params = request.GET.copy()
+        params['cursor'] = page.next_cursor
+        next_page_query = params.urlencode()
+    first_page_params = request.GET.copy()
+    first_page_params.pop('cursor', None)
     
     context = {
-        'events': events,
+        'events': page,
+        'total_count': total_count,
+        'next_page_query': next_page_query,
+        'first_page_query': first_page_params.urlencode(),
     }
     return render(request, 'events/events.html', context)
 
 @login_required(login_url='login')
 def eventdetail(request, event_id):
-    event = get_object_or_404(Event, id=event_id, is_active=True)
-    return render(request, 'events/event_detail.html', {'event': event})
+    version = caching.event_version(event_id)
+    event = caching.get_or_set('event', f'event:{version}:{event_id}', lambda: (
+        Event.objects.select_related('organizer__user').prefetch_related('categories')
+        .filter(id=event_id, is_active=True).first()
+    ))
+    if event is None:
+        raise Http404("No Event matches the given query.")
+
+    # Answered before the template renders when the client's copy is current
+    etag = _page_etag(request, 'event', event.pk, version, event.updated_at)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(event.updated_at.timestamp()))
+    if not_modified is not None:
+        return _set_validators(not_modified, etag, event.updated_at)
+    context = {
+        'event': event,
+        'event_cache_version': version,
+        'cache_timeout': caching.PAGE_CACHE_TIMEOUT,
+    }
+    return _set_validators(render(request, 'events/event_detail.html', context), etag, event.updated_at)
 
 @login_required(login_url='login')
 def buy_ticket(request, event_id):
@@ -238,59 +366,43 @@ def buy_ticket(request, event_id):
     if request.method == 'POST':
         quantity = int(request.POST.get('quantity', 1))
         
-        # Check if max attendees limit is reached
-        if event.max_attendees > 0:  # If there is a limit
-            current_ticket_count = Ticket.objects.filter(event=event).count()
-            if current_ticket_count + quantity > event.max_attendees:
-                messages.error(request, "Sorry, this event has limited capacity and cannot accommodate your request.")
-                return redirect('event_detail', event_id=event.id)
-        
-        # Create a new order
-        order = Order.objects.create(
-            user=request.user,
-            subtotal=event.ticket_price * quantity,
-            total=event.ticket_price * quantity,
-            billing_name=request.POST.get('billing_name'),
-            billing_email=request.POST.get('billing_email'),
-            billing_phone=request.POST.get('billing_phone'),
-            billing_address=request.POST.get('billing_address'),
-            payment_method=request.POST.get('payment_method', 'credit_card')
-        )
-        
-        # Create order item
-        OrderItem.objects.create(
-            order=order,
-            event=event,
-            quantity=quantity,
-            unit_price=event.ticket_price
-        )
-        
-        # Create tickets
-        for _ in range(quantity):
-            Ticket.objects.create(
-                user=request.user,
-                event=event,
-                order=order,
-                attendee_name=request.POST.get('attendee_name', request.user.get_full_name()),
-                attendee_email=request.POST.get('attendee_email', request.user.email),
-                attendee_phone=request.POST.get('attendee_phone', '')
-            )
-        
-        # Update order status
-        order.status = 'completed'
-        order.save()
+        # Reserve seats and create the order, order item and tickets in one transaction
+        billing = {
+            'billing_name': request.POST.get('billing_name'),
+            'billing_email': request.POST.get('billing_email'),
+            'billing_phone': request.POST.get('billing_phone'),
+            'billing_address': request.POST.get('billing_address'),
+            'payment_method': request.POST.get('payment_method', 'credit_card'),
+        }
+        attendee = {
+            'attendee_name': request.POST.get('attendee_name', request.user.get_full_name()),
+            'attendee_email': request.POST.get('attendee_email', request.user.email),
+            'attendee_phone': request.POST.get('attendee_phone', ''),
+        }
+        try:
+            # Seats held while the buyer filled in the form are confirmed, not taken twice
+            hold = purchase_hold(event, request.user, quantity)
+            order = issue_tickets(request.user, event, quantity, billing, attendee, hold=hold)
+        except SoldOutError:
+            messages.error(request, "Sorry, this event has limited capacity and cannot accommodate your request.")
+            return redirect('event_detail', event_id=event.id)
+
+        # The confirmation email is sent by the worker; QR images are rendered when first viewed
+        enqueue('send_order_confirmation', {'order_id': order.id}, key=f'confirmation:{order.order_number}')
         
         messages.success(request, "Ticket purchase successful!")
         return redirect('my_tickets')
         
+    # A seat is set aside for the checkout window, see uapfy.capacity
     context = {
         'event': event,
+        'hold': checkout_hold(event, request.user),
     }
     return render(request, 'ticket/buy_ticket.html', context)
 
 @login_required(login_url='login')
 def my_tickets(request):
-    tickets = Ticket.objects.filter(user=request.user).order_by('-purchased_at')
+    tickets = Ticket.objects.filter(user=request.user).select_related('event').order_by('-purchased_at')
     
     context = {
         'tickets': tickets
@@ -299,37 +411,175 @@ def my_tickets(request):
 
 @login_required(login_url='login')
 def ticket_detail(request, ticket_id):
-    ticket = get_object_or_404(Ticket, id=ticket_id, user=request.user)
+    ticket = get_object_or_404(Ticket.objects.select_related('event'), id=ticket_id, user=request.user)
+
+    # The page shows the ticket and its event, so either one changing is a new version
+    last_modified = max(ticket.updated_at, ticket.event.updated_at)
+    etag = _page_etag(request, 'ticket', ticket.pk, ticket.updated_at, ticket.event.updated_at)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+    if not_modified is not None:
+        return _set_validators(not_modified, etag, last_modified)
     
     context = {
         'ticket': ticket
     }
-    return render(request, 'ticket/ticket_detail.html', context)
+    return _set_validators(render(request, 'ticket/ticket_detail.html', context), etag, last_modified)
+
+@login_required(login_url='login')
+def ticket_qr(request, ticket_id):
+    ticket = get_object_or_404(Ticket.objects.only('qr_data', 'qr_code', 'qr_code_etag', 'updated_at'), id=ticket_id, user=request.user)
+
+    # The ETag is the payload digest, so revalidation needs no rendering
+    etag = quote_etag(qr_etag(ticket.qr_data))
+    response = get_conditional_response(request, etag=etag, last_modified=int(ticket.updated_at.timestamp()))
+    if response is None:
+        _, data = get_qr_png(ticket.qr_data, ticket.qr_code, ticket.qr_code_etag)
+        response = HttpResponse(data, content_type='image/png')
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(ticket.updated_at.timestamp())
+    patch_cache_control(response, private=True, max_age=QR_MAX_AGE)
+    return response
+
+
+
+# Reviews
+REVIEWS_PER_PAGE = 10
+
+# Follows review_event_created_idx (created_at DESC, then id)
+REVIEW_ORDERING = ['-created_at', 'id']
+
+def event_reviews(request, event_id):
+    event = get_object_or_404(Event.objects.select_related('organizer'), id=event_id, is_active=True)
+    page = keyset_paginate(
+        Review.objects.filter(event=event).select_related('user'), REVIEW_ORDERING, request.GET.get('cursor'), REVIEWS_PER_PAGE,
+    )
+    own_review = None
+    can_review = False
+    if request.user.is_authenticated:
+        own_review = Review.objects.filter(user=request.user, event=event).first()
+        can_review = reviews.can_review(request.user, event)
+
+    context = {
+        'event': event,
+        'reviews': page,
+        'next_page_query': f'cursor={page.next_cursor}' if page.has_next else None,
+        'own_review': own_review,
+        'can_review': can_review,
+        'ratings': reviews.RATINGS,
+    }
+    return render(request, 'events/event_reviews.html', context)
 
+@login_required(login_url='login')
+@require_POST
+def submit_review(request, event_id):
+    event = get_object_or_404(Event.objects.select_related('organizer'), id=event_id, is_active=True)
+    rating = request.POST.get('rating', '')
+    try:
+        _, created = reviews.save_review(
+            request.user, event, int(rating) if rating.isdigit() else None, request.POST.get('comment', '').strip(),
+        )
+    except reviews.ReviewNotAllowed:
+        messages.error(request, "Only attendees with a ticket can review this event.")
+    except ValueError as e:
+        messages.error(request, str(e))
+    else:
+        messages.success(request, "Thanks for your review!" if created else "Your review has been updated.")
+    return redirect('event_reviews', event_id=event.id)
+
+@login_required(login_url='login')
+@require_POST
+def delete_review(request, event_id):
+    event = get_object_or_404(Event, id=event_id, is_active=True)
+    if reviews.delete_review(request.user, event):
+        messages.success(request, "Your review has been deleted.")
+    return redirect('event_reviews', event_id=event.id)
 
 
+TICKETS_PER_PAGE = 25
 
+# Both follow the ticket_org_* indexes (purchased_at DESC, then id), forwards or backwards
+TICKET_SORT_ORDERINGS = {
+    'newest': ['-purchased_at', 'id'],
+    'oldest': ['purchased_at', '-id'],
+}
 
 @login_required(login_url='login_organizer')
 def organizer_tickets(request):
     organizer = request.user.organizerprofile
-    tickets = Ticket.objects.filter(event__organizer=organizer).select_related('event', 'user', 'order').order_by('-purchased_at')
+    events = list(Event.objects.filter(organizer=organizer).order_by('-created_at').only('id', 'title'))
+    # Ticket.organizer rather than event__organizer: the join would make every
+    # page sort all of the organizer's tickets. For one of their events the
+    # event alone scopes it, so the (event, ...) indexes apply.
+    tickets = Ticket.objects.filter(organizer=organizer)
+    if request.GET.get('event') in {str(event.id) for event in events}:
+        tickets = Ticket.objects.all()
+    tickets = exports.filter_tickets(tickets, request.GET)
+    ordering = TICKET_SORT_ORDERINGS.get(request.GET.get('sort'), TICKET_SORT_ORDERINGS['newest'])
+    page = keyset_paginate(tickets.select_related('event', 'user'), ordering, request.GET.get('cursor'), TICKETS_PER_PAGE)
+
+    # Keyset pages don't know their offset; the running position is passed along
+    start = 1
+    if not page.is_first and request.GET.get('start', '').isdigit():
+        start = int(request.GET['start'])
+    next_page_query = None
+    if page.has_next:
+        params = request.GET.copy()
+        params['cursor'] = page.next_cursor
+        params['start'] = start + len(page)
+        next_page_query = params.urlencode()
+    filter_params = request.GET.copy()
+    for name in ('cursor', 'start'):
+        filter_params.pop(name, None)
 
     context = {
-        'tickets': tickets,
+        'tickets': page,
+        'total_count': cached_count(tickets),
+        'first_index': start,
+        'last_index': start + len(page) - 1,
+        'next_page_query': next_page_query,
+        'first_page_query': filter_params.urlencode(),
+        'events': events,
+        'xlsx_available': exports.xlsx_available(),
     }
     return render(request, 'organizer/ticket_list.html', context)
 
 
+@login_required(login_url='login_organizer')
+def organizer_export(request, kind):
+    if kind not in exports.EXPORTS:
+        raise Http404("No such export.")
+    organizer = request.user.organizerprofile
+    headers, rows = exports.export_rows(kind, organizer, request.GET)
+    filename = f'{kind}-{timezone.localdate():%Y%m%d}'
+
+    if request.GET.get('format') == 'xlsx':
+        if not exports.xlsx_available():
+            raise Http404("XLSX export needs openpyxl installed.")
+        return FileResponse(exports.xlsx_file(headers, rows), as_attachment=True, filename=f'{filename}.xlsx')
+
+    # Written out as the rows arrive, a few thousand at a time
+    chunks = exports.csv_chunks(headers, rows)
+    if isinstance(request, ASGIRequest):
+        chunks = exports.aiterate(chunks)
+    response = StreamingHttpResponse(chunks, content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
 @login_required(login_url='login_organizer')
 def organizer_analytics(request):
     organizer = request.user.organizerprofile
     events = Event.objects.filter(organizer=organizer)
     total_events = events.count()
-    total_tickets = Ticket.objects.filter(event__organizer=organizer).count()
-    total_revenue = Ticket.objects.filter(event__organizer=organizer).aggregate(total=models.Sum('order__total'))['total'] or 0
+    # Totals come from the per-event sales rollups, not from every ticket
+    sales = EventSales.objects.filter(event__organizer=organizer).aggregate(
+        tickets=models.Sum('tickets_sold'),
+        revenue=models.Sum('revenue'),
+    )
+    total_tickets = sales['tickets'] or 0
+    total_revenue = sales['revenue'] or 0
 
-    recent_tickets = Ticket.objects.filter(event__organizer=organizer).order_by('-purchased_at')[:5]
+    recent_tickets = Ticket.objects.filter(event__organizer=organizer).select_related('event', 'user', 'order').order_by('-purchased_at')[:5]
 
     context = {
         'total_events': total_events,
@@ -339,6 +589,129 @@ def organizer_analytics(request):
     }
     return render(request, 'organizer/analytics.html', context)
 
+def _parse_moment(value, default):
+    if not value:
+        return default
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        moment = datetime.combine(day, datetime.min.time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+@login_required(login_url='login_organizer')
+def organizer_sales_series(request):
+    organizer = request.user.organizerprofile
+    bucket = request.GET.get('bucket', 'day')
+    event_id = request.GET.get('event')
+
+    # Default to the last 30 days up to the next whole minute, so repeated
+    # requests share a cache entry
+    now = timezone.now().replace(second=0, microsecond=0) + timedelta(minutes=1)
+    try:
+        end = _parse_moment(request.GET.get('end'), now)
+        start = _parse_moment(request.GET.get('start'), end - timedelta(days=30))
+    except ValueError:
+        return JsonResponse({'error': 'start and end must be ISO dates or datetimes.'}, status=400)
+    if bucket not in SERIES_BUCKETS:
+        return JsonResponse({'error': f"bucket must be one of {', '.join(SERIES_BUCKETS)}."}, status=400)
+    if start >= end:
+        return JsonResponse({'error': 'start must be before end.'}, status=400)
+    if (end - start) / SERIES_BUCKETS[bucket] > MAX_SERIES_POINTS:
+        return JsonResponse({'error': 'Range too large for this bucket; use a larger bucket.'}, status=400)
+    if event_id and not event_id.isdigit():
+        return JsonResponse({'error': 'event must be an event id.'}, status=400)
+
+    cache_key = f'sales-series:{organizer.pk}:{event_id}:{bucket}:{start.isoformat()}:{end.isoformat()}'
+    data = cache.get(cache_key)
+    if data is None:
+        events = Event.objects.filter(organizer=organizer)
+        if event_id:
+            events = events.filter(id=event_id)
+        series = sales_series(events, start, end, bucket)
+        titles = dict(events.filter(id__in=series).values_list('id', 'title'))
+        data = {
+            'bucket': bucket,
+            'start': start,
+            'end': end,
+            'events': [
+                {
+                    'id': series_event_id,
+                    'title': titles.get(series_event_id),
+                    'points': [{'t': t, 'tickets': tickets, 'revenue': revenue} for t, tickets, revenue in points],
+                }
+                for series_event_id, points in series.items()
+            ],
+        }
+        cache.set(cache_key, data, SALES_SERIES_MAX_AGE)
+
+    response = JsonResponse(data)
+    patch_cache_control(response, private=True, max_age=SALES_SERIES_MAX_AGE)
+    return response
+
+def _scan_request_data(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body)
+        except ValueError:
+            return None
+    return request.POST
+
+@require_POST
+@login_required(login_url='login_organizer')
+def checkin_scan(request, event_id):
+    event = get_object_or_404(Event.objects.only('id'), id=event_id, organizer__user=request.user)
+    data = _scan_request_data(request)
+    if not isinstance(data, dict) or not (data.get('payload') or data.get('ticket_number')):
+        return JsonResponse({'error': 'payload or ticket_number is required.'}, status=400)
+
+    if data.get('payload'):
+        result = checkin.scan_payload(data['payload'], event.id)
+    else:
+        result = checkin.scan(data['ticket_number'], event.id)
+    return JsonResponse(result.as_dict())
+
+@require_POST
+@login_required(login_url='login_organizer')
+def checkin_batch(request, event_id):
+    event = get_object_or_404(Event.objects.only('id'), id=event_id, organizer__user=request.user)
+    data = _scan_request_data(request)
+    scans = data.get('scans') if isinstance(data, dict) else None
+    if not isinstance(scans, list) or len(scans) > CHECKIN_BATCH_LIMIT:
+        return JsonResponse({'error': f'scans must be a list of at most {CHECKIN_BATCH_LIMIT} scans.'}, status=400)
+
+    parsed = []
+    for item in scans:
+        if not isinstance(item, dict) or not (item.get('payload') or item.get('ticket_number')):
+            return JsonResponse({'error': 'Every scan needs a payload or ticket_number.'}, status=400)
+        scanned_at = None
+        if item.get('scanned_at'):
+            try:
+                scanned_at = _parse_moment(item['scanned_at'], None)
+            except ValueError:
+                return JsonResponse({'error': 'scanned_at must be an ISO datetime.'}, status=400)
+        parsed.append((item.get('ticket_number'), item.get('payload'), scanned_at))
+
+    results = checkin.scan_batch(event.id, parsed)
+    return JsonResponse({'results': [result.as_dict() for result in results]})
+
+@login_required(login_url='login_organizer')
+def checkin_bundle(request, event_id):
+    # Everything an offline scanner needs to verify this event's QR payloads
+    event = get_object_or_404(Event.objects.only('id'), id=event_id, organizer__user=request.user)
+    response = JsonResponse({
+        'event_id': event.id,
+        'key': event_key(event.id),
+        'fallback_keys': event_fallback_keys(event.id),
+        'revoked': checkin.revoked_ticket_numbers(event.id),
+        'generated_at': timezone.now(),
+    })
+    patch_cache_control(response, private=True, no_store=True)
+    return response
+
 @login_required(login_url='login_organizer')
 def organizer_profile(request):
     organizer_profile = request.user.organizerprofile
@@ -348,7 +721,7 @@ def organizer_profile(request):
         organization_address = request.POST.get('organization_address')
         contact_number = request.POST.get('contact_number')
         description = request.POST.get('description')
-        logo = request.FILES.get('logo')  
+        logo = _store_image('organizer_logos', request.FILES.get('logo'))
 
         organizer_profile.organization_name = organization_name
         organizer_profile.organization_address = organization_address
@@ -357,8 +730,11 @@ def organizer_profile(request):
 
         if logo:
             organizer_profile.logo = logo 
+            organizer_profile.logo_variants = {}
 
         organizer_profile.save()
+        if logo:
+            enqueue('process_image', {'name': logo})
 
         return redirect('organizer_profile')  
 
@@ -392,3 +768,10 @@ def ContactUs(request):
     return render(request, 'contact.html')
 
 
+@staff_member_required
+def task_stats(request):
+    return JsonResponse(queue_stats())
+
+@staff_member_required
+def cache_stats(request):
+    return JsonResponse(caching.cache_stats())